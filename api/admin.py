@@ -1,9 +1,14 @@
 # api/admin.py
+from django.conf import settings
 from django.contrib import admin
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 from django.db.models import Count, Sum
-from .models import Device, FileList, FileItem, FileScanStats
+from .exports import CONTENT_TYPES, iter_bytes, iter_scans_export
+from .models import (
+    Device, FileList, FileItem, FileScanStats, DuplicateGroup, CommandFanOut, DeviceCommand, ExportJob
+)
 
 
 class FileItemInline(admin.TabularInline):
@@ -79,56 +84,6 @@ class FileListInline(admin.TabularInline):
         return False
 
 
-class DeviceFilesInline(admin.TabularInline):
-    """Affiche les fichiers récents directement dans l'appareil"""
-    model = FileItem
-    fields = ['name', 'file_type', 'size_formatted', 'scan_date', 'view_file_link']
-    readonly_fields = ['name', 'file_type', 'size_formatted', 'scan_date', 'view_file_link']
-    extra = 0
-    max_num = 10
-    can_delete = False
-    can_add = False
-    ordering = ['-file_list__created_at']
-    
-    def size_formatted(self, obj):
-        """Taille formatée"""
-        if obj.size_bytes < 1024:
-            return f"{obj.size_bytes} o"
-        elif obj.size_bytes < 1024**2:
-            return f"{obj.size_bytes/1024:.1f} Ko"
-        elif obj.size_bytes < 1024**3:
-            return f"{obj.size_bytes/1024**2:.1f} Mo"
-        else:
-            return f"{obj.size_bytes/1024**3:.2f} Go"
-    size_formatted.short_description = "Taille"
-    
-    def scan_date(self, obj):
-        """Date du scan"""
-        return obj.file_list.created_at.strftime('%d/%m/%Y %H:%M')
-    scan_date.short_description = "Date scan"
-    
-    def view_file_link(self, obj):
-        """Lien vers le détail du fichier"""
-        if obj.id:
-            url = reverse('admin:api_fileitem_change', args=[obj.id])
-            return format_html('<a href="{}">🔍 Voir</a>', url)
-        return "-"
-    view_file_link.short_description = "Actions"
-    
-    def get_queryset(self, request):
-        """Limiter aux 10 fichiers les plus récents"""
-        return super().get_queryset(request).select_related('file_list').order_by('-file_list__created_at')[:10]
-    
-    def has_add_permission(self, request, obj=None):
-        return False
-    
-    def has_change_permission(self, request, obj=None):
-        return False
-    
-    def has_delete_permission(self, request, obj=None):
-        return False
-
-
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
     """Administration des appareils - Version complète avec liens vers fichiers"""
@@ -224,7 +179,7 @@ class DeviceAdmin(admin.ModelAdmin):
         'request_file_list_action'
     ]
     
-    inlines = [FileListInline, DeviceFilesInline]  # Les deux inlines : scans et fichiers récents
+    inlines = [FileListInline]
     
     def get_readonly_fields(self, request, obj=None):
         if obj:
@@ -245,7 +200,7 @@ class DeviceAdmin(admin.ModelAdmin):
     last_seen_ago.admin_order_field = 'last_seen'
     
     def scans_count(self, obj):
-        count = obj.file_lists.count()
+        count = obj.file_lists_count
         if count > 0:
             url = reverse('admin:api_filelist_changelist') + f'?device__id__exact={obj.id}'
             return format_html('<a href="{}">{}</a>', url, count)
@@ -254,20 +209,15 @@ class DeviceAdmin(admin.ModelAdmin):
     scans_count.admin_order_field = 'file_lists_count'
     
     def files_count(self, obj):
-        """Nombre total de fichiers (tous scans confondus)"""
-        from django.db.models import Sum
-        result = FileItem.objects.filter(file_list__device=obj).aggregate(
-            total=Count('id'),
-            size=Sum('size_bytes')
-        )
-        count = result['total'] or 0
-        size_gb = (result['size'] or 0) / (1024**3)
-        return format_html('{}<br><small>{:.2f} Go</small>', count, size_gb)
+        """Nombre total de fichiers (tous scans confondus, annoté)"""
+        size_gb = obj.files_size / (1024**3)
+        return format_html('{}<br><small>{} Go</small>', obj.files_total, f'{size_gb:.2f}')
     files_count.short_description = "Fichiers"
+    files_count.admin_order_field = 'files_total'
     
     def storage_summary(self, obj):
         """Résumé du stockage"""
-        last_scan = obj.file_lists.filter(status='completed').first()
+        last_scan = obj.latest_completed_scan
         if not last_scan:
             return "Aucun scan disponible"
         
@@ -309,34 +259,42 @@ class DeviceAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
+        queryset = queryset.select_related('latest_completed_scan').annotate(
             file_lists_count=Count('file_lists', distinct=True)
         )
-        return queryset
+        return Device.with_file_totals(queryset)
     
     # Actions
     def activate_devices(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = Device.update_in_bulk(queryset, is_active=True)
         self.message_user(request, f"✅ {updated} appareil(s) activé(s).")
     activate_devices.short_description = "✅ Activer la sélection"
     
     def deactivate_devices(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = Device.update_in_bulk(queryset, is_active=False)
         self.message_user(request, f"❌ {updated} appareil(s) désactivé(s).")
     deactivate_devices.short_description = "❌ Désactiver la sélection"
     
     def mark_as_emulator(self, request, queryset):
-        updated = queryset.update(is_emulator=True)
+        updated = Device.update_in_bulk(queryset, is_emulator=True)
         self.message_user(request, f"🖥️ {updated} appareil(s) marqué(s) comme émulateur.")
     mark_as_emulator.short_description = "🖥️ Marquer comme émulateur"
     
     def request_file_list_action(self, request, queryset):
-        count = 0
-        for device in queryset:
-            if device.is_active:
-                # Logique d'envoi de commande à implémenter
-                count += 1
-        self.message_user(request, f"📱 Demande envoyée à {count} appareil(s).")
+        fanout = CommandFanOut.objects.create(
+            command='list_files',
+            params={},
+            filters={
+                'device_ids': list(queryset.values_list('id', flat=True)),
+                'is_active': True,
+            },
+        )
+        # Commandes insérées par le dispatcher (run_command_dispatcher), hors de la requête
+        url = reverse('admin:api_commandfanout_change', args=[fanout.id])
+        self.message_user(
+            request,
+            format_html('📱 Demande enregistrée pour la sélection (<a href="{}">diffusion #{}</a>).', url, fanout.id)
+        )
     request_file_list_action.short_description = "📱 Demander la liste des fichiers"
 
 
@@ -413,11 +371,13 @@ class FileListAdmin(admin.ModelAdmin):
     ]
     
     inlines = [FileItemInline]
-    actions = ['download_as_json']
+    actions = ['download_as_json', 'download_as_ndjson']
     
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        return queryset.select_related('device').prefetch_related('files')
+        # Nombre de fichiers annoté : prefetch_related('files') chargeait
+        # tous les fichiers de chaque scan de la page
+        return FileList.with_files_count(queryset.select_related('device'))
     
     def scan_id_short(self, obj):
         return obj.scan_id[:20] + '...' if len(obj.scan_id) > 20 else obj.scan_id
@@ -447,8 +407,9 @@ class FileListAdmin(admin.ModelAdmin):
     status_colored.short_description = "Statut"
     
     def file_count(self, obj):
-        return obj.files.count()
+        return obj.files_count
     file_count.short_description = "Fichiers"
+    file_count.admin_order_field = 'files_count'
     
     def total_size_display(self, obj):
         size = obj.total_size_bytes
@@ -507,9 +468,44 @@ class FileListAdmin(admin.ModelAdmin):
     view_files_link.short_description = "Actions"
     
     def download_as_json(self, request, queryset):
-        count = queryset.count()
-        self.message_user(request, f"📥 Export de {count} scan(s) demandé.")
+        return self.export_scans(request, queryset, 'json')
     download_as_json.short_description = "📥 Exporter en JSON"
+    
+    def download_as_ndjson(self, request, queryset):
+        return self.export_scans(request, queryset, 'ndjson')
+    download_as_ndjson.short_description = "📥 Exporter en NDJSON (une ligne par fichier)"
+    
+    def export_scans(self, request, queryset, export_format):
+        """
+        Téléchargement en flux, ou export en file (run_export_jobs) au-delà de ADMIN_EXPORT_SYNC_MAX_FILES
+        """
+        compress = getattr(settings, 'ADMIN_EXPORT_COMPRESS', True)
+        total_rows = queryset.aggregate(total=Sum('total_files'))['total'] or 0
+        
+        if total_rows > getattr(settings, 'ADMIN_EXPORT_SYNC_MAX_FILES', 200000):
+            job = ExportJob.objects.create(
+                scan_ids=list(queryset.values_list('id', flat=True)),
+                export_format=export_format,
+                compress=compress,
+                requested_by=request.user.get_username(),
+                total_rows=total_rows,
+            )
+            url = reverse('admin:api_exportjob_change', args=[job.id])
+            self.message_user(request, format_html(
+                '📥 Export de {} fichiers mis en file (worker run_export_jobs) : '
+                '<a href="{}">suivre l\'export #{}</a>',
+                total_rows, url, job.id
+            ))
+            return None
+        
+        chunks = iter_scans_export(queryset, export_format)
+        response = StreamingHttpResponse(
+            iter_bytes(chunks, compress),
+            content_type='application/gzip' if compress else CONTENT_TYPES[export_format]
+        )
+        filename = f"scans.{export_format}" + ('.gz' if compress else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 @admin.register(FileItem)
@@ -602,6 +598,7 @@ class FileScanStatsAdmin(admin.ModelAdmin):
     ]
     
     list_filter = ['created_at']
+    list_select_related = ['file_list__device']
     readonly_fields = [field.name for field in FileScanStats._meta.fields]
     
     def scan_device(self, obj):
@@ -621,4 +618,151 @@ class FileScanStatsAdmin(admin.ModelAdmin):
         return False
     
     def has_delete_permission(self, request, obj=None):
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(DuplicateGroup)
+class DuplicateGroupAdmin(admin.ModelAdmin):
+    """Groupes de doublons (calculés à l'upload, lecture seule)"""
+    
+    list_display = ['content_key', 'match', 'scan_device', 'copies', 'size_bytes', 'reclaimable_display']
+    list_filter = ['match']
+    search_fields = ['content_key', 'file_list__scan_id', 'file_list__device__android_id']
+    list_select_related = ['file_list__device']
+    ordering = ['-reclaimable_bytes']
+    readonly_fields = [field.name for field in DuplicateGroup._meta.fields]
+    
+    def scan_device(self, obj):
+        return str(obj.file_list.device)
+    scan_device.short_description = "Appareil"
+    
+    def reclaimable_display(self, obj):
+        return f"{obj.reclaimable_bytes / 1024**2:.1f} Mo"
+    reclaimable_display.short_description = "Récupérable"
+    reclaimable_display.admin_order_field = 'reclaimable_bytes'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class DeviceCommandInline(admin.TabularInline):
+    """Aperçu des commandes d'une diffusion"""
+    model = DeviceCommand
+    fields = ['command_id', 'device', 'status', 'created_at']
+    readonly_fields = ['command_id', 'device', 'status', 'created_at']
+    extra = 0
+    max_num = 20
+    can_delete = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('device')
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CommandFanOut)
+class CommandFanOutAdmin(admin.ModelAdmin):
+    """Administration des diffusions de commandes"""
+    
+    list_display = [
+        'id',
+        'command',
+        'status',
+        'progress_display',
+        'created_at',
+        'completed_at'
+    ]
+    
+    list_filter = ['status', 'command', 'created_at']
+    readonly_fields = [field.name for field in CommandFanOut._meta.fields]
+    inlines = [DeviceCommandInline]
+    
+    def progress_display(self, obj):
+        return f"{obj.queued_count}/{obj.total_targets}"
+    progress_display.short_description = "Progression"
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DeviceCommand)
+class DeviceCommandAdmin(admin.ModelAdmin):
+    """Administration de la file d'attente des commandes"""
+    
+    list_display = [
+        'command_id',
+        'command',
+        'device',
+        'status',
+        'priority',
+        'created_at'
+    ]
+    
+    list_filter = ['status', 'command', 'priority']
+    search_fields = ['command_id', 'device__android_id', 'device__model']
+    readonly_fields = [field.name for field in DeviceCommand._meta.fields]
+    list_select_related = ['device']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """Suivi des exports de scans en tâche de fond"""
+    
+    list_display = [
+        'id',
+        'export_format',
+        'status',
+        'progress_display',
+        'requested_by',
+        'created_at',
+        'download_link'
+    ]
+    
+    list_filter = ['status', 'export_format']
+    readonly_fields = [field.name for field in ExportJob._meta.fields] + ['progress_display', 'download_link']
+    
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='api_exportjob_download'
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def download_view(self, request, pk):
+        job = ExportJob.objects.filter(pk=pk, status='completed').first()
+        if not job or not job.file:
+            raise Http404("Export non disponible")
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename)
+    
+    def progress_display(self, obj):
+        return f"{obj.rows_written}/{obj.total_rows} ({obj.progress}%)"
+    progress_display.short_description = "Progression"
+    
+    def download_link(self, obj):
+        if obj.status != 'completed' or not obj.file:
+            return "-"
+        url = reverse('admin:api_exportjob_download', args=[obj.id])
+        return format_html('<a class="button" href="{}">📥 Télécharger</a>', url)
+    download_link.short_description = "Fichier"
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,209 @@
+# api/cache.py
+"""
+Cache versionné des réponses des lectures admin, et requêtes conditionnelles
+
+Chaque clé contient un numéro de version : celle de l'appareil pour les
+vues d'un appareil, celle de la flotte pour les vues globales. Invalider
+revient à incrémenter ce numéro (O(1), sans parcourir les clés) ; les
+anciennes entrées ne sont plus jamais lues et expirent d'elles-mêmes.
+
+Fonctionne avec n'importe quel backend du cache Django. Le cache locmem
+est propre à chaque processus : en production, utiliser un backend
+partagé pour que les invalidations atteignent tous les workers.
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+FLEET_SCOPE = 'fleet'
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def cache_timeout():
+    return getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+
+def version_key(scope):
+    return f'api:version:{scope}'
+
+
+def get_version(scope):
+    """
+    Version courante d'une portée ('fleet' ou 'device:<id>')
+
+    Une version perdue (éviction, redémarrage) repart d'une valeur basée
+    sur l'horloge : elle ne peut pas retomber sur une ancienne version.
+    """
+    cache = get_cache()
+    version = cache.get(version_key(scope))
+    if version is None:
+        cache.add(version_key(scope), time.time_ns(), timeout=None)
+        version = cache.get(version_key(scope))
+    return version
+
+
+def bump_version(scope):
+    cache = get_cache()
+    try:
+        cache.incr(version_key(scope))
+    except ValueError:
+        cache.set(version_key(scope), time.time_ns(), timeout=None)
+
+
+def bump_device_version(device_id):
+    """Invalide les réponses d'un appareil et les vues globales de la flotte"""
+    bump_version(f'device:{device_id}')
+    bump_version(FLEET_SCOPE)
+
+
+def invalidate_device(device_id):
+    """Invalidation après validation de la transaction en cours"""
+    transaction.on_commit(lambda: bump_device_version(device_id))
+
+
+def invalidate_devices(device_ids):
+    """invalidate_device pour une sélection (la flotte n'est incrémentée qu'une fois)"""
+    device_ids = list(device_ids)
+    
+    def bump():
+        for device_id in device_ids:
+            bump_version(f'device:{device_id}')
+        bump_version(FLEET_SCOPE)
+    
+    transaction.on_commit(bump)
+
+
+# ===== MÉTRIQUES =====
+
+_metrics_lock = threading.Lock()
+_metrics = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+
+def record(view, hit):
+    with _metrics_lock:
+        _metrics[view]['hits' if hit else 'misses'] += 1
+
+
+def cache_summary():
+    """Succès / échecs par vue (compteurs propres au processus)"""
+    with _metrics_lock:
+        snapshot = {view: dict(counts) for view, counts in _metrics.items()}
+    return {
+        view: {
+            **counts,
+            'hit_ratio': round(counts['hits'] / (counts['hits'] + counts['misses']), 3),
+        }
+        for view, counts in sorted(snapshot.items())
+    }
+
+
+def reset_cache_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+# ===== CACHE DES RÉPONSES =====
+
+def response_cache_key(view, request, scope):
+    version = get_version(scope)
+    # L'hôte fait partie de la clé : les liens de pagination sont absolus
+    digest = hashlib.md5(
+        f'{request.get_host()}{request.get_full_path()}'.encode()
+    ).hexdigest()
+    return f'api:response:{view}:{scope}:{version}:{digest}'
+
+
+def cached_response(scope='device'):
+    """
+    Met en cache les réponses 200 d'une action GET d'un ViewSet
+
+    - scope='device' : clé versionnée par l'appareil de l'URL (pk)
+    - scope='fleet'  : clé versionnée par la flotte entière
+
+    Les permissions sont vérifiées avant l'appel de l'action : une réponse
+    en cache n'est jamais servie à un utilisateur non autorisé.
+    """
+    def decorator(view_method):
+        view = view_method.__name__
+        
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_method(self, request, *args, **kwargs)
+            
+            if scope == 'device':
+                key_scope = f"device:{kwargs.get('pk')}"
+            else:
+                key_scope = FLEET_SCOPE
+            
+            cache = get_cache()
+            key = response_cache_key(view, request, key_scope)
+            data = cache.get(key)
+            if data is not None:
+                record(view, hit=True)
+                return Response(data)
+            
+            record(view, hit=False)
+            response = view_method(self, request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                cache.set(key, response.data, timeout=cache_timeout())
+            return response
+        
+        return wrapper
+    return decorator
+
+
+# ===== REQUÊTES CONDITIONNELLES (ETag / Last-Modified) =====
+
+def strong_etag(*parts):
+    """ETag fort calculé à partir des valeurs qui déterminent la réponse"""
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def conditional_response(validators):
+    """
+    Répond 304 aux GET dont la réponse n'a pas changé
+
+    `validators(viewset, request, **kwargs)` retourne (etag, last_modified)
+    à partir de requêtes légères (date de mise à jour, version), ou None si
+    la ressource est introuvable. Le 304 est décidé avant d'exécuter
+    l'action : ni serializer ni agrégat. Se place au-dessus de
+    cached_response.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            found = validators(self, request, **kwargs) if request.method in ('GET', 'HEAD') else None
+            if found is None:
+                return view_method(self, request, *args, **kwargs)
+            
+            etag, last_modified = found
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            
+            if etag:
+                response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            # Le client garde la réponse mais la revalide à chaque fois
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        
+        return wrapper
+    return decorator
@@ -0,0 +1,143 @@
+# api/compression.py
+"""
+Compression gzip négociée des réponses
+
+gzip (bibliothèque standard) est appliqué quand Accept-Encoding l'accepte
+(q > 0, ou « * »). Les réponses en flux (StreamingHttpResponse : exports,
+scan_diff) sont compressées morceau par morceau, sans être chargées en
+mémoire.
+
+Seules les données de l'API sont compressées : JSON, NDJSON et CSV. Les
+pages HTML (admin, API navigable) portent le jeton CSRF à côté de contenu
+reflété : compressées, elles seraient exposées à BREACH (longueur de la
+réponse compressée observée pour deviner le secret octet par octet). Pour
+la même raison, une requête émise depuis un autre site (Sec-Fetch-Site:
+cross-site, seul cas où un attaquant peut la provoquer avec les cookies de
+la victime) reçoit une réponse non compressée.
+
+Ne sont pas compressées non plus : les petites réponses
+(< COMPRESSION_MIN_SIZE), les réponses déjà encodées et les exports
+?gzip=true.
+"""
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+GZIP_LEVEL = 6
+
+# Types compressibles : données de l'API uniquement (pas de HTML, voir BREACH)
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(application/(json|x-ndjson|csv)|application/[\w.+-]+\+json|text/csv)\s*(;|$)'
+)
+
+
+class GzipCodec:
+    name = 'gzip'
+    
+    def __init__(self, level=GZIP_LEVEL):
+        self.level = level
+    
+    def compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+
+def parse_accept_encoding(header):
+    """{encodage: q} d'un en-tête Accept-Encoding"""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def negotiate(header, codecs):
+    """Encodage de plus forte qualité accepté par le client (préférence serveur en cas d'égalité)"""
+    accepted = parse_accept_encoding(header or '')
+    best, best_quality = None, 0.0
+    for codec in codecs:
+        quality = accepted.get(codec.name, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = codec, quality
+    return best
+
+
+def compress_bytes(codec, data):
+    compressor = codec.compressor()
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(codec, chunks):
+    compressor = codec.compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    Compression des réponses selon Accept-Encoding
+    
+    À placer en haut de MIDDLEWARE (juste après SecurityMiddleware) pour
+    compresser la réponse finale.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.codecs = [GzipCodec()]
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+    
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+    
+    def process_response(self, request, response):
+        if request.method == 'HEAD' or response.has_header('Content-Encoding'):
+            return response
+        if not COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        
+        # La réponse varie selon Accept-Encoding (et l'origine de la requête),
+        # même si ce client n'accepte rien
+        patch_vary_headers(response, ('Accept-Encoding', 'Sec-Fetch-Site'))
+        if request.META.get('HTTP_SEC_FETCH_SITE') == 'cross-site':
+            return response
+        
+        codec = negotiate(request.META.get('HTTP_ACCEPT_ENCODING'), self.codecs)
+        if codec is None:
+            return response
+        
+        if response.streaming:
+            if response.is_async:
+                return response
+            response.streaming_content = compress_stream(codec, response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed = compress_bytes(codec, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        
+        # Le contenu encodé n'est plus identique octet pour octet : ETag faible
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        
+        response['Content-Encoding'] = codec.name
+        return response
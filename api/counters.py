@@ -0,0 +1,197 @@
+# api/counters.py
+"""
+Compteurs de flotte maintenus par deltas (servis par DeviceViewSet.stats)
+
+Chaque appareil et chaque scan « contribue » à un ensemble de compteurs
+{(portée, clé): (nombre, taille)}. À chaque écriture, on calcule la
+contribution avant / après et on applique la différence aux lignes
+FleetCounter dans la même transaction. Les agrégats sur toute la table ne
+sont plus calculés que par reconcile_fleet_counters, pour corriger une
+éventuelle dérive.
+"""
+from collections import defaultdict
+
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+ROOTED_SCORE_THRESHOLD = 0.5
+
+# Champs de Device dont dépend sa contribution
+DEVICE_COUNTED_FIELDS = {'is_active', 'is_rooted_score', 'is_emulator', 'manufacturer', 'last_seen'}
+
+# Compteurs scalaires toujours présents (même à zéro)
+DEVICE_KEYS = ['total', 'active', 'rooted', 'emulators']
+SCAN_KEYS = ['total', 'completed']
+
+
+def seen_day(last_seen):
+    """Jour (fuseau du serveur) d'une date de dernière connexion"""
+    return timezone.localdate(last_seen).isoformat()
+
+
+def device_contributions(device):
+    """Compteurs auxquels un appareil contribue"""
+    contributions = {('devices', 'total'): (1, 0)}
+    if device.is_active:
+        contributions[('devices', 'active')] = (1, 0)
+    if (device.is_rooted_score or 0) > ROOTED_SCORE_THRESHOLD:
+        contributions[('devices', 'rooted')] = (1, 0)
+    if device.is_emulator:
+        contributions[('devices', 'emulators')] = (1, 0)
+    if device.manufacturer:
+        contributions[('manufacturer', device.manufacturer)] = (1, 0)
+    if device.last_seen:
+        contributions[('seen_day', seen_day(device.last_seen))] = (1, 0)
+    return contributions
+
+
+def selection_contributions(queryset, **values):
+    """
+    Contributions (avant, après) d'une sélection d'appareils pour un update(**values)
+
+    Une seule requête groupée par valeur des champs comptés : la
+    contribution « après » remplace dans chaque groupe les champs modifiés
+    par leur nouvelle valeur, sans charger les appareils.
+    """
+    rows = queryset.order_by().annotate(
+        day=TruncDate('last_seen'),
+        rooted=ExpressionWrapper(Q(is_rooted_score__gt=ROOTED_SCORE_THRESHOLD), output_field=BooleanField()),
+    ).values('is_active', 'rooted', 'is_emulator', 'manufacturer', 'day').annotate(count=Count('id'))
+
+    changes = {field: value for field, value in values.items() if field in DEVICE_COUNTED_FIELDS}
+    if 'is_rooted_score' in changes:
+        changes['rooted'] = (changes.pop('is_rooted_score') or 0) > ROOTED_SCORE_THRESHOLD
+    if 'last_seen' in changes:
+        last_seen = changes.pop('last_seen')
+        changes['day'] = seen_day(last_seen) if last_seen else None
+
+    before, after = [], []
+    for row in rows:
+        count = row.pop('count')
+        before.append(_group_contributions(row, count))
+        after.append(_group_contributions({**row, **changes}, count))
+    return total_contributions(before), total_contributions(after)
+
+
+def _group_contributions(group, count):
+    """device_contributions pour `count` appareils partageant les mêmes valeurs"""
+    contributions = {('devices', 'total'): (count, 0)}
+    if group['is_active']:
+        contributions[('devices', 'active')] = (count, 0)
+    if group['rooted']:
+        contributions[('devices', 'rooted')] = (count, 0)
+    if group['is_emulator']:
+        contributions[('devices', 'emulators')] = (count, 0)
+    if group['manufacturer']:
+        contributions[('manufacturer', group['manufacturer'])] = (count, 0)
+    if group['day']:
+        day = group['day']
+        contributions[('seen_day', day if isinstance(day, str) else day.isoformat())] = (count, 0)
+    return contributions
+
+
+def scan_contributions(file_list, with_files=True):
+    """
+    Compteurs auxquels un scan contribue
+
+    Les fichiers sont agrégés par type en une requête limitée au scan
+    (index file_list, file_type).
+    """
+    contributions = {('scans', 'total'): (1, 0)}
+    if file_list.status == 'completed':
+        contributions[('scans', 'completed')] = (1, 0)
+    if not with_files:
+        return contributions
+
+    totals = defaultdict(lambda: [0, 0])
+    rows = file_list.files.filter(is_directory=False).values('file_type').annotate(
+        count=Count('id'),
+        total_size=Sum('size_bytes'),
+    ).order_by()
+    for row in rows:
+        count, size = row['count'], row['total_size'] or 0
+        for key in [('file_type', row['file_type'] or 'other'), ('files', 'total'),
+                    ('device_files', str(file_list.device_id))]:
+            totals[key][0] += count
+            totals[key][1] += size
+
+    contributions.update((key, tuple(value)) for key, value in totals.items())
+    return contributions
+
+
+def counter_delta(before, after):
+    """Différence après - avant, sans les compteurs inchangés"""
+    delta = {}
+    for key in set(before) | set(after):
+        old_count, old_size = before.get(key, (0, 0))
+        new_count, new_size = after.get(key, (0, 0))
+        if (new_count - old_count) or (new_size - old_size):
+            delta[key] = (new_count - old_count, new_size - old_size)
+    return delta
+
+
+def total_contributions(contributions_list):
+    """Somme de plusieurs contributions (écritures en masse)"""
+    totals = defaultdict(lambda: [0, 0])
+    for contributions in contributions_list:
+        for key, (count, size) in contributions.items():
+            totals[key][0] += count
+            totals[key][1] += size
+    return {key: tuple(value) for key, value in totals.items()}
+
+
+def negate(contributions):
+    return {key: (-count, -size) for key, (count, size) in contributions.items()}
+
+
+def expected_counters(Device, FileList, FileItem):
+    """
+    Valeurs exactes recalculées depuis les tables (reconcile / migration)
+
+    Prend les modèles en paramètre pour pouvoir servir avec les modèles
+    historiques d'une migration.
+    """
+    expected = {}
+
+    devices = Device.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+        rooted=Count('id', filter=Q(is_rooted_score__gt=ROOTED_SCORE_THRESHOLD)),
+        emulators=Count('id', filter=Q(is_emulator=True)),
+    )
+    for key in DEVICE_KEYS:
+        expected[('devices', key)] = (devices[key], 0)
+
+    for row in Device.objects.exclude(manufacturer='').values('manufacturer').annotate(
+        count=Count('id')
+    ).order_by():
+        expected[('manufacturer', row['manufacturer'])] = (row['count'], 0)
+
+    for row in Device.objects.exclude(last_seen=None).annotate(
+        day=TruncDate('last_seen')
+    ).values('day').annotate(count=Count('id')).order_by():
+        expected[('seen_day', row['day'].isoformat())] = (row['count'], 0)
+
+    scans = FileList.objects.aggregate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed')),
+    )
+    for key in SCAN_KEYS:
+        expected[('scans', key)] = (scans[key], 0)
+
+    files = FileItem.objects.filter(is_directory=False)
+    total_count = total_size = 0
+    for row in files.values('file_type').annotate(count=Count('id'), total_size=Sum('size_bytes')).order_by():
+        size = row['total_size'] or 0
+        expected[('file_type', row['file_type'] or 'other')] = (row['count'], size)
+        total_count += row['count']
+        total_size += size
+    expected[('files', 'total')] = (total_count, total_size)
+
+    for row in files.values('file_list__device').annotate(
+        count=Count('id'), total_size=Sum('size_bytes')
+    ).order_by():
+        expected[('device_files', str(row['file_list__device']))] = (row['count'], row['total_size'] or 0)
+
+    return expected
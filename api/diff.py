@@ -0,0 +1,183 @@
+# api/diff.py
+"""
+Différence entre deux scans d'un même appareil
+
+Les deux scans sont lus en parallèle, triés par chemin, et fusionnés comme
+dans un merge-join : mémoire proportionnelle au nombre de changements, pas
+à la taille des scans. Les fichiers déplacés (même nom et même taille,
+chemin différent) sont appariés parmi les ajouts et suppressions mis en
+attente, par lots d'au plus DIFF_MAX_PENDING fichiers : la mémoire reste
+bornée, au prix de déplacements non détectés entre deux lots (comptés
+comme ajout + suppression, summary['moves_complete'] à False).
+
+Le tri par chemin est servi par l'index partiel api_fileitem_list_path_bin
+(migrations 0013 et 0020, WHERE NOT is_directory) : (file_list_id, path
+COLLATE "C") sur PostgreSQL, (file_list_id, path) en collation BINARY par
+défaut sur SQLite.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import connection
+from django.db.models.functions import Collate
+
+DIFF_CHUNK_SIZE = 5000
+DIFF_MAX_PENDING = 200000
+
+FileRow = namedtuple('FileRow', ['path', 'name', 'size_bytes', 'last_modified', 'file_type'])
+
+
+def path_collation():
+    """
+    Collation octet par octet : l'ordre SQL doit être celui des chaînes Python
+    """
+    return 'C' if connection.vendor == 'postgresql' else 'BINARY'
+
+
+def iter_scan_rows(file_list, chunk_size=DIFF_CHUNK_SIZE):
+    """Fichiers d'un scan triés par chemin (ordre binaire)"""
+    rows = file_list.files.filter(is_directory=False).order_by(
+        Collate('path', path_collation())
+    ).values_list(*FileRow._fields).iterator(chunk_size=chunk_size)
+    return (FileRow(*row) for row in rows)
+
+
+def ordered(rows):
+    """Vérifie au passage que le flux est bien trié par chemin"""
+    previous = None
+    for row in rows:
+        if previous is not None and row.path < previous:
+            raise ValueError("Les scans doivent être triés par chemin (ordre binaire)")
+        previous = row.path
+        yield row
+
+
+def merge_join(old_rows, new_rows):
+    """
+    Fusion de deux flux triés par chemin
+
+    Génère (statut, ancien, nouveau) pour chaque fichier ajouté, supprimé
+    ou modifié (taille ou date de modification).
+    """
+    old_rows, new_rows = ordered(old_rows), ordered(new_rows)
+    old, new = next(old_rows, None), next(new_rows, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old.path < new.path):
+            yield 'removed', old, None
+            old = next(old_rows, None)
+        elif old is None or new.path < old.path:
+            yield 'added', None, new
+            new = next(new_rows, None)
+        else:
+            if old.size_bytes != new.size_bytes or old.last_modified != new.last_modified:
+                yield 'modified', old, new
+            old, new = next(old_rows, None), next(new_rows, None)
+
+
+class ScanDiff:
+    """
+    Itérable des changements entre deux flux de fichiers, avec résumé
+
+    Les modifications sortent au fil de la fusion ; déplacements, ajouts et
+    suppressions sortent par lots, une fois les déplacements du lot appariés.
+    `summary` est complet une fois l'itération terminée.
+    """
+
+    def __init__(self, old_rows, new_rows, max_pending=DIFF_MAX_PENDING):
+        self.old_rows = old_rows
+        self.new_rows = new_rows
+        self.max_pending = max_pending
+        self.moves_complete = True
+        self.counts = defaultdict(int)
+        self.by_type = defaultdict(lambda: {'count_delta': 0, 'size_delta': 0})
+
+    @staticmethod
+    def move_key(row):
+        return row.name, row.size_bytes
+
+    def _account(self, row, sign):
+        delta = self.by_type[row.file_type or 'other']
+        delta['count_delta'] += sign
+        delta['size_delta'] += sign * (row.size_bytes or 0)
+
+    def __iter__(self):
+        removed = defaultdict(list)
+        added = []
+        pending = 0
+
+        for change, old, new in merge_join(self.old_rows, self.new_rows):
+            if change == 'modified':
+                self._account(old, -1)
+                self._account(new, 1)
+                self.counts['modified'] += 1
+                yield self.change('modified', old, new)
+                continue
+
+            if change == 'removed':
+                removed[self.move_key(old)].append(old)
+            else:
+                added.append(new)
+            pending += 1
+            if pending >= self.max_pending:
+                # Lot plein : appariement partiel, la suite repart d'un lot vide
+                self.moves_complete = False
+                yield from self._flush(added, removed)
+                removed, added, pending = defaultdict(list), [], 0
+
+        yield from self._flush(added, removed)
+
+    def _flush(self, added, removed):
+        """Apparie les déplacements d'un lot, puis sort ajouts et suppressions restants"""
+        for new in added:
+            candidates = removed.get(self.move_key(new))
+            if candidates:
+                old = candidates.pop()
+                self._account(old, -1)
+                self._account(new, 1)
+                self.counts['moved'] += 1
+                yield self.change('moved', old, new)
+            else:
+                self._account(new, 1)
+                self.counts['added'] += 1
+                yield self.change('added', None, new)
+
+        for candidates in removed.values():
+            for old in candidates:
+                self._account(old, -1)
+                self.counts['removed'] += 1
+                yield self.change('removed', old, None)
+
+    @staticmethod
+    def change(status, old, new):
+        row = new or old
+        change = {
+            'change': status,
+            'path': row.path,
+            'name': row.name,
+            'file_type': row.file_type,
+        }
+        if status == 'moved':
+            change['from_path'] = old.path
+        if old is not None:
+            change['old_size_bytes'] = old.size_bytes
+            change['old_last_modified'] = old.last_modified
+        if new is not None:
+            change['new_size_bytes'] = new.size_bytes
+            change['new_last_modified'] = new.last_modified
+        return change
+
+    @property
+    def summary(self):
+        return {
+            'added': self.counts['added'],
+            'removed': self.counts['removed'],
+            'modified': self.counts['modified'],
+            'moved': self.counts['moved'],
+            'moves_complete': self.moves_complete,
+            'size_delta': sum(delta['size_delta'] for delta in self.by_type.values()),
+            'by_type': {
+                file_type: delta
+                for file_type, delta in sorted(self.by_type.items())
+                if delta['count_delta'] or delta['size_delta']
+            },
+        }
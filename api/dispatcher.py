@@ -0,0 +1,283 @@
+# api/dispatcher.py
+"""
+Dispatcher des commandes programmées (DeviceCommand.schedule_at)
+
+Le dispatcher garde en mémoire un tas-min des commandes dont l'échéance
+tombe dans une fenêtre glissante (par défaut 5 minutes), chargé depuis la
+base via l'index (status, schedule_at). Il dort jusqu'à la prochaine
+échéance puis libère les commandes dues (status 'scheduled' → 'queued').
+
+- La table n'est jamais parcourue en entier : chargement par fenêtre,
+  puis rafraîchissement incrémental des seules commandes modifiées depuis
+  (updated_at >= dernier rafraîchissement - recouvrement). Le recouvrement
+  rattrape les transactions validées après coup (horodatées avant le
+  rafraîchissement mais invisibles à ce moment-là) ; les doublons sont
+  écartés par id. Une commande validée plus tard encore est reprise au
+  rechargement de la fenêtre suivante.
+- L'état vit en base : après un redémarrage, la première fenêtre inclut
+  les commandes en retard, libérées immédiatement.
+- La libération est idempotente (UPDATE ... WHERE status='scheduled'),
+  plusieurs dispatchers peuvent tourner sans double libération.
+- Les diffusions (CommandFanOut) créées par l'API ou l'admin sont
+  insérées ici, hors des requêtes web : une par itération au plus, la
+  libération des commandes échues n'attend pas la fin d'une grosse
+  diffusion plus d'une itération.
+- Une commande échue dont la clé de fusion est déjà en file pour
+  l'appareil passe au statut 'coalesced' au lieu d'être libérée ; le scan
+  d'un list_files ainsi fusionné est annulé.
+"""
+import heapq
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import Case, TextField, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_devices
+from .models import CommandFanOut, DeviceCommand, FileList
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledCommandDispatcher:
+    """
+    Libère les commandes programmées à l'heure dite
+    """
+    
+    def __init__(self, window_seconds=300, refresh_seconds=1.0, max_loaded=100000, release_batch_size=1000,
+                 overlap_seconds=30, fanout_stale_seconds=1800):
+        self.window = timedelta(seconds=window_seconds)
+        self.fanout_stale_after = timedelta(seconds=fanout_stale_seconds)
+        self.refresh_seconds = refresh_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.max_loaded = max_loaded
+        self.release_batch_size = release_batch_size
+        
+        self._heap = []            # (schedule_at, id)
+        self._loaded_ids = set()
+        self._window_end = None
+        self._last_refresh = None  # Début du dernier chargement / rafraîchissement
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self.released_count = 0
+        self.fanout_count = 0
+    
+    # ----- Chargement -----
+    
+    def load_window(self, now=None):
+        """
+        (Re)charge les commandes programmées avant la fin de la nouvelle fenêtre
+        """
+        now = now or timezone.now()
+        window_end = now + self.window
+        
+        rows = list(
+            DeviceCommand.objects.filter(
+                status='scheduled',
+                schedule_at__lt=window_end
+            ).order_by('schedule_at').values_list('schedule_at', 'id')[:self.max_loaded]
+        )
+        if len(rows) >= self.max_loaded:
+            # Fenêtre tronquée : elle s'arrête à la dernière échéance chargée
+            window_end = rows[-1][0]
+        
+        self._heap = rows
+        heapq.heapify(self._heap)
+        self._loaded_ids = {command_id for _, command_id in self._heap}
+        self._window_end = window_end
+        self._last_refresh = now
+        return len(self._heap)
+    
+    def refresh(self, now=None):
+        """
+        Ajoute les commandes programmées modifiées depuis le dernier
+        passage (avec recouvrement) dont l'échéance tombe dans la fenêtre
+        """
+        now = now or timezone.now()
+        rows = list(
+            DeviceCommand.objects.filter(
+                status='scheduled',
+                schedule_at__lt=self._window_end,
+                updated_at__gte=self._last_refresh - self.overlap
+            ).values_list('schedule_at', 'id')
+        )
+        added = 0
+        for row in rows:
+            added += self._push(*row)
+        self._last_refresh = now
+        return added
+    
+    def _push(self, schedule_at, command_id):
+        if command_id in self._loaded_ids:
+            return False
+        heapq.heappush(self._heap, (schedule_at, command_id))
+        self._loaded_ids.add(command_id)
+        return True
+    
+    # ----- Libération -----
+    
+    def release_due(self, now=None):
+        """
+        Libère toutes les commandes échues du tas
+        """
+        now = now or timezone.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, command_id = heapq.heappop(self._heap)
+            self._loaded_ids.discard(command_id)
+            due.append(command_id)
+        
+        released = 0
+        for start in range(0, len(due), self.release_batch_size):
+            released += self._release(due[start:start + self.release_batch_size], now)
+        
+        self.released_count += released
+        return released
+    
+    def _release(self, ids, now):
+        """
+        Passe les commandes en file ; celles dont la clé de fusion est déjà
+        en file pour l'appareil (ou en double dans le lot) sont fusionnées
+        
+        Le scan (FileList) d'un list_files fusionné ne recevra jamais
+        d'upload : il est annulé dans la même transaction, avec la
+        commande qui l'a absorbé.
+        """
+        rows = DeviceCommand.objects.filter(
+            id__in=ids,
+            status='scheduled'
+        ).order_by('schedule_at', 'id').values_list('id', 'command_id', 'device_id', 'coalesce_key')
+        
+        keyed = [(device_id, key) for _, _, device_id, key in rows if key]
+        survivors = {}             # (appareil, clé) → command_id de la commande en file
+        if keyed:
+            survivors = {
+                (device_id, key): command_id
+                for device_id, key, command_id in DeviceCommand.objects.filter(
+                    status='queued',
+                    device_id__in={device_id for device_id, _ in keyed},
+                    coalesce_key__in={key for _, key in keyed}
+                ).values_list('device_id', 'coalesce_key', 'command_id')
+            }
+        
+        to_release, to_coalesce = [], {}
+        for pk, command_id, device_id, key in rows:
+            if key and (device_id, key) in survivors:
+                to_coalesce[command_id] = (pk, survivors[(device_id, key)])
+                continue
+            if key:
+                survivors[(device_id, key)] = command_id
+            to_release.append(pk)
+        
+        with transaction.atomic():
+            if to_coalesce:
+                self._coalesce(to_coalesce, now)
+            return DeviceCommand.objects.filter(id__in=to_release, status='scheduled').update(
+                status='queued', updated_at=now
+            )
+    
+    def _coalesce(self, to_coalesce, now):
+        """
+        Fusionne les commandes échues ({command_id: (id, commande survivante)})
+        et annule les scans en attente qui leur sont liés
+        """
+        DeviceCommand.objects.filter(
+            id__in=[pk for pk, _ in to_coalesce.values()],
+            status='scheduled'
+        ).update(status='coalesced', updated_at=now)
+        
+        scans = FileList.objects.filter(
+            command_id__in=list(to_coalesce),
+            status__in=['pending', 'scanning']
+        )
+        device_ids = set(scans.values_list('device_id', flat=True))
+        if not device_ids:
+            return
+        # Statut non compté par FleetCounter (seul 'completed' l'est) : pas de delta
+        scans.update(
+            status='cancelled',
+            error_message=Case(*[
+                When(command_id=command_id, then=Value(f"Demande fusionnée avec la commande {survivor}"))
+                for command_id, (_, survivor) in to_coalesce.items()
+            ], default=Value(''), output_field=TextField()),
+            updated_at=now
+        )
+        invalidate_devices(device_ids)
+    
+    # ----- Diffusions -----
+    
+    def dispatch_fanout(self):
+        """
+        Insère les commandes de la plus ancienne diffusion en attente
+        Retourne la diffusion traitée, ou None s'il n'y en a aucune.
+        """
+        fanout = CommandFanOut.claim_next()
+        if fanout is None:
+            return None
+        try:
+            fanout.dispatch()
+        except Exception:
+            # Statut 'failed' et message déjà enregistrés par dispatch()
+            logger.exception("Diffusion #%s en échec", fanout.pk)
+        self.fanout_count += 1
+        return fanout
+    
+    def seconds_until_next(self, now=None):
+        """Délai avant la prochaine action (échéance, rafraîchissement ou fin de fenêtre)"""
+        now = now or timezone.now()
+        deadlines = [self._window_end, self._last_refresh + timedelta(seconds=self.refresh_seconds)]
+        if self._heap:
+            deadlines.append(self._heap[0][0])
+        return max((min(deadlines) - now).total_seconds(), 0)
+    
+    def tick(self):
+        """
+        Une itération : chargement/rafraîchissement, insertion d'une diffusion
+        en attente, puis libération des échues
+        """
+        now = timezone.now()
+        if self._window_end is None or now >= self._window_end:
+            self.load_window(now)
+            CommandFanOut.fail_stale(self.fanout_stale_after)
+        elif now >= self._last_refresh + timedelta(seconds=self.refresh_seconds):
+            self.refresh(now)
+        
+        fanout = self.dispatch_fanout()
+        if fanout is not None:
+            logger.info("Diffusion #%s : %s commande(s) insérée(s)", fanout.pk, fanout.queued_count)
+            # Commandes programmées de la diffusion : prises en compte tout de suite ;
+            # itération suivante sans attendre, d'autres diffusions peuvent suivre
+            self.refresh(timezone.now())
+            self._wakeup.set()
+        return self.release_due(timezone.now())
+    
+    # ----- Boucle -----
+    
+    def run_forever(self):
+        logger.info("Dispatcher des commandes programmées démarré")
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                released = self.tick()
+                if released:
+                    logger.info("%s commande(s) programmée(s) libérée(s)", released)
+            except Exception:
+                logger.exception("Erreur du dispatcher, nouvel essai")
+                self._window_end = None
+                self._stop.wait(1)
+                continue
+            self._wakeup.wait(timeout=self.seconds_until_next())
+            self._wakeup.clear()
+        logger.info("Dispatcher des commandes programmées arrêté")
+    
+    def start(self):
+        """Démarre le dispatcher dans un thread démon"""
+        thread = threading.Thread(target=self.run_forever, name='command-dispatcher', daemon=True)
+        thread.start()
+        return thread
+    
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
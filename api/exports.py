@@ -0,0 +1,203 @@
+# api/exports.py
+"""
+Exports en flux (CSV / NDJSON, gzip optionnel)
+
+Les lignes sont lues avec values_list().iterator(chunk_size) (curseur
+serveur sur PostgreSQL) et écrites au fil de l'eau dans la réponse :
+la mémoire reste constante quelle que soit la taille de l'export.
+"""
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Colonnes exportées : (nom de colonne, chemin ORM)
+DEVICE_EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('android_id', 'android_id'),
+    ('manufacturer', 'manufacturer'),
+    ('brand', 'brand'),
+    ('model', 'model'),
+    ('android_version', 'android_version'),
+    ('sdk_level', 'sdk_level'),
+    ('total_storage', 'total_storage'),
+    ('available_storage', 'available_storage'),
+    ('country', 'country'),
+    ('timezone', 'timezone'),
+    ('app_version', 'app_version'),
+    ('is_active', 'is_active'),
+    ('created_at', 'created_at'),
+    ('last_seen', 'last_seen'),
+]
+
+FILE_EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('android_id', 'file_list__device__android_id'),
+    ('scan_id', 'file_list__scan_id'),
+    ('path', 'path'),
+    ('name', 'name'),
+    ('extension', 'extension'),
+    ('file_type', 'file_type'),
+    ('mime_type', 'mime_type'),
+    ('size_bytes', 'size_bytes'),
+    ('last_modified', 'last_modified'),
+    ('is_hidden', 'is_hidden'),
+    ('is_directory', 'is_directory'),
+    ('md5_hash', 'md5_hash'),
+]
+
+# Export des scans (admin) : en-tête du scan + ses fichiers
+SCAN_EXPORT_FIELDS = [
+    ('scan_id', 'scan_id'),
+    ('android_id', 'device__android_id'),
+    ('status', 'status'),
+    ('scan_requested_at', 'scan_requested_at'),
+    ('scan_completed_at', 'scan_completed_at'),
+    ('total_files', 'total_files'),
+    ('total_size_bytes', 'total_size_bytes'),
+]
+
+SCAN_FILE_EXPORT_FIELDS = [
+    field for field in FILE_EXPORT_FIELDS
+    if field[0] not in ('android_id', 'scan_id')
+]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+class Echo:
+    """Pseudo-fichier : csv.writer retourne directement la ligne écrite"""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Tuples des colonnes `fields`, lus par paquets via un curseur"""
+    return queryset.values_list(*[path for _, path in fields]).iterator(chunk_size=chunk_size)
+
+
+def json_encoder():
+    return DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_csv(fields, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in fields])
+    buffer = []
+    for row in rows:
+        buffer.append(writer.writerow(row))
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def iter_ndjson(fields, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    names = [name for name, _ in fields]
+    encoder = json_encoder()
+    buffer = []
+    for row in rows:
+        buffer.append(encoder.encode(dict(zip(names, row))))
+        if len(buffer) >= chunk_size:
+            yield '\n'.join(buffer) + '\n'
+            buffer = []
+    if buffer:
+        yield '\n'.join(buffer) + '\n'
+
+
+def iter_gzip(chunks, level=6):
+    """Compresse un flux de chaînes en gzip, morceau par morceau"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_bytes(chunks, compress=False):
+    """Encode un flux de chaînes (UTF-8, gzip optionnel)"""
+    if compress:
+        return iter_gzip(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
+
+
+def iter_export(fields, rows, export_format='csv', compress=False):
+    """Flux d'octets d'un export"""
+    if export_format == 'ndjson':
+        chunks = iter_ndjson(fields, rows)
+    else:
+        chunks = iter_csv(fields, rows)
+    return iter_bytes(chunks, compress)
+
+
+def iter_scans_export(scans, export_format='json', progress=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Flux texte des scans `scans` et de leurs fichiers
+
+    - json   : [{"scan_id": ..., ..., "files": [{...}, ...]}, ...]
+    - ndjson : une ligne par fichier, préfixée du scan_id et de l'android_id
+
+    `progress(n)` est appelé après chaque paquet de n fichiers écrits.
+    """
+    from .models import FileItem
+
+    encoder = json_encoder()
+    scan_names = [name for name, _ in SCAN_EXPORT_FIELDS]
+    headers = list(scans.order_by('id').values_list('id', *[path for _, path in SCAN_EXPORT_FIELDS]))
+
+    if export_format == 'ndjson':
+        files = FileItem.objects.filter(file_list_id__in=[header[0] for header in headers]).order_by('id')
+        for chunk in iter_ndjson(FILE_EXPORT_FIELDS, iter_rows(files, FILE_EXPORT_FIELDS), chunk_size):
+            yield chunk
+            if progress:
+                progress(chunk.count('\n'))
+        return
+
+    file_names = [name for name, _ in SCAN_FILE_EXPORT_FIELDS]
+    yield '['
+    for index, (scan_pk, *values) in enumerate(headers):
+        header = encoder.encode(dict(zip(scan_names, values)))
+        yield (',' if index else '') + header[:-1] + ',"files":['
+
+        files = FileItem.objects.filter(file_list_id=scan_pk).order_by('id')
+        buffer = []
+        written = 0
+        for row in iter_rows(files, SCAN_FILE_EXPORT_FIELDS, chunk_size):
+            buffer.append(encoder.encode(dict(zip(file_names, row))))
+            if len(buffer) >= chunk_size:
+                yield (',' if written else '') + ','.join(buffer)
+                written += len(buffer)
+                if progress:
+                    progress(len(buffer))
+                buffer = []
+        if buffer:
+            yield (',' if written else '') + ','.join(buffer)
+            if progress:
+                progress(len(buffer))
+        yield ']}'
+    yield ']'
+
+
+def streaming_export_response(queryset, fields, filename, export_format='csv', compress=False):
+    """
+    StreamingHttpResponse d'un export (téléchargement en pièce jointe)
+    """
+    rows = iter_rows(queryset, fields)
+    response = StreamingHttpResponse(
+        iter_export(fields, rows, export_format, compress),
+        content_type='application/gzip' if compress else CONTENT_TYPES[export_format]
+    )
+    filename = f'{filename}.{export_format}' + ('.gz' if compress else '')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
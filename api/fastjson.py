@@ -0,0 +1,91 @@
+# api/fastjson.py
+"""
+Rendu et lecture JSON rapides pour DRF (orjson)
+
+FastJSONRenderer et FastJSONParser remplacent JSONRenderer / JSONParser
+dans REST_FRAMEWORK. Avec orjson, l'encodage et le décodage se font en
+code natif ; sans orjson (paquet absent), ils se rabattent sur les
+classes DRF d'origine.
+
+La sortie reste celle de DRF : datetime en ISO 8601 avec « Z » pour UTC,
+Decimal en nombre, chaînes paresseuses (gettext_lazy) résolues, séparateurs
+compacts, U+2028 / U+2029 échappés. Les types qu'orjson ne connaît pas
+passent par encoders.JSONEncoder.default, comme aujourd'hui. Les cas
+qu'orjson ne sait pas traiter (indentation demandée, entiers de plus de
+64 bits, réglages UNICODE_JSON / COMPACT_JSON modifiés) repassent par
+le chemin standard. Seule différence connue : à la lecture, orjson rend
+en float les entiers au-delà de 64 bits (aucun champ de l'API n'en porte).
+"""
+import codecs
+from io import BytesIO
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # optionnel : repli sur json de la bibliothèque standard
+    orjson = None
+
+# datetime / date / time passent par le JSONEncoder de DRF (« Z » au lieu
+# de « +00:00 ») ; clés non-str acceptées comme le fait json.dumps
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    | orjson.OPT_NON_STR_KEYS
+) if orjson else 0
+
+_default = encoders.JSONEncoder().default
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer encodé par orjson
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Entier hors 64 bits, profondeur excessive... : chemin standard
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Comme JSONRenderer : \u2028 et \u2029 toujours échappés
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    JSONParser décodé par orjson
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        body = stream.read() if stream is not None else b''
+
+        try:
+            if codecs.lookup(encoding).name != 'utf-8':
+                body = body.decode(encoding)
+            return orjson.loads(body)
+        except (orjson.JSONDecodeError, UnicodeDecodeError):
+            # Même message d'erreur (et mêmes tolérances) que JSONParser
+            return self._parse_stdlib(body, encoding)
+
+    def _parse_stdlib(self, body, encoding):
+        if isinstance(body, str):
+            body = body.encode(encoding)
+        return super().parse(BytesIO(body), parser_context={'encoding': encoding})
@@ -0,0 +1,108 @@
+# api/management/commands/bench_compression.py
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api import compression
+from api.exports import FILE_EXPORT_FIELDS, iter_rows
+from api.models import FileList
+
+# Dossiers typiques d'un stockage Android
+SAMPLE_FOLDERS = [
+    '/storage/emulated/0/DCIM/Camera',
+    '/storage/emulated/0/Pictures/Screenshots',
+    '/storage/emulated/0/Download',
+    '/storage/emulated/0/WhatsApp/Media/WhatsApp Images',
+    '/storage/emulated/0/WhatsApp/Media/WhatsApp Video',
+    '/storage/emulated/0/Android/data/com.spotify.music/files',
+    '/storage/emulated/0/Documents',
+    '/storage/emulated/0/Music',
+]
+SAMPLE_TYPES = [('jpg', 'image'), ('mp4', 'video'), ('pdf', 'document'), ('mp3', 'audio'), ('apk', 'apk')]
+
+
+class Command(BaseCommand):
+    help = "Mesure la taille transmise et le coût CPU de chaque encodage sur des réponses de scan"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--scan-id', help="Scan réel à encoder (par défaut : scan synthétique)")
+        parser.add_argument('--files', type=int, default=10000,
+                            help="Nombre de fichiers du scan synthétique (défaut 10000)")
+        parser.add_argument('--repeat', type=int, default=5, help="Mesures par encodage (médiane)")
+        parser.add_argument('--json', action='store_true', help="Résultats en JSON")
+    
+    def handle(self, *args, **options):
+        payload = self.build_payload(options)
+        results = []
+        for codec in self.codecs():
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                compressed = compression.compress_bytes(codec, payload)
+                timings.append(time.perf_counter() - start)
+            seconds = statistics.median(timings)
+            results.append({
+                'encoding': codec.name,
+                'level': codec.level,
+                'bytes': len(compressed),
+                'ratio': round(len(payload) / len(compressed), 2),
+                'cpu_ms': round(seconds * 1000, 2),
+                'mb_per_s': round(len(payload) / seconds / 1024 ** 2, 1),
+            })
+        
+        if options['json']:
+            self.stdout.write(json.dumps({'identity_bytes': len(payload), 'results': results}, indent=2))
+            return
+        
+        self.stdout.write(f"Réponse non compressée : {len(payload):,} octets")
+        self.stdout.write(f"{'encodage':<10}{'niveau':>7}{'octets':>14}{'ratio':>8}{'cpu ms':>10}{'Mo/s':>9}")
+        for result in results:
+            self.stdout.write(
+                f"{result['encoding']:<10}{result['level']!s:>7}{result['bytes']:>14,}"
+                f"{result['ratio']:>8}{result['cpu_ms']:>10}{result['mb_per_s']:>9}"
+            )
+    
+    def codecs(self):
+        """Niveau par défaut du middleware, plus les extrêmes pour comparaison"""
+        return [compression.GzipCodec(level) for level in (1, compression.GZIP_LEVEL, 9)]
+    
+    def build_payload(self, options):
+        names = [name for name, _ in FILE_EXPORT_FIELDS]
+        if options['scan_id']:
+            file_list = FileList.objects.filter(scan_id=options['scan_id']).first()
+            if not file_list:
+                raise CommandError(f"Scan {options['scan_id']} introuvable")
+            files = [dict(zip(names, row)) for row in iter_rows(file_list.files.order_by('-size_bytes'), FILE_EXPORT_FIELDS)]
+        else:
+            files = self.synthetic_files(options['files'])
+        
+        # Même forme qu'une page de file_scan_items
+        return JSONRenderer().render({'scan_id': 'bench', 'total_files': len(files), 'files': files})
+    
+    def synthetic_files(self, count):
+        rng = random.Random(42)
+        files = []
+        for index in range(count):
+            folder = rng.choice(SAMPLE_FOLDERS)
+            extension, file_type = rng.choice(SAMPLE_TYPES)
+            name = f"IMG_2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}_{index:06d}.{extension}"
+            files.append({
+                'id': index + 1,
+                'android_id': 'a1b2c3d4e5f60718',
+                'scan_id': 'scan_bench',
+                'path': f'{folder}/{name}',
+                'name': name,
+                'extension': extension,
+                'file_type': file_type,
+                'mime_type': f'{file_type}/{extension}',
+                'size_bytes': rng.randint(1_000, 50_000_000),
+                'last_modified': 1700000000000 + rng.randint(0, 10 ** 10),
+                'is_hidden': False,
+                'is_directory': False,
+                'md5_hash': '',
+            })
+        return files
@@ -0,0 +1,250 @@
+# api/management/commands/bench_endpoints.py
+import json
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from api.cache import get_cache
+from api.management.commands.bench_compression import SAMPLE_FOLDERS, SAMPLE_TYPES
+from api.models import Device
+
+BENCHMARKS = ['register_new', 'register_existing', 'heartbeat', 'upload_file_list',
+              'file_stats', 'search_files', 'stats']
+DEFAULT_SIZES = '1000,10000,50000,200000'
+
+
+class Command(BaseCommand):
+    help = (
+        "Débit et latences (p50/p95/p99) des endpoints chauds, dans une base de test jetable "
+        "(SQLite, ou PostgreSQL via DATABASE_URL) ; --output / --compare pour suivre les régressions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Appels par endpoint (hors upload_file_list, défaut 200)")
+        parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help=f"Tailles d'upload_file_list en fichiers (défaut {DEFAULT_SIZES})")
+        parser.add_argument('--uploads', type=int, default=3, help="Uploads par taille (défaut 3)")
+        parser.add_argument('--only', help=f"Sous-ensemble séparé par des virgules : {', '.join(BENCHMARKS)}")
+        parser.add_argument('--output', help="Fichier JSON où écrire les résultats")
+        parser.add_argument('--compare', help="Résultats JSON de référence (un --output précédent)")
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help="Régression signalée au-delà de +N %% sur p50 ou p95 (défaut 10)")
+
+    def handle(self, *args, **options):
+        only = set(options['only'].split(',')) if options['only'] else set(BENCHMARKS)
+        unknown = only - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Benchmarks inconnus : {', '.join(sorted(unknown))}")
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size]
+        except ValueError:
+            raise CommandError("--sizes attend des entiers séparés par des virgules")
+        baseline = self.load(options['compare']) if options['compare'] else None
+
+        # Base de test créée puis détruite : la base de l'application n'est jamais touchée
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(DEVICE_RATE_LIMITS={}, SECURE_SSL_REDIRECT=False):
+                results = self.run_benchmarks(only, sizes, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {'meta': self.meta(options), 'results': results}
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Résultats écrits dans {options['output']}")
+
+        if baseline is not None:
+            regressions = self.compare(baseline, results, options['threshold'])
+            if regressions:
+                raise CommandError(f"{len(regressions)} régression(s) au-delà de +{options['threshold']} %")
+            self.stdout.write(self.style.SUCCESS(f"Aucune régression au-delà de +{options['threshold']} %"))
+
+    # ===== SCÉNARIOS =====
+
+    def run_benchmarks(self, only, sizes, options):
+        count = options['requests']
+        results = {}
+        public = Client()
+        admin = Client()
+        admin.force_login(get_user_model().objects.create_superuser('bench', 'bench@example.com', 'bench'))
+
+        if 'register_new' in only:
+            results['register_new'] = self.timed(
+                lambda i: public.post('/api/devices/register/', self.device_payload(f'bench-new-{i}'),
+                                      content_type='application/json'), count)
+
+        # Appareils de référence pour les autres scénarios
+        for index in range(count):
+            Device.objects.get_or_create(android_id=f'bench-{index}', defaults={
+                'model': 'Pixel 8', 'manufacturer': 'Google', 'android_version': '14',
+            })
+
+        if 'register_existing' in only:
+            results['register_existing'] = self.timed(
+                lambda i: public.post('/api/devices/register/', self.device_payload(f'bench-{i}'),
+                                      content_type='application/json'), count)
+
+        if 'heartbeat' in only:
+            results['heartbeat'] = self.timed(
+                lambda i: public.post('/api/devices/heartbeat/', {
+                    'androidId': f'bench-{i % count}', 'battery_level': i % 100, 'network_type': 'wifi',
+                }, content_type='application/json'), count)
+
+        uploaded = []
+        if 'upload_file_list' in only or only & {'file_stats', 'search_files'}:
+            upload_sizes = sizes if 'upload_file_list' in only else sizes[:1]
+            for size in upload_sizes:
+                uploads = options['uploads'] if 'upload_file_list' in only else 1
+                bodies = [json.dumps(self.upload_payload(f'bench-{i % count}', f'bench-{size}-{i}', size, seed=i))
+                          for i in range(uploads)]
+                timing = self.timed(
+                    lambda i: public.post('/api/devices/upload_file_list/', bodies[i],
+                                          content_type='application/json'), uploads)
+                timing['files_per_s'] = round(size * timing['throughput_rps'], 1)
+                if 'upload_file_list' in only:
+                    results[f'upload_file_list_{size}'] = timing
+                uploaded.append(Device.objects.get(android_id=f'bench-{(uploads - 1) % count}').pk)
+
+        # Lectures admin mesurées sans le cache des réponses (chemin réel)
+        if 'file_stats' in only and uploaded:
+            device = uploaded[-1]
+            results['file_stats'] = self.timed(
+                lambda i: admin.get(f'/api/devices/{device}/file_stats/'), count, clear_cache=True)
+        if 'search_files' in only and uploaded:
+            results['search_files'] = self.timed(
+                lambda i: admin.get('/api/devices/search_files/?query=IMG&limit=100'), count, clear_cache=True)
+        if 'stats' in only:
+            results['stats'] = self.timed(lambda i: admin.get('/api/devices/stats/'), count, clear_cache=True)
+        return results
+
+    def timed(self, call, count, clear_cache=False):
+        """Appelle call(i) count fois : débit et percentiles de latence (ms)"""
+        timings = []
+        for index in range(count):
+            if clear_cache:
+                get_cache().clear()
+            start = time.perf_counter()
+            response = call(index)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f"{response.request['PATH_INFO']} : HTTP {response.status_code} "
+                                   f"{response.content[:200]!r}")
+
+        timings.sort()
+
+        def percentile(p):
+            return round(timings[min(len(timings) - 1, int(len(timings) * p / 100))], 3)
+
+        return {
+            'requests': count,
+            'throughput_rps': round(count / (sum(timings) / 1000), 2),
+            'mean_ms': round(sum(timings) / count, 3),
+            'min_ms': round(timings[0], 3),
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'max_ms': round(timings[-1], 3),
+        }
+
+    def device_payload(self, android_id):
+        return {
+            'androidId': android_id, 'model': 'Pixel 8', 'manufacturer': 'Google', 'brand': 'google',
+            'android_version': '14', 'sdk_level': 34, 'total_ram': 8 * 1024 ** 3,
+            'total_storage': 128 * 1024 ** 3, 'battery_level': 80, 'language': 'fr', 'timezone': 'Europe/Paris',
+        }
+
+    def upload_payload(self, android_id, scan_id, size, seed=0):
+        rng = random.Random(seed)
+        now = int(time.time() * 1000)
+        files = []
+        for index in range(size):
+            folder = rng.choice(SAMPLE_FOLDERS)
+            extension, file_type = rng.choice(SAMPLE_TYPES)
+            name = f"IMG_2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}_{index:06d}.{extension}"
+            files.append({
+                'path': f'{folder}/{name}',
+                'parent_path': folder,
+                'name': name,
+                'extension': extension,
+                'file_type': file_type,
+                'mime_type': f'{file_type}/{extension}',
+                'size_bytes': rng.randint(1_000, 50_000_000),
+                'last_modified': 1700000000000 + rng.randint(0, 10 ** 10),
+                'md5_hash': f'{rng.getrandbits(128):032x}',
+            })
+        return {
+            'androidId': android_id, 'scan_id': scan_id, 'status': 'completed',
+            'scan_started_at': now - 60000, 'scan_completed_at': now, 'scan_duration_ms': 60000,
+            'total_files': size, 'total_size_bytes': sum(f['size_bytes'] for f in files), 'files': files,
+        }
+
+    # ===== RÉSULTATS =====
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                    text=True, timeout=5).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            commit = ''
+        return {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'machine': platform.machine(),
+            'requests': options['requests'],
+            'uploads': options['uploads'],
+        }
+
+    def load(self, path):
+        try:
+            with open(path) as baseline:
+                return json.load(baseline)['results']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Référence illisible ({path}) : {exc}")
+
+    def print_results(self, results):
+        self.stdout.write(f"{'endpoint':<28}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28}{result['throughput_rps']:>10}{result['p50_ms']:>10}"
+                f"{result['p95_ms']:>10}{result['p99_ms']:>10}{result['max_ms']:>10}"
+            )
+
+    def compare(self, baseline, results, threshold):
+        """Écarts p50 / p95 par rapport à la référence ; retourne les régressions"""
+        regressions = []
+        self.stdout.write(f"\n{'endpoint':<28}{'p50 ref':>10}{'p50':>10}{'écart':>9}{'p95 ref':>10}{'p95':>10}{'écart':>9}")
+        for name, result in results.items():
+            reference = baseline.get(name)
+            if reference is None:
+                self.stdout.write(f"{name:<28}  (absent de la référence)")
+                continue
+            line = f"{name:<28}"
+            regressed = False
+            for key in ('p50_ms', 'p95_ms'):
+                delta = (result[key] - reference[key]) / reference[key] * 100 if reference[key] else 0.0
+                regressed = regressed or delta > threshold
+                line += f"{reference[key]:>10}{result[key]:>10}{delta:>+8.1f}%"
+            if regressed:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line + '  ← régression'))
+            else:
+                self.stdout.write(line)
+        return regressions
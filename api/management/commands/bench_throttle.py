@@ -0,0 +1,80 @@
+# api/management/commands/bench_throttle.py
+import json
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.throttling import DeviceRateThrottle
+
+
+class Command(BaseCommand):
+    help = (
+        "Surcoût de DeviceRateThrottle (quotas IP + android_id) sur le chemin du heartbeat, "
+        "mesuré sur le cache configuré (DEVICE_RATE_LIMIT_CACHE)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000, help="Requêtes mesurées (défaut 5000)")
+        parser.add_argument('--devices', type=int, default=500, help="android_id distincts (défaut 500)")
+        parser.add_argument('--cache', help="Alias de cache à mesurer (défaut : DEVICE_RATE_LIMIT_CACHE)")
+        parser.add_argument('--max-median-us', type=float,
+                            help="Échoue si la médiane dépasse N µs (suivi des régressions)")
+        parser.add_argument('--json', action='store_true', help="Résultats en JSON")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['devices'] < 1:
+            raise CommandError("--iterations et --devices doivent être positifs")
+
+        alias = options['cache'] or getattr(settings, 'DEVICE_RATE_LIMIT_CACHE', 'default')
+        # Quotas inatteignables, clés propres à cette exécution (elles expirent d'elles-mêmes)
+        limits = {'heartbeat': {'android_id': '1000000/min', 'ip': '1000000/min'}}
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+
+        factory = APIRequestFactory()
+        view = type('View', (), {'action': 'heartbeat'})()
+        requests = []
+        for index in range(options['iterations']):
+            request = Request(
+                factory.post('/api/devices/heartbeat/', {'androidId': f'{prefix}-{index % options["devices"]}'},
+                             format='json'),
+                parsers=[JSONParser()]
+            )
+            request.data  # Corps déjà lu par la vue dans tous les cas
+            requests.append(request)
+
+        timings = []
+        with override_settings(DEVICE_RATE_LIMITS=limits, DEVICE_RATE_LIMIT_CACHE=alias):
+            for request in requests:
+                start = time.perf_counter()
+                allowed = DeviceRateThrottle().allow_request(request, view)
+                timings.append((time.perf_counter() - start) * 1e6)
+                if not allowed:
+                    raise CommandError("Requête refusée : quotas de mesure atteints")
+
+        timings.sort()
+        results = {
+            'cache': alias,
+            'iterations': len(timings),
+            'median_us': round(statistics.median(timings), 1),
+            'p95_us': round(timings[int(len(timings) * 0.95)], 1),
+            'p99_us': round(timings[int(len(timings) * 0.99)], 1),
+            'max_us': round(timings[-1], 1),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(
+                f"DeviceRateThrottle heartbeat ({alias}) : médiane {results['median_us']} µs, "
+                f"p95 {results['p95_us']} µs, p99 {results['p99_us']} µs, max {results['max_us']} µs"
+            )
+
+        if options['max_median_us'] is not None and results['median_us'] > options['max_median_us']:
+            raise CommandError(f"Médiane {results['median_us']} µs au-delà de {options['max_median_us']} µs")
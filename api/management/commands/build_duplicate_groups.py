@@ -0,0 +1,31 @@
+# api/management/commands/build_duplicate_groups.py
+from django.core.management.base import BaseCommand
+
+from api.models import Device, DuplicateGroup, FileList
+
+
+class Command(BaseCommand):
+    help = "(Re)construit les groupes de doublons (scans antérieurs à leur calcul à l'upload)"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--all-scans', action='store_true',
+                            help="Tous les scans (par défaut : dernier scan complété de chaque appareil)")
+        parser.add_argument('--scan-id', help="Un seul scan")
+    
+    def handle(self, *args, **options):
+        scans = FileList.objects.all()
+        if options['scan_id']:
+            scans = scans.filter(scan_id=options['scan_id'])
+        elif not options['all_scans']:
+            scans = scans.filter(
+                id__in=Device.objects.filter(
+                    latest_completed_scan__isnull=False
+                ).values('latest_completed_scan')
+            )
+        
+        built = 0
+        for file_list in scans.order_by('id').iterator():
+            groups = DuplicateGroup.build_for_file_list(file_list)
+            built += 1
+            self.stdout.write(f"{file_list.scan_id} : {groups} groupe(s)")
+        self.stdout.write(self.style.SUCCESS(f"{built} scan(s) traité(s)"))
@@ -0,0 +1,20 @@
+# api/management/commands/reconcile_fleet_counters.py
+from django.core.management.base import BaseCommand
+
+from api.models import FleetCounter
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de flotte depuis les tables et corrige la dérive"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Affiche la dérive sans corriger les compteurs")
+    
+    def handle(self, *args, **options):
+        drift = FleetCounter.reconcile(dry_run=options['dry_run'])
+        for (scope, key), (stored, expected) in sorted(drift.items()):
+            self.stdout.write(f"{scope}:{key} {stored} -> {expected}")
+        
+        action = "à corriger" if options['dry_run'] else "corrigé(s)"
+        self.stdout.write(self.style.SUCCESS(f"{len(drift)} compteur(s) {action}"))
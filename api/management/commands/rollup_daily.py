@@ -0,0 +1,28 @@
+# api/management/commands/rollup_daily.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import DailyRollup
+
+
+class Command(BaseCommand):
+    help = "Calcule les agrégats journaliers de la flotte (à planifier chaque soir, avant minuit)"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Jour à calculer (AAAA-MM-JJ, défaut : aujourd'hui)")
+        parser.add_argument('--backfill', type=int, default=0,
+                            help="Recalcule aussi les N jours précédents (métriques reconstructibles)")
+    
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError("Date invalide, format attendu : AAAA-MM-JJ")
+        
+        for offset in range(options['backfill'], -1, -1):
+            current = day - timedelta(days=offset)
+            rows = DailyRollup.build_for_day(current)
+            self.stdout.write(f"{current} : {rows} ligne(s)")
+        self.stdout.write(self.style.SUCCESS("Agrégats journaliers à jour"))
@@ -0,0 +1,40 @@
+# api/management/commands/run_command_dispatcher.py
+from django.core.management.base import BaseCommand
+
+from api.dispatcher import ScheduledCommandDispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Libère les commandes programmées (schedule_at) dans la file des appareils "
+        "et insère les diffusions (fan_out) en attente"
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=300,
+                            help="Fenêtre de chargement en secondes (défaut 300)")
+        parser.add_argument('--refresh', type=float, default=1.0,
+                            help="Intervalle de prise en compte des nouvelles commandes (défaut 1 s)")
+        parser.add_argument('--overlap', type=int, default=30,
+                            help="Recouvrement des rafraîchissements en secondes, pour les "
+                                 "transactions validées en retard (défaut 30)")
+        parser.add_argument('--fanout-stale', type=int, default=1800,
+                            help="Une diffusion en cours depuis N s est marquée en échec (défaut 1800)")
+        parser.add_argument('--max-loaded', type=int, default=100000,
+                            help="Nombre maximum de commandes en mémoire")
+    
+    def handle(self, *args, **options):
+        dispatcher = ScheduledCommandDispatcher(
+            window_seconds=options['window'],
+            refresh_seconds=options['refresh'],
+            max_loaded=options['max_loaded'],
+            overlap_seconds=options['overlap'],
+            fanout_stale_seconds=options['fanout_stale'],
+        )
+        self.stdout.write("Dispatcher démarré (Ctrl+C pour arrêter)")
+        try:
+            dispatcher.run_forever()
+        except KeyboardInterrupt:
+            dispatcher.stop()
+        self.stdout.write(f"{dispatcher.released_count} commande(s) libérée(s), "
+                          f"{dispatcher.fanout_count} diffusion(s) insérée(s)")
@@ -0,0 +1,53 @@
+# api/management/commands/run_export_jobs.py
+import logging
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Exécute les exports de scans mis en file par l'admin (ExportJob), hors des workers web"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Traite les exports en attente puis s'arrête (planification cron)")
+        parser.add_argument('--poll', type=float, default=5.0,
+                            help="Intervalle de recherche de nouveaux exports (défaut 5 s)")
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="Un export en cours sans progression depuis N s est marqué en échec (défaut 600)")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        processed = 0
+        if not options['once']:
+            self.stdout.write("Worker des exports démarré (Ctrl+C pour arrêter)")
+        try:
+            while True:
+                close_old_connections()
+                stale = ExportJob.fail_stale(stale_after)
+                if stale:
+                    logger.warning("%s export(s) interrompu(s) marqué(s) en échec", stale)
+
+                job = ExportJob.claim_next()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                try:
+                    job.run()
+                    self.stdout.write(f"Export #{job.pk} terminé ({job.rows_written} fichier(s))")
+                except Exception:
+                    # Erreur enregistrée sur le job (statut 'failed') ; le worker continue
+                    logger.exception("Export #%s en échec", job.pk)
+                processed += 1
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"{processed} export(s) traité(s)")
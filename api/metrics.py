@@ -0,0 +1,115 @@
+# api/metrics.py
+"""
+Métriques en mémoire (par processus) pour le suivi des commandes
+
+Les latences sont rangées dans des histogrammes à seaux géométriques :
+l'enregistrement est en O(1) et la mémoire est bornée quel que soit le
+nombre de commandes. Les percentiles sont donc approchés à la largeur
+d'un seau près (~10 %).
+"""
+import bisect
+import threading
+from collections import defaultdict
+
+
+# Étapes mesurées sur le cycle de vie d'une commande
+COMMAND_STAGES = ['enqueue_to_deliver', 'deliver_to_ack', 'ack_to_done', 'enqueue_to_done']
+
+
+def _bucket_bounds(start_ms=1.0, end_ms=7 * 24 * 3600 * 1000.0, factor=1.1):
+    """Bornes supérieures des seaux, de 1 ms à 7 jours"""
+    bounds = []
+    value = start_ms
+    while value < end_ms:
+        bounds.append(value)
+        value *= factor
+    bounds.append(end_ms)
+    return bounds
+
+
+class LatencyHistogram:
+    """
+    Histogramme de latences (en millisecondes) à seaux géométriques
+    """
+    BOUNDS = _bucket_bounds()
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    def record(self, value_ms):
+        value_ms = max(float(value_ms), 0.0)
+        index = bisect.bisect_left(self.BOUNDS, value_ms)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += value_ms
+            if value_ms > self.max_ms:
+                self.max_ms = value_ms
+    
+    def percentile(self, p):
+        """Borne supérieure du seau contenant le p-ième percentile"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = p / 100 * self.count
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= rank and bucket_count:
+                    if index < len(self.BOUNDS):
+                        return min(self.BOUNDS[index], self.max_ms)
+                    return self.max_ms
+            return self.max_ms
+    
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 2) if self.count else None,
+            'p50_ms': _round(self.percentile(50)),
+            'p95_ms': _round(self.percentile(95)),
+            'p99_ms': _round(self.percentile(99)),
+            'max_ms': _round(self.max_ms) if self.count else None,
+        }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+_registry_lock = threading.Lock()
+_command_latencies = defaultdict(dict)
+
+
+def record_command_latency(command, stage, delta):
+    """
+    Enregistre une latence (timedelta) pour un type de commande et une étape
+    """
+    if delta is None:
+        return
+    with _registry_lock:
+        histogram = _command_latencies[command].get(stage)
+        if histogram is None:
+            histogram = _command_latencies[command][stage] = LatencyHistogram()
+    histogram.record(delta.total_seconds() * 1000)
+
+
+def command_latency_summary():
+    """p50/p95/p99 par type de commande et par étape"""
+    with _registry_lock:
+        snapshot = {command: dict(stages) for command, stages in _command_latencies.items()}
+    return {
+        command: {
+            stage: stages[stage].summary()
+            for stage in COMMAND_STAGES if stage in stages
+        }
+        for command, stages in sorted(snapshot.items())
+    }
+
+
+def reset_command_latencies():
+    with _registry_lock:
+        _command_latencies.clear()
@@ -0,0 +1,155 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scan_id', models.CharField(help_text='Identifiant unique généré par le téléphone pour ce scan', max_length=100, unique=True, verbose_name='ID du scan')),
+                ('scan_requested_at', models.DateTimeField(help_text='Moment où la commande a été envoyée', verbose_name='Demandé le')),
+                ('scan_started_at', models.DateTimeField(blank=True, help_text='Moment où le téléphone a commencé le scan', null=True, verbose_name='Début du scan')),
+                ('scan_completed_at', models.DateTimeField(blank=True, help_text='Moment où le téléphone a terminé le scan', null=True, verbose_name='Fin du scan')),
+                ('scan_duration_ms', models.IntegerField(blank=True, help_text='Durée totale du scan en millisecondes', null=True, verbose_name='Durée (ms)')),
+                ('total_files', models.IntegerField(default=0, help_text='Nombre total de fichiers trouvés', verbose_name='Total fichiers')),
+                ('total_size_bytes', models.BigIntegerField(default=0, help_text='Taille cumulée de tous les fichiers en octets', verbose_name='Taille totale (octets)')),
+                ('command_id', models.CharField(blank=True, help_text='Identifiant de la commande qui a déclenché ce scan', max_length=100, verbose_name='ID commande')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('scanning', 'Scan en cours'), ('completed', 'Terminé'), ('partial', 'Partiel'), ('failed', 'Échoué'), ('cancelled', 'Annulé')], default='pending', max_length=20, verbose_name='Statut')),
+                ('error_message', models.TextField(blank=True, help_text="Description de l'erreur si le scan a échoué", verbose_name="Message d'erreur")),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Mis à jour le')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='file_lists', to='api.device', verbose_name='Appareil')),
+            ],
+            options={
+                'verbose_name': 'Liste de fichiers',
+                'verbose_name_plural': 'Listes de fichiers',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FileItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.TextField(help_text='Chemin absolu du fichier (ex: /storage/emulated/0/DCIM/photo.jpg)', verbose_name='Chemin complet')),
+                ('parent_path', models.TextField(blank=True, help_text='Dossier contenant le fichier (ex: /storage/emulated/0/DCIM/)', verbose_name='Dossier parent')),
+                ('name', models.CharField(help_text='Nom du fichier avec extension', max_length=512, verbose_name='Nom du fichier')),
+                ('extension', models.CharField(blank=True, help_text='Extension du fichier (jpg, mp3, pdf, etc.)', max_length=50, verbose_name='Extension')),
+                ('size_bytes', models.BigIntegerField(help_text='Taille du fichier en octets', verbose_name='Taille (octets)')),
+                ('last_modified', models.BigIntegerField(blank=True, help_text='Timestamp de la dernière modification', null=True, verbose_name='Dernière modification (timestamp)')),
+                ('last_accessed', models.BigIntegerField(blank=True, help_text='Timestamp du dernier accès', null=True, verbose_name='Dernier accès (timestamp)')),
+                ('created_at_time', models.BigIntegerField(blank=True, help_text='Timestamp de création du fichier', null=True, verbose_name='Date création (timestamp)')),
+                ('file_type', models.CharField(choices=[('image', 'Image'), ('video', 'Vidéo'), ('audio', 'Audio'), ('document', 'Document'), ('apk', 'Application APK'), ('archive', 'Archive'), ('database', 'Base de données'), ('log', 'Fichier log'), ('temporary', 'Fichier temporaire'), ('system', 'Fichier système'), ('other', 'Autre')], default='other', max_length=20, verbose_name='Type de fichier')),
+                ('mime_type', models.CharField(blank=True, help_text='Type MIME détecté (image/jpeg, video/mp4, etc.)', max_length=100, verbose_name='Type MIME')),
+                ('is_readable', models.BooleanField(default=True, help_text='Le fichier est-il accessible en lecture ?', verbose_name='Lisible')),
+                ('is_writable', models.BooleanField(default=False, help_text='Le fichier est-il accessible en écriture ?', verbose_name='Inscriptible')),
+                ('is_hidden', models.BooleanField(default=False, help_text='Le fichier est-il caché (commence par un point) ?', verbose_name='Caché')),
+                ('is_directory', models.BooleanField(default=False, help_text="S'agit-il d'un dossier plutôt que d'un fichier ?", verbose_name='Est un dossier')),
+                ('md5_hash', models.CharField(blank=True, help_text='Empreinte MD5 du fichier (si calculée)', max_length=32, verbose_name='MD5')),
+                ('sha1_hash', models.CharField(blank=True, help_text='Empreinte SHA1 du fichier (si calculée)', max_length=40, verbose_name='SHA1')),
+                ('media_width', models.IntegerField(blank=True, help_text='Largeur en pixels (pour images/vidéos)', null=True, verbose_name='Largeur')),
+                ('media_height', models.IntegerField(blank=True, help_text='Hauteur en pixels (pour images/vidéos)', null=True, verbose_name='Hauteur')),
+                ('media_duration_ms', models.IntegerField(blank=True, help_text='Durée en millisecondes (pour audio/vidéo)', null=True, verbose_name='Durée (ms)')),
+                ('media_date_taken', models.BigIntegerField(blank=True, help_text='Timestamp EXIF de la photo', null=True, verbose_name='Date de prise de vue')),
+                ('media_gps_lat', models.FloatField(blank=True, help_text='Coordonnées GPS de la photo (si disponibles)', null=True, verbose_name='Latitude GPS')),
+                ('media_gps_lng', models.FloatField(blank=True, help_text='Coordonnées GPS de la photo (si disponibles)', null=True, verbose_name='Longitude GPS')),
+                ('apk_package_name', models.CharField(blank=True, help_text='Nom du package Android (pour les APK)', max_length=255, verbose_name='Nom du package')),
+                ('apk_version_code', models.IntegerField(blank=True, help_text="Version code de l'application", null=True, verbose_name='Code de version')),
+                ('apk_version_name', models.CharField(blank=True, help_text="Nom de version de l'application", max_length=100, verbose_name='Nom de version')),
+                ('apk_min_sdk', models.IntegerField(blank=True, help_text='Niveau API minimum requis', null=True, verbose_name='SDK minimum')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                ('file_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='api.filelist', verbose_name='Liste parente')),
+            ],
+            options={
+                'verbose_name': 'Fichier',
+                'verbose_name_plural': 'Fichiers',
+                'ordering': ['path'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FileScanStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('images_count', models.IntegerField(default=0)),
+                ('images_size', models.BigIntegerField(default=0)),
+                ('videos_count', models.IntegerField(default=0)),
+                ('videos_size', models.BigIntegerField(default=0)),
+                ('audio_count', models.IntegerField(default=0)),
+                ('audio_size', models.BigIntegerField(default=0)),
+                ('documents_count', models.IntegerField(default=0)),
+                ('documents_size', models.BigIntegerField(default=0)),
+                ('apks_count', models.IntegerField(default=0)),
+                ('apks_size', models.BigIntegerField(default=0)),
+                ('archives_count', models.IntegerField(default=0)),
+                ('archives_size', models.BigIntegerField(default=0)),
+                ('dcim_count', models.IntegerField(default=0, help_text='Photos/Vidéos dans DCIM')),
+                ('dcim_size', models.BigIntegerField(default=0)),
+                ('downloads_count', models.IntegerField(default=0, help_text='Fichiers dans Download')),
+                ('downloads_size', models.BigIntegerField(default=0)),
+                ('whatsapp_count', models.IntegerField(default=0, help_text='Fichiers WhatsApp')),
+                ('whatsapp_size', models.BigIntegerField(default=0)),
+                ('largest_files', models.JSONField(default=list, help_text='Top 10 des plus gros fichiers')),
+                ('hidden_files_count', models.IntegerField(default=0)),
+                ('hidden_files_size', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file_list', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='api.filelist', verbose_name='Liste de fichiers')),
+            ],
+            options={
+                'verbose_name': 'Statistiques de scan',
+                'verbose_name_plural': 'Statistiques de scans',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='filelist',
+            index=models.Index(fields=['device', '-created_at'], name='api_filelis_device__791430_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filelist',
+            index=models.Index(fields=['scan_id'], name='api_filelis_scan_id_1d44c4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filelist',
+            index=models.Index(fields=['status'], name='api_filelis_status_95ef8b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['file_list', 'file_type'], name='api_fileite_file_li_1c793f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['file_list', 'file_type', 'size_bytes'], name='api_fileite_file_li_e858b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['name'], name='api_fileite_name_0d4cc9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['extension'], name='api_fileite_extensi_f6c11f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['parent_path'], name='api_fileite_parent__1bfb05_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['path'], name='api_fileite_path_7d9d03_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['last_modified'], name='api_fileite_last_mo_fdeed3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['is_hidden'], name='api_fileite_is_hidd_95fc7c_idx'),
+        ),
+    ]
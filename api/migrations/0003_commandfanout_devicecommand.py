@@ -0,0 +1,61 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_filelist_fileitem_filescanstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandFanOut',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command', models.CharField(max_length=50, verbose_name='Commande')),
+                ('params', models.JSONField(blank=True, default=dict, help_text='Paramètres communs à toutes les commandes de la diffusion', verbose_name='Paramètres')),
+                ('priority', models.CharField(default='normal', max_length=20, verbose_name='Priorité')),
+                ('expires_in', models.IntegerField(blank=True, null=True, verbose_name='Expiration (s)')),
+                ('require_ack', models.BooleanField(default=True, verbose_name='Accusé requis')),
+                ('filters', models.JSONField(blank=True, default=dict, verbose_name='Filtres')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('completed', 'Terminé'), ('failed', 'Échoué')], default='pending', max_length=20, verbose_name='Statut')),
+                ('total_targets', models.IntegerField(default=0, verbose_name='Appareils ciblés')),
+                ('queued_count', models.IntegerField(default=0, verbose_name='Commandes insérées')),
+                ('error_message', models.TextField(blank=True, verbose_name="Message d'erreur")),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Démarré le')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='Terminé le')),
+            ],
+            options={
+                'verbose_name': 'Diffusion de commande',
+                'verbose_name_plural': 'Diffusions de commandes',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeviceCommand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command_id', models.CharField(max_length=100, unique=True, verbose_name='ID commande')),
+                ('command', models.CharField(max_length=50, verbose_name='Commande')),
+                ('params', models.JSONField(blank=True, help_text='Vide pour une diffusion : les paramètres sont ceux de la diffusion', null=True, verbose_name='Paramètres')),
+                ('priority', models.CharField(default='normal', max_length=20, verbose_name='Priorité')),
+                ('require_ack', models.BooleanField(default=True, verbose_name='Accusé requis')),
+                ('status', models.CharField(choices=[('queued', 'En file'), ('delivered', 'Délivrée'), ('expired', 'Expirée'), ('cancelled', 'Annulée')], default='queued', max_length=20, verbose_name='Statut')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Expire le')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Mise en file le')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Mis à jour le')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commands', to='api.device', verbose_name='Appareil')),
+                ('fanout', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='commands', to='api.commandfanout', verbose_name='Diffusion')),
+            ],
+            options={
+                'verbose_name': 'Commande',
+                'verbose_name_plural': 'Commandes',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['device', 'status'], name='api_devicec_device__910175_idx'), models.Index(fields=['fanout', 'status'], name='api_devicec_fanout__17a544_idx')],
+            },
+        ),
+    ]
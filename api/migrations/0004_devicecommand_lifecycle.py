@@ -0,0 +1,48 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_commandfanout_devicecommand'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicecommand',
+            name='acked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Accusée le'),
+        ),
+        migrations.AddField(
+            model_name='devicecommand',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Terminée le'),
+        ),
+        migrations.AddField(
+            model_name='devicecommand',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Délivrée le'),
+        ),
+        migrations.AddField(
+            model_name='devicecommand',
+            name='error_message',
+            field=models.TextField(blank=True, verbose_name="Message d'erreur"),
+        ),
+        migrations.AddField(
+            model_name='devicecommand',
+            name='result',
+            field=models.JSONField(blank=True, null=True, verbose_name='Résultat'),
+        ),
+        migrations.AddField(
+            model_name='devicecommand',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Exécution le'),
+        ),
+        migrations.AlterField(
+            model_name='devicecommand',
+            name='status',
+            field=models.CharField(choices=[('queued', 'En file'), ('delivered', 'Délivrée'), ('received', 'Reçue'), ('executing', "En cours d'exécution"), ('done', 'Terminée'), ('failed', 'Échouée'), ('expired', 'Expirée'), ('cancelled', 'Annulée')], default='queued', max_length=20, verbose_name='Statut'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_devicecommand_lifecycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandfanout',
+            name='local_time',
+            field=models.CharField(blank=True, help_text='Exécution à cette heure dans le fuseau de chaque appareil', max_length=5, verbose_name='Heure locale'),
+        ),
+        migrations.AddField(
+            model_name='commandfanout',
+            name='schedule_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Programmée pour'),
+        ),
+        migrations.AddField(
+            model_name='devicecommand',
+            name='schedule_at',
+            field=models.DateTimeField(blank=True, help_text='Libérée dans la file par le dispatcher à cette date', null=True, verbose_name='Programmée pour'),
+        ),
+        migrations.AlterField(
+            model_name='devicecommand',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Programmée'), ('queued', 'En file'), ('delivered', 'Délivrée'), ('received', 'Reçue'), ('executing', "En cours d'exécution"), ('done', 'Terminée'), ('failed', 'Échouée'), ('expired', 'Expirée'), ('cancelled', 'Annulée')], default='queued', max_length=20, verbose_name='Statut'),
+        ),
+        migrations.AddIndex(
+            model_name='devicecommand',
+            index=models.Index(fields=['status', 'schedule_at'], name='api_devicec_status_2150fc_idx'),
+        ),
+    ]
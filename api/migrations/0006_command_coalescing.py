@@ -0,0 +1,37 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_command_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandfanout',
+            name='coalesced_count',
+            field=models.IntegerField(default=0, help_text='Appareils ayant déjà la même commande en file', verbose_name='Commandes fusionnées'),
+        ),
+        migrations.AddField(
+            model_name='devicecommand',
+            name='coalesce_key',
+            field=models.CharField(blank=True, help_text='Deux commandes en file avec la même clé pour un appareil sont fusionnées', max_length=255, verbose_name='Clé de fusion'),
+        ),
+        migrations.AddField(
+            model_name='devicecommand',
+            name='coalesced_count',
+            field=models.IntegerField(default=0, verbose_name='Demandes fusionnées'),
+        ),
+        migrations.AlterField(
+            model_name='devicecommand',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Programmée'), ('queued', 'En file'), ('delivered', 'Délivrée'), ('received', 'Reçue'), ('executing', "En cours d'exécution"), ('done', 'Terminée'), ('failed', 'Échouée'), ('expired', 'Expirée'), ('cancelled', 'Annulée'), ('coalesced', 'Fusionnée')], default='queued', max_length=20, verbose_name='Statut'),
+        ),
+        migrations.AddConstraint(
+            model_name='devicecommand',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'queued'), models.Q(('coalesce_key', ''), _negated=True)), fields=('device', 'coalesce_key'), name='unique_queued_coalesce_key'),
+        ),
+    ]
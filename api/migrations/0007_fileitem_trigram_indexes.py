@@ -0,0 +1,39 @@
+# Index trigramme pour la recherche par sous-chaîne (search_files)
+
+from django.db import migrations
+
+# icontains produit UPPER("col"::text) LIKE UPPER('%x%') sur PostgreSQL :
+# les index doivent porter exactement sur cette expression.
+TRIGRAM_INDEXES = [
+    ('api_fileitem_name_trgm', 'name'),
+    ('api_fileitem_path_trgm', 'path'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index_name, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {index_name} ON api_fileitem '
+            f'USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index_name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_command_coalescing'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_latest_completed_scan(apps, schema_editor):
+    Device = apps.get_model('api', 'Device')
+    FileList = apps.get_model('api', 'FileList')
+    latest = FileList.objects.filter(
+        device=models.OuterRef('pk'),
+        status='completed'
+    ).order_by('-created_at').values('pk')[:1]
+    Device.objects.update(latest_completed_scan=models.Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_fileitem_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='latest_completed_scan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.filelist', verbose_name='Dernier scan complété'),
+        ),
+        migrations.RunPython(backfill_latest_completed_scan, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_device_latest_completed_scan'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='filelist',
+            name='api_filelis_device__791430_idx',
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['-last_seen', '-id'], name='api_device_last_se_53809e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['is_active', '-last_seen', '-id'], name='api_device_is_acti_980f67_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(fields=['file_list', '-size_bytes', '-id'], name='api_fileite_file_li_10cda5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filelist',
+            index=models.Index(fields=['device', '-created_at', '-id'], name='api_filelis_device__e4d862_idx'),
+        ),
+    ]
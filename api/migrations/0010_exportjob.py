@@ -0,0 +1,36 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scan_ids', models.JSONField(default=list, verbose_name='Scans exportés')),
+                ('export_format', models.CharField(choices=[('json', 'JSON'), ('ndjson', 'NDJSON')], default='json', max_length=10, verbose_name='Format')),
+                ('compress', models.BooleanField(default=True, verbose_name='Compression gzip')),
+                ('requested_by', models.CharField(blank=True, max_length=150, verbose_name='Demandé par')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('completed', 'Terminé'), ('failed', 'Échoué')], default='pending', max_length=20, verbose_name='Statut')),
+                ('total_rows', models.BigIntegerField(default=0, verbose_name='Fichiers à exporter')),
+                ('rows_written', models.BigIntegerField(default=0, verbose_name='Fichiers écrits')),
+                ('file', models.FileField(blank=True, upload_to='exports/', verbose_name='Fichier')),
+                ('error_message', models.TextField(blank=True, verbose_name="Message d'erreur")),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Démarré le')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='Terminé le')),
+            ],
+            options={
+                'verbose_name': 'Export de scans',
+                'verbose_name_plural': 'Exports de scans',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
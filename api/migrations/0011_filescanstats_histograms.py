@@ -0,0 +1,43 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filescanstats',
+            name='directories_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='filescanstats',
+            name='extension_histogram',
+            field=models.JSONField(default=list, help_text='Top 30 des extensions'),
+        ),
+        migrations.AddField(
+            model_name='filescanstats',
+            name='folder_histogram',
+            field=models.JSONField(default=list, help_text='Top 20 des dossiers parents par taille'),
+        ),
+        migrations.AddField(
+            model_name='filescanstats',
+            name='stats_version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='filescanstats',
+            name='type_histogram',
+            field=models.JSONField(default=list, help_text='Nombre et taille par type (tous types)'),
+        ),
+        migrations.AlterField(
+            model_name='filescanstats',
+            name='largest_files',
+            field=models.JSONField(default=list, help_text='Top 20 des plus gros fichiers'),
+        ),
+    ]
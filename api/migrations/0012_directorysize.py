@@ -0,0 +1,35 @@
+# Generated by Django 5.2.11 on 2026-10-19 00:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_filescanstats_histograms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectorySize',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, verbose_name='Chemin')),
+                ('parent', models.CharField(blank=True, max_length=1024, verbose_name='Dossier parent')),
+                ('name', models.CharField(blank=True, max_length=512, verbose_name='Nom')),
+                ('depth', models.PositiveSmallIntegerField(default=0, verbose_name='Profondeur')),
+                ('files_count', models.IntegerField(default=0, verbose_name='Fichiers (récursif)')),
+                ('total_size', models.BigIntegerField(default=0, verbose_name='Taille (récursif)')),
+                ('direct_files_count', models.IntegerField(default=0, verbose_name='Fichiers directs')),
+                ('direct_size', models.BigIntegerField(default=0, verbose_name='Taille directe')),
+                ('file_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='directories', to='api.filelist', verbose_name='Liste de fichiers')),
+            ],
+            options={
+                'verbose_name': 'Taille de dossier',
+                'verbose_name_plural': 'Tailles de dossiers',
+                'indexes': [models.Index(fields=['file_list', 'parent', '-total_size'], name='api_directo_file_li_4a82d0_idx')],
+                'constraints': [models.UniqueConstraint(fields=('file_list', 'path'), name='unique_directory_per_scan')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Index (scan, chemin) en ordre binaire pour le merge-join de scan_diff
+
+from django.db import migrations
+
+INDEX_NAME = 'api_fileitem_list_path_bin'
+
+
+def create_path_index(apps, schema_editor):
+    # scan_diff trie par Collate(path, 'C') sur PostgreSQL, 'BINARY' sur SQLite
+    if schema_editor.connection.vendor == 'postgresql':
+        collation = ' COLLATE "C"'
+    else:
+        collation = ''
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON api_fileitem (file_list_id, path{collation})'
+    )
+
+
+def drop_path_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_directorysize'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_path_index, drop_path_index),
+    ]
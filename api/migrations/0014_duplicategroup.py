@@ -0,0 +1,52 @@
+# Generated by Django 5.2.11 on 2026-10-19 01:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_fileitem_path_order_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('match', models.CharField(choices=[('md5', 'Empreinte MD5'), ('sha1', 'Empreinte SHA1'), ('size', 'Taille identique (candidat)')], max_length=10, verbose_name='Critère')),
+                ('content_key', models.CharField(help_text='Empreinte, ou taille:extension pour les candidats', max_length=100, verbose_name='Clé de contenu')),
+                ('size_bytes', models.BigIntegerField(default=0, verbose_name="Taille d'une copie")),
+                ('extension', models.CharField(blank=True, max_length=50, verbose_name='Extension')),
+                ('copies', models.IntegerField(default=0, verbose_name='Nombre de copies')),
+                ('reclaimable_bytes', models.BigIntegerField(default=0, help_text='Taille × (copies - 1)', verbose_name='Espace récupérable')),
+                ('paths', models.JSONField(default=list, help_text='Échantillon des chemins du groupe')),
+            ],
+            options={
+                'verbose_name': 'Groupe de doublons',
+                'verbose_name_plural': 'Groupes de doublons',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(condition=models.Q(('md5_hash', ''), _negated=True), fields=['md5_hash', 'file_list'], name='api_fileitem_md5_hash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileitem',
+            index=models.Index(condition=models.Q(('sha1_hash', ''), _negated=True), fields=['sha1_hash', 'file_list'], name='api_fileitem_sha1_hash_idx'),
+        ),
+        migrations.AddField(
+            model_name='duplicategroup',
+            name='file_list',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_groups', to='api.filelist', verbose_name='Liste de fichiers'),
+        ),
+        migrations.AddIndex(
+            model_name='duplicategroup',
+            index=models.Index(fields=['file_list', '-reclaimable_bytes'], name='api_duplica_file_li_b1f64d_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='duplicategroup',
+            constraint=models.UniqueConstraint(fields=('file_list', 'match', 'content_key'), name='unique_duplicate_group_per_scan'),
+        ),
+    ]
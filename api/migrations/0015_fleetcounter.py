@@ -0,0 +1,46 @@
+# Generated by Django 5.2.11 on 2026-10-19 01:07
+
+from django.db import migrations, models
+
+
+def backfill_fleet_counters(apps, schema_editor):
+    from api.counters import expected_counters
+    
+    FleetCounter = apps.get_model('api', 'FleetCounter')
+    expected = expected_counters(
+        apps.get_model('api', 'Device'),
+        apps.get_model('api', 'FileList'),
+        apps.get_model('api', 'FileItem'),
+    )
+    FleetCounter.objects.bulk_create(
+        FleetCounter(scope=scope, key=key, count=count, size=size)
+        for (scope, key), (count, size) in expected.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_duplicategroup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=30, verbose_name='Portée')),
+                ('key', models.CharField(blank=True, max_length=255, verbose_name='Clé')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Nombre')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Taille')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Compteur de flotte',
+                'verbose_name_plural': 'Compteurs de flotte',
+                'indexes': [models.Index(fields=['scope', '-count'], name='api_fleetco_scope_ff5cfc_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key'), name='unique_fleet_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_fleet_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.11 on 2026-10-19 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_fleetcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Jour')),
+                ('metric', models.CharField(choices=[('devices_seen', 'Appareils vus'), ('devices_registered', 'Appareils enregistrés'), ('devices_active', 'Appareils actifs'), ('scans_completed', 'Scans terminés'), ('files_scanned', 'Fichiers scannés')], max_length=30, verbose_name='Métrique')),
+                ('dimension', models.CharField(default='all', max_length=30, verbose_name='Dimension')),
+                ('value', models.CharField(blank=True, max_length=100, verbose_name='Valeur')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Nombre')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Taille')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Agrégat journalier',
+                'verbose_name_plural': 'Agrégats journaliers',
+                'indexes': [models.Index(fields=['metric', 'dimension', 'date'], name='api_dailyro_metric_93d318_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'metric', 'dimension', 'value'), name='unique_daily_rollup')],
+            },
+        ),
+    ]
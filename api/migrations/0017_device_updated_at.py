@@ -0,0 +1,26 @@
+# Generated by Django 5.2.11 on 2026-10-19 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    Device = apps.get_model('api', 'Device')
+    Device.objects.update(updated_at=models.F('last_seen'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Dernière modification'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
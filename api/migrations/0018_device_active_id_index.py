@@ -0,0 +1,21 @@
+# Generated by Django 5.2.11 on 2026-10-19 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_device_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='device',
+            name='api_device_is_acti_980f67_idx',
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['is_active', '-id'], name='api_device_is_acti_6b7d75_idx'),
+        ),
+    ]
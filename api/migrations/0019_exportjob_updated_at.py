@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-19 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_device_active_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Mis à jour le'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Index du merge-join de scan_diff : partiel (fichiers seulement) et couvrant
+#
+# iter_scan_rows filtre NOT is_directory et trie par path COLLATE "C"
+# (PostgreSQL) / "BINARY" (SQLite). L'index de 0013 servait déjà l'ordre ;
+# avec le même prédicat que la requête et, sur PostgreSQL, les colonnes lues
+# en INCLUDE, le parcours ne visite plus que l'index.
+
+from django.db import migrations
+
+INDEX_NAME = 'api_fileitem_list_path_bin'
+ROW_COLUMNS = 'name, size_bytes, last_modified, file_type'
+
+
+def create_partial_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX {INDEX_NAME} ON api_fileitem (file_list_id, path COLLATE "C") '
+            f'INCLUDE ({ROW_COLUMNS}) WHERE NOT is_directory'
+        )
+    else:
+        schema_editor.execute(
+            f'CREATE INDEX {INDEX_NAME} ON api_fileitem (file_list_id, path) WHERE NOT is_directory'
+        )
+
+
+def restore_full_index(apps, schema_editor):
+    collation = ' COLLATE "C"' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+    schema_editor.execute(f'CREATE INDEX {INDEX_NAME} ON api_fileitem (file_list_id, path{collation})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_exportjob_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_partial_index, restore_full_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-19 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_fileitem_list_path_bin_partial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandfanout',
+            name='progress_at',
+            field=models.DateTimeField(blank=True, help_text='Mis à jour après chaque lot inséré', null=True, verbose_name='Dernière progression'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 # api/models.py
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
 import secrets
 import hashlib
 
@@ -101,24 +103,170 @@ class Device(models.Model):
     is_active = models.BooleanField(default=True, verbose_name="Actif")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date d'enregistrement")
     last_seen = models.DateTimeField(auto_now=True, verbose_name="Dernière connexion")
+    # Toute écriture (y compris update_fields et actions de masse) : validateur des GET conditionnels
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Dernière modification")
+    
+    # Pointeur dénormalisé vers le scan complété le plus récent
+    latest_completed_scan = models.ForeignKey(
+        'FileList',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Dernier scan complété"
+    )
     
     def generate_key(self):
         """Génère une clé unique pour le device"""
         unique_string = f"{self.android_id}{secrets.token_hex(16)}"
         return hashlib.sha256(unique_string.encode()).hexdigest()
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from .counters import DEVICE_COUNTED_FIELDS, device_contributions
+        
+        instance = super().from_db(db, field_names, values)
+        # Contribution aux compteurs de flotte telle que lue en base
+        if not DEVICE_COUNTED_FIELDS & instance.get_deferred_fields():
+            instance._counted = device_contributions(instance)
+        return instance
+    
+    # Champs mis à jour par heartbeat : n'invalident pas le cache des réponses
+    HEARTBEAT_FIELDS = {
+        'last_seen', 'is_active', 'battery_level', 'is_charging',
+        'available_storage', 'network_type', 'is_roaming',
+    }
+    
     def save(self, *args, **kwargs):
+        from .cache import invalidate_device
+        from .counters import counter_delta, device_contributions
+        
         if not self.device_key:
             self.device_key = self.generate_key()
-        super().save(*args, **kwargs)
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        
+        if self._state.adding:
+            previous = {}
+        else:
+            previous = getattr(self, '_counted', None)
+            if previous is None:
+                stored = Device.objects.filter(pk=self.pk).first()
+                previous = device_contributions(stored) if stored else {}
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            counted = device_contributions(self)
+            FleetCounter.apply(counter_delta(previous, counted))
+            
+            if update_fields is None or not set(update_fields) <= self.HEARTBEAT_FIELDS or counted != previous:
+                invalidate_device(self.pk)
+        self._counted = counted
+    
+    @classmethod
+    def update_in_bulk(cls, queryset, **values):
+        """
+        queryset.update(**values) qui maintient les compteurs de flotte et le cache
+        
+        Un seul UPDATE pour toute la sélection ; les contributions avant / après
+        viennent d'une requête groupée sur la même sélection (sans charger les
+        appareils), leur différence est appliquée dans la même transaction et
+        les réponses en cache des appareils et de la flotte invalidées au commit.
+        """
+        from django.utils import timezone
+        from .cache import invalidate_devices
+        from .counters import counter_delta, selection_contributions
+        
+        values['updated_at'] = timezone.now()
+        with transaction.atomic():
+            # Sélection figée par clé : le filtre d'origine peut porter sur
+            # un champ que l'update modifie
+            device_ids = list(queryset.order_by().values_list('pk', flat=True))
+            selection = cls.objects.filter(pk__in=device_ids)
+            before, after = selection_contributions(selection, **values)
+            
+            updated = selection.update(**values)
+            FleetCounter.apply(counter_delta(before, after))
+            invalidate_devices(device_ids)
+        return updated
     
     def __str__(self):
         return f"{self.manufacturer} {self.model} ({self.android_version})"
     
+    def refresh_latest_completed_scan(self):
+        """
+        Recalcule le pointeur vers le dernier scan complété (une seule requête)
+        
+        Passe par update() pour ne pas toucher last_seen (auto_now).
+        """
+        Device.objects.filter(pk=self.pk).update(
+            latest_completed_scan=self.latest_completed_scan_subquery()
+        )
+        self.refresh_from_db(fields=['latest_completed_scan'])
+        return self.latest_completed_scan
+    
+    @staticmethod
+    def latest_completed_scan_subquery():
+        """Sous-requête : id du dernier scan complété de l'appareil courant"""
+        from django.db.models import OuterRef, Subquery
+        
+        return Subquery(FileList.objects.filter(
+            device=OuterRef('pk'),
+            status='completed'
+        ).order_by('-created_at').values('pk')[:1])
+    
+    @staticmethod
+    def with_scan_totals(queryset):
+        """
+        Annote scans_count (tous scans) et total_files_scanned (fichiers
+        des scans complétés) par sous-requêtes corrélées : une seule requête
+        pour toute la page, au lieu de deux par appareil
+        """
+        from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+        from django.db.models.functions import Coalesce
+        
+        scans = FileList.objects.filter(device=OuterRef('pk')).order_by().values('device')
+        return queryset.annotate(
+            scans_count=Coalesce(Subquery(
+                scans.annotate(total=Count('pk')).values('total'), output_field=IntegerField()
+            ), 0),
+            total_files_scanned=Coalesce(Subquery(
+                scans.filter(status='completed').annotate(total=Sum('total_files')).values('total'),
+                output_field=IntegerField()
+            ), 0),
+        )
+    
+    @staticmethod
+    def with_file_totals(queryset):
+        """
+        Annote files_total / files_size : fichiers stockés de l'appareil,
+        tous scans confondus (une sous-requête par colonne, pas par ligne)
+        """
+        from django.db.models import BigIntegerField, Count, IntegerField, OuterRef, Subquery, Sum
+        from django.db.models.functions import Coalesce
+        
+        files = FileItem.objects.filter(file_list__device=OuterRef('pk')).order_by().values('file_list__device')
+        return queryset.annotate(
+            files_total=Coalesce(Subquery(
+                files.annotate(total=Count('pk')).values('total'), output_field=IntegerField()
+            ), 0),
+            files_size=Coalesce(Subquery(
+                files.annotate(total=Sum('size_bytes')).values('total'), output_field=BigIntegerField()
+            ), 0),
+        )
+    
     class Meta:
         verbose_name = "Appareil"
         verbose_name_plural = "Appareils"
         ordering = ['-created_at']
+        indexes = [
+            # Filtres sur la dernière connexion (last_24h, diffusions)
+            models.Index(fields=['-last_seen', '-id']),
+            # Pagination keyset des appareils actifs (clé stable, voir DeviceCursorPagination)
+            models.Index(fields=['is_active', '-id']),
+        ]
 
 
 # ===== NOUVEAUX MODÈLES POUR LA GESTION DES FICHIERS =====
@@ -229,7 +377,7 @@ class FileList(models.Model):
         verbose_name_plural = "Listes de fichiers"
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['device', '-created_at']),
+            models.Index(fields=['device', '-created_at', '-id']),
             models.Index(fields=['scan_id']),
             models.Index(fields=['status']),
         ]
@@ -237,6 +385,20 @@ class FileList(models.Model):
     def __str__(self):
         return f"Scan {self.scan_id} - {self.device} - {self.total_files} fichiers"
     
+    @staticmethod
+    def with_files_count(queryset):
+        """
+        Annote files_count (fichiers stockés du scan) par sous-requête :
+        évalué pour les seules lignes de la page, sans requête par scan
+        """
+        from django.db.models import Count, IntegerField, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+        
+        files = FileItem.objects.filter(file_list=OuterRef('pk')).order_by().values('file_list')
+        return queryset.annotate(files_count=Coalesce(Subquery(
+            files.annotate(total=Count('pk')).values('total'), output_field=IntegerField()
+        ), 0))
+    
     @classmethod
     def cleanup_old_scans(cls, device, keep_last=5):
         """
@@ -249,6 +411,46 @@ class FileList(models.Model):
         return count
 
 
+@receiver(post_delete, sender=Device)
+def uncount_device(sender, instance, **kwargs):
+    from .cache import invalidate_device
+    from .counters import device_contributions, negate
+    
+    FleetCounter.apply(negate(device_contributions(instance)))
+    invalidate_device(instance.pk)
+
+
+@receiver(pre_delete, sender=FileList)
+def uncount_scan(sender, instance, **kwargs):
+    """
+    Retire le scan des compteurs tant que ses fichiers existent encore
+    (pre_delete est envoyé dans la transaction de la suppression)
+    """
+    from .counters import negate, scan_contributions
+    
+    FleetCounter.apply(negate(scan_contributions(instance)))
+
+
+@receiver(post_save, sender=FileList)
+@receiver(post_delete, sender=FileList)
+def invalidate_scan_device(sender, instance, **kwargs):
+    """Scan créé, modifié ou supprimé (rétention) : nouvelle version de l'appareil"""
+    from .cache import invalidate_device
+    
+    invalidate_device(instance.device_id)
+
+
+@receiver(post_delete, sender=FileList)
+def repoint_latest_completed_scan(sender, instance, **kwargs):
+    """
+    Le scan pointé a été supprimé (SET_NULL) : on repointe vers le précédent
+    """
+    Device.objects.filter(
+        pk=instance.device_id,
+        latest_completed_scan__isnull=True
+    ).update(latest_completed_scan=Device.latest_completed_scan_subquery())
+
+
 class FileItem(models.Model):
     """
     Modèle pour stocker les métadonnées d'un fichier individuel
@@ -464,6 +666,7 @@ class FileItem(models.Model):
             # Index pour recherche rapide par type
             models.Index(fields=['file_list', 'file_type']),
             models.Index(fields=['file_list', 'file_type', 'size_bytes']),
+            models.Index(fields=['file_list', '-size_bytes', '-id']),
             
             # Index pour recherche par nom
             models.Index(fields=['name']),
@@ -478,6 +681,18 @@ class FileItem(models.Model):
             
             # Index pour les fichiers cachés
             models.Index(fields=['is_hidden']),
+            
+            # Index des empreintes (doublons), limités aux fichiers hachés
+            models.Index(
+                fields=['md5_hash', 'file_list'],
+                condition=~models.Q(md5_hash=''),
+                name='api_fileitem_md5_hash_idx',
+            ),
+            models.Index(
+                fields=['sha1_hash', 'file_list'],
+                condition=~models.Q(sha1_hash=''),
+                name='api_fileitem_sha1_hash_idx',
+            ),
         ]
         ordering = ['path']
     
@@ -485,6 +700,19 @@ class FileItem(models.Model):
         size_mb = self.size_bytes / (1024 * 1024)
         return f"{self.path} ({size_mb:.2f} MB)"
     
+    @property
+    def size_formatted(self):
+        """Taille formatée (o, Ko, Mo, Go)"""
+        size = self.size_bytes or 0
+        if size < 1024:
+            return f"{size} o"
+        elif size < 1024 ** 2:
+            return f"{size/1024:.1f} Ko"
+        elif size < 1024 ** 3:
+            return f"{size/1024**2:.1f} Mo"
+        else:
+            return f"{size/1024**3:.2f} Go"
+    
     def save(self, *args, **kwargs):
         """
         Surcharge de save pour auto-remplir certains champs
@@ -565,12 +793,21 @@ class FileScanStats(models.Model):
     whatsapp_count = models.IntegerField(default=0, help_text="Fichiers WhatsApp")
     whatsapp_size = models.BigIntegerField(default=0)
     
-    # Top 10 plus gros fichiers (stocké en JSON pour éviter une requête supplémentaire)
-    largest_files = models.JSONField(default=list, help_text="Top 10 des plus gros fichiers")
+    # Top 20 plus gros fichiers (stocké en JSON pour éviter une requête supplémentaire)
+    largest_files = models.JSONField(default=list, help_text="Top 20 des plus gros fichiers")
+    
+    # Histogrammes pré-calculés (servis tels quels par file_stats)
+    type_histogram = models.JSONField(default=list, help_text="Nombre et taille par type (tous types)")
+    extension_histogram = models.JSONField(default=list, help_text="Top 30 des extensions")
+    folder_histogram = models.JSONField(default=list, help_text="Top 20 des dossiers parents par taille")
     
     # Statistiques de fichiers cachés
     hidden_files_count = models.IntegerField(default=0)
     hidden_files_size = models.BigIntegerField(default=0)
+    directories_count = models.IntegerField(default=0)
+    
+    # Version du calcul : les lignes plus anciennes sont recalculées à la lecture
+    stats_version = models.IntegerField(default=0)
     
     # Métadonnées
     created_at = models.DateTimeField(auto_now_add=True)
@@ -580,50 +817,1276 @@ class FileScanStats(models.Model):
         verbose_name = "Statistiques de scan"
         verbose_name_plural = "Statistiques de scans"
     
+    STATS_VERSION = 2
+    LARGEST_FILES_COUNT = 20
+    EXTENSION_HISTOGRAM_SIZE = 30
+    FOLDER_HISTOGRAM_SIZE = 20
+    
+    # Préfixe des champs <préfixe>_count / <préfixe>_size par type de fichier
+    TYPE_FIELDS = {
+        'image': 'images',
+        'video': 'videos',
+        'audio': 'audio',
+        'document': 'documents',
+        'apk': 'apks',
+        'archive': 'archives',
+    }
+    
     def __str__(self):
         return f"Stats pour {self.file_list.scan_id}"
     
+    @classmethod
+    def for_file_list(cls, file_list):
+        """
+        Statistiques d'un scan : ligne pré-calculée, recalculée si absente ou périmée
+        """
+        from django.db import IntegrityError
+        
+        try:
+            stats = file_list.stats
+        except cls.DoesNotExist:
+            stats = None
+        
+        if stats is not None and stats.stats_version >= cls.STATS_VERSION:
+            return stats
+        
+        cls.objects.filter(file_list=file_list).delete()
+        try:
+            return cls.generate_from_file_list(file_list)
+        except IntegrityError:
+            # Calculée en parallèle par une autre requête
+            return cls.objects.get(file_list=file_list)
+    
     @classmethod
     def generate_from_file_list(cls, file_list):
         """
         Génère les statistiques à partir d'une FileList
+        Cinq requêtes en tout : types, agrégats conditionnels, extensions,
+        dossiers et plus gros fichiers
         """
         from django.db.models import Sum, Count, Q
         
-        files = file_list.files
+        files = file_list.files.all()
         
-        stats = cls(file_list=file_list)
+        stats = cls(file_list=file_list, stats_version=cls.STATS_VERSION)
         
-        # Stats par type
-        for file_type in ['image', 'video', 'audio', 'document', 'apk', 'archive']:
-            queryset = files.filter(file_type=file_type)
-            count = queryset.count()
-            size = queryset.aggregate(total=Sum('size_bytes'))['total'] or 0
-            
-            setattr(stats, f'{file_type}s_count', count)
-            setattr(stats, f'{file_type}s_size', size)
+        # Stats par type (un seul GROUP BY)
+        type_histogram = [
+            {
+                'file_type': item['file_type'],
+                'count': item['count'],
+                'total_size': item['total_size'] or 0,
+            }
+            for item in files.values('file_type').annotate(
+                count=Count('id'),
+                total_size=Sum('size_bytes')
+            ).order_by('file_type')
+        ]
+        stats.type_histogram = type_histogram
         
-        # Stats par dossier
-        dcim_files = files.filter(path__icontains='/DCIM/')
-        stats.dcim_count = dcim_files.count()
-        stats.dcim_size = dcim_files.aggregate(total=Sum('size_bytes'))['total'] or 0
+        by_type = {item['file_type']: item for item in type_histogram}
+        for file_type, prefix in cls.TYPE_FIELDS.items():
+            item = by_type.get(file_type, {})
+            setattr(stats, f'{prefix}_count', item.get('count', 0))
+            setattr(stats, f'{prefix}_size', item.get('total_size', 0))
         
-        downloads_files = files.filter(path__icontains='/Download/')
-        stats.downloads_count = downloads_files.count()
-        stats.downloads_size = downloads_files.aggregate(total=Sum('size_bytes'))['total'] or 0
+        # Stats par dossier, fichiers cachés et dossiers (agrégats conditionnels)
+        dcim = Q(path__icontains='/DCIM/')
+        downloads = Q(path__icontains='/Download/')
+        whatsapp = Q(path__icontains='/WhatsApp/') | Q(path__icontains='/WhatsApp Business/')
+        hidden = Q(is_hidden=True)
         
-        whatsapp_files = files.filter(Q(path__icontains='/WhatsApp/') | Q(path__icontains='/WhatsApp Business/'))
-        stats.whatsapp_count = whatsapp_files.count()
-        stats.whatsapp_size = whatsapp_files.aggregate(total=Sum('size_bytes'))['total'] or 0
+        totals = files.aggregate(
+            dcim_count=Count('id', filter=dcim),
+            dcim_size=Sum('size_bytes', filter=dcim),
+            downloads_count=Count('id', filter=downloads),
+            downloads_size=Sum('size_bytes', filter=downloads),
+            whatsapp_count=Count('id', filter=whatsapp),
+            whatsapp_size=Sum('size_bytes', filter=whatsapp),
+            hidden_files_count=Count('id', filter=hidden),
+            hidden_files_size=Sum('size_bytes', filter=hidden),
+            directories_count=Count('id', filter=Q(is_directory=True)),
+        )
+        for field, value in totals.items():
+            setattr(stats, field, value or 0)
         
-        # Fichiers cachés
-        hidden_files = files.filter(is_hidden=True)
-        stats.hidden_files_count = hidden_files.count()
-        stats.hidden_files_size = hidden_files.aggregate(total=Sum('size_bytes'))['total'] or 0
+        # Histogramme des extensions
+        stats.extension_histogram = list(
+            files.exclude(extension='').values('extension').annotate(
+                count=Count('id')
+            ).order_by('-count', 'extension')[:cls.EXTENSION_HISTOGRAM_SIZE]
+        )
         
-        # Top 10 plus gros fichiers
-        largest = files.order_by('-size_bytes')[:10].values('name', 'path', 'size_bytes', 'file_type')
+        # Dossiers parents les plus lourds
+        stats.folder_histogram = [
+            {
+                'path': item['parent_path'],
+                'count': item['count'],
+                'total_size': item['total_size'] or 0,
+            }
+            for item in files.exclude(parent_path='').values('parent_path').annotate(
+                count=Count('id'),
+                total_size=Sum('size_bytes')
+            ).order_by('-total_size')[:cls.FOLDER_HISTOGRAM_SIZE]
+        ]
+        
+        # Top N plus gros fichiers
+        largest = files.order_by('-size_bytes', '-id')[:cls.LARGEST_FILES_COUNT].values(
+            'id', 'name', 'path', 'size_bytes', 'file_type', 'extension'
+        )
         stats.largest_files = list(largest)
         
         stats.save()
-        return stats
\ No newline at end of file
+        return stats
+
+
+class DirectorySize(models.Model):
+    """
+    Taille récursive de chaque dossier d'un scan (comme `du`)
+    Table construite à l'upload : un dossier = une ligne, avec le total de
+    tout son sous-arbre. La navigation lit seulement les enfants d'un chemin.
+    """
+    file_list = models.ForeignKey(
+        FileList,
+        on_delete=models.CASCADE,
+        related_name='directories',
+        verbose_name="Liste de fichiers"
+    )
+    
+    # Chemins sans "/" final (la racine est "/")
+    path = models.CharField(max_length=1024, verbose_name="Chemin")
+    parent = models.CharField(max_length=1024, blank=True, verbose_name="Dossier parent")
+    name = models.CharField(max_length=512, blank=True, verbose_name="Nom")
+    depth = models.PositiveSmallIntegerField(default=0, verbose_name="Profondeur")
+    
+    # Sous-arbre complet
+    files_count = models.IntegerField(default=0, verbose_name="Fichiers (récursif)")
+    total_size = models.BigIntegerField(default=0, verbose_name="Taille (récursif)")
+    
+    # Fichiers directement dans le dossier
+    direct_files_count = models.IntegerField(default=0, verbose_name="Fichiers directs")
+    direct_size = models.BigIntegerField(default=0, verbose_name="Taille directe")
+    
+    class Meta:
+        verbose_name = "Taille de dossier"
+        verbose_name_plural = "Tailles de dossiers"
+        constraints = [
+            models.UniqueConstraint(fields=['file_list', 'path'], name='unique_directory_per_scan'),
+        ]
+        indexes = [
+            models.Index(fields=['file_list', 'parent', '-total_size']),
+        ]
+    
+    def __str__(self):
+        return f"{self.path} ({self.files_count} fichiers)"
+    
+    @staticmethod
+    def normalize(path):
+        """'/a/b/' -> '/a/b' ; '' ou '/' -> '/'"""
+        path = (path or '').rstrip('/')
+        return path or '/'
+    
+    @staticmethod
+    def parent_of(path):
+        if path == '/':
+            return ''
+        if '/' not in path:
+            return '/'
+        return path.rsplit('/', 1)[0] or '/'
+    
+    @classmethod
+    def build_for_file_list(cls, file_list, batch_size=1000):
+        """
+        (Re)construit l'arbre d'un scan en un seul passage sur ses fichiers
+        
+        Les fichiers sont d'abord agrégés par dossier direct, puis chaque
+        dossier reporte ses totaux sur ses ancêtres : coût proportionnel au
+        nombre de dossiers × profondeur, pas au nombre de fichiers.
+        """
+        direct = {}
+        rows = file_list.files.values_list(
+            'path', 'parent_path', 'size_bytes', 'is_directory'
+        ).order_by().iterator(chunk_size=5000)
+        
+        for path, parent_path, size_bytes, is_directory in rows:
+            if is_directory:
+                direct.setdefault(cls.normalize(path), [0, 0])
+                continue
+            if parent_path:
+                directory = cls.normalize(parent_path)
+            else:
+                directory = cls.parent_of(cls.normalize(path)) or '/'
+            totals = direct.setdefault(directory, [0, 0])
+            totals[0] += 1
+            totals[1] += size_bytes or 0
+        
+        # Report sur les ancêtres
+        tree = {}
+        for directory, (count, size) in direct.items():
+            node = directory
+            while node:
+                totals = tree.setdefault(node, [0, 0])
+                totals[0] += count
+                totals[1] += size
+                node = cls.parent_of(node)
+        
+        cls.objects.filter(file_list=file_list).delete()
+        cls.objects.bulk_create(
+            (
+                cls(
+                    file_list=file_list,
+                    path=path,
+                    parent=cls.parent_of(path),
+                    name=path.rsplit('/', 1)[-1] or '/',
+                    depth=0 if path == '/' else path.count('/'),
+                    files_count=count,
+                    total_size=size,
+                    direct_files_count=direct.get(path, [0, 0])[0],
+                    direct_size=direct.get(path, [0, 0])[1],
+                )
+                for path, (count, size) in tree.items()
+            ),
+            batch_size=batch_size
+        )
+        return len(tree)
+
+
+class DuplicateGroup(models.Model):
+    """
+    Groupe de fichiers en double dans un scan (même contenu, chemins différents)
+    Table construite à l'upload, comme DirectorySize : les rapports lisent
+    ces groupes au lieu de joindre la table des fichiers sur elle-même.
+    
+    - md5 / sha1 : doublons confirmés par l'empreinte
+    - size       : candidats sans empreinte (même taille et même extension),
+                   à confirmer par un scan avec generate_hashes
+    """
+    
+    MATCH_CHOICES = [
+        ('md5', 'Empreinte MD5'),
+        ('sha1', 'Empreinte SHA1'),
+        ('size', 'Taille identique (candidat)'),
+    ]
+    
+    # En dessous, un regroupement par taille seule produit trop de faux positifs
+    MIN_CANDIDATE_SIZE = 1024 * 1024
+    PATHS_SAMPLE_SIZE = 10
+    PATHS_LOOKUP_BATCH = 500
+    
+    file_list = models.ForeignKey(
+        FileList,
+        on_delete=models.CASCADE,
+        related_name='duplicate_groups',
+        verbose_name="Liste de fichiers"
+    )
+    match = models.CharField(max_length=10, choices=MATCH_CHOICES, verbose_name="Critère")
+    content_key = models.CharField(
+        max_length=100,
+        verbose_name="Clé de contenu",
+        help_text="Empreinte, ou taille:extension pour les candidats"
+    )
+    size_bytes = models.BigIntegerField(default=0, verbose_name="Taille d'une copie")
+    extension = models.CharField(max_length=50, blank=True, verbose_name="Extension")
+    copies = models.IntegerField(default=0, verbose_name="Nombre de copies")
+    reclaimable_bytes = models.BigIntegerField(
+        default=0,
+        verbose_name="Espace récupérable",
+        help_text="Taille × (copies - 1)"
+    )
+    paths = models.JSONField(default=list, help_text="Échantillon des chemins du groupe")
+    
+    class Meta:
+        verbose_name = "Groupe de doublons"
+        verbose_name_plural = "Groupes de doublons"
+        constraints = [
+            models.UniqueConstraint(fields=['file_list', 'match', 'content_key'], name='unique_duplicate_group_per_scan'),
+        ]
+        indexes = [
+            models.Index(fields=['file_list', '-reclaimable_bytes']),
+        ]
+    
+    def __str__(self):
+        return f"{self.copies} × {self.content_key} ({self.match})"
+    
+    @property
+    def confirmed(self):
+        return self.match != 'size'
+    
+    @classmethod
+    def build_for_file_list(cls, file_list, batch_size=1000):
+        """
+        (Re)construit les groupes de doublons d'un scan
+        
+        Un GROUP BY par critère, restreint au scan : MD5, puis SHA1 pour les
+        fichiers sans MD5, puis (taille, extension) pour les fichiers sans
+        empreinte d'au moins MIN_CANDIDATE_SIZE. Les chemins d'exemple sont
+        lus en une requête par critère, uniquement pour les fichiers groupés.
+        """
+        from django.db.models import Count, Max
+        
+        files = file_list.files.filter(is_directory=False, size_bytes__gt=0)
+        criteria = [
+            ('md5', files.exclude(md5_hash=''), ['md5_hash']),
+            ('sha1', files.filter(md5_hash='').exclude(sha1_hash=''), ['sha1_hash']),
+            ('size', files.filter(md5_hash='', sha1_hash='', size_bytes__gte=cls.MIN_CANDIDATE_SIZE),
+             ['size_bytes', 'extension']),
+        ]
+        
+        groups = []
+        for match, queryset, key_fields in criteria:
+            rows = queryset.values(*key_fields).annotate(
+                copies=Count('id'),
+                size=Max('size_bytes'),
+                ext=Max('extension'),
+            ).filter(copies__gt=1).order_by()
+            
+            by_key = {}
+            for row in rows:
+                key = tuple(row[field] for field in key_fields)
+                by_key[key] = cls(
+                    file_list=file_list,
+                    match=match,
+                    content_key=':'.join(str(value) for value in key),
+                    size_bytes=row['size'] or 0,
+                    extension=row['ext'] or '',
+                    copies=row['copies'],
+                    reclaimable_bytes=(row['size'] or 0) * (row['copies'] - 1),
+                )
+            if not by_key:
+                continue
+            
+            # Chemins d'exemple (le filtre sur la 1re colonne suffit à réduire la lecture),
+            # par lots de clés : un seul IN dépasserait la limite de variables de SQLite
+            first_values = sorted({key[0] for key in by_key})
+            for start in range(0, len(first_values), cls.PATHS_LOOKUP_BATCH):
+                members = queryset.filter(
+                    **{f'{key_fields[0]}__in': first_values[start:start + cls.PATHS_LOOKUP_BATCH]}
+                ).order_by('path').values_list(*key_fields, 'path')
+                for *key, path in members:
+                    group = by_key.get(tuple(key))
+                    if group is not None and len(group.paths) < cls.PATHS_SAMPLE_SIZE:
+                        group.paths.append(path)
+            groups.extend(by_key.values())
+        
+        cls.objects.filter(file_list=file_list).delete()
+        cls.objects.bulk_create(groups, batch_size=batch_size)
+        return len(groups)
+    
+    @classmethod
+    def latest_scans(cls):
+        """Groupes des derniers scans complétés de chaque appareil"""
+        return cls.objects.filter(
+            file_list_id__in=Device.objects.filter(
+                latest_completed_scan__isnull=False
+            ).values('latest_completed_scan')
+        )
+
+
+class FleetCounter(models.Model):
+    """
+    Compteur de flotte maintenu par deltas (voir api/counters.py)
+    
+    Portées : devices, scans, files (clés fixes), file_type, manufacturer,
+    seen_day (jour de dernière connexion) et device_files (fichiers par appareil).
+    """
+    scope = models.CharField(max_length=30, verbose_name="Portée")
+    key = models.CharField(max_length=255, blank=True, verbose_name="Clé")
+    count = models.BigIntegerField(default=0, verbose_name="Nombre")
+    size = models.BigIntegerField(default=0, verbose_name="Taille")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Compteur de flotte"
+        verbose_name_plural = "Compteurs de flotte"
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_fleet_counter'),
+        ]
+        indexes = [
+            models.Index(fields=['scope', '-count']),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope}:{self.key} = {self.count}"
+    
+    @classmethod
+    def apply(cls, deltas):
+        """
+        Applique des deltas {(portée, clé): (nombre, taille)}
+        
+        UPDATE count = count + n (pas de lecture-modification-écriture),
+        dans l'ordre des clés pour éviter les interblocages entre écritures
+        concurrentes. À appeler dans la transaction de l'écriture comptée.
+        """
+        from django.db import IntegrityError
+        from django.db.models import F
+        from django.utils import timezone
+        
+        for (scope, key), (count, size) in sorted(deltas.items()):
+            if not count and not size:
+                continue
+            counter = cls.objects.filter(scope=scope, key=key)
+            changes = {'count': F('count') + count, 'size': F('size') + size, 'updated_at': timezone.now()}
+            if counter.update(**changes):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(scope=scope, key=key, count=count, size=size)
+            except IntegrityError:
+                # Créé entre-temps par une écriture concurrente
+                counter.update(**changes)
+    
+    @classmethod
+    def reconcile(cls, dry_run=False):
+        """
+        Recalcule tous les compteurs depuis les tables et corrige la dérive
+        
+        Retourne {(portée, clé): (valeur stockée, valeur attendue)} pour
+        chaque compteur faux. Requêtes sur toutes les tables : à lancer en
+        tâche planifiée, pas dans une requête HTTP.
+        """
+        from .counters import expected_counters
+        
+        with transaction.atomic():
+            stored = {
+                (counter.scope, counter.key): counter
+                for counter in cls.objects.select_for_update()
+            }
+            expected = expected_counters(Device, FileList, FileItem)
+            
+            drift = {}
+            for key in set(stored) | set(expected):
+                counter = stored.get(key)
+                current = (counter.count, counter.size) if counter else (0, 0)
+                value = expected.get(key, (0, 0))
+                if current != value:
+                    drift[key] = (current, value)
+            
+            if not dry_run:
+                for (scope, key), (_, (count, size)) in drift.items():
+                    cls.objects.update_or_create(scope=scope, key=key, defaults={'count': count, 'size': size})
+                # Compteurs retombés à zéro (appareils ou jours disparus)
+                cls.objects.filter(count=0, size=0).exclude(scope__in=['devices', 'scans', 'files']).delete()
+        
+        return drift
+
+
+class DailyRollup(models.Model):
+    """
+    Agrégat journalier de la flotte (courbes de tendance)
+    
+    Une ligne par (jour, métrique, dimension, valeur). Écrit par la commande
+    rollup_daily : les graphiques lisent ces lignes au lieu de ré-agréger la
+    table Device, dont last_seen est écrasé à chaque connexion.
+    """
+    
+    METRIC_CHOICES = [
+        ('devices_seen', 'Appareils vus'),
+        ('devices_registered', 'Appareils enregistrés'),
+        ('devices_active', 'Appareils actifs'),
+        ('scans_completed', 'Scans terminés'),
+        ('files_scanned', 'Fichiers scannés'),
+    ]
+    
+    # Dimensions des métriques d'appareils (champ de Device) ; 'all' = toute la flotte
+    DEVICE_DIMENSIONS = ['manufacturer', 'android_version', 'sdk_level', 'network_type', 'country']
+    DEVICE_METRICS = ['devices_seen', 'devices_registered', 'devices_active']
+    
+    # Photographies de l'état courant : calculables seulement pour le jour même
+    SNAPSHOT_METRICS = ['devices_seen', 'devices_active']
+    
+    date = models.DateField(verbose_name="Jour")
+    metric = models.CharField(max_length=30, choices=METRIC_CHOICES, verbose_name="Métrique")
+    dimension = models.CharField(max_length=30, default='all', verbose_name="Dimension")
+    value = models.CharField(max_length=100, blank=True, verbose_name="Valeur")
+    count = models.BigIntegerField(default=0, verbose_name="Nombre")
+    size = models.BigIntegerField(default=0, verbose_name="Taille")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Agrégat journalier"
+        verbose_name_plural = "Agrégats journaliers"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'metric', 'dimension', 'value'], name='unique_daily_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['metric', 'dimension', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.metric}[{self.dimension}={self.value}] = {self.count}"
+    
+    @classmethod
+    def build_for_day(cls, day):
+        """
+        (Re)calcule les agrégats d'un jour, de façon idempotente
+        
+        - devices_registered, scans_completed, files_scanned : reconstruits
+          pour n'importe quel jour (created_at / scan_completed_at persistent)
+        - devices_seen, devices_active : état courant, écrits uniquement
+          pour le jour même (à lancer en fin de journée)
+        
+        Une requête GROUP BY par dimension d'appareil, une pour les scans.
+        """
+        from datetime import datetime, time, timedelta
+        from django.db.models import Count, Q, Sum
+        from django.db.models.functions import Coalesce
+        from django.utils import timezone
+        
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        end = start + timedelta(days=1)
+        metrics = ['devices_registered', 'scans_completed', 'files_scanned']
+        if day == timezone.localdate():
+            metrics += cls.SNAPSHOT_METRICS
+        
+        device_filters = {
+            'devices_seen': Q(last_seen__gte=start, last_seen__lt=end),
+            'devices_registered': Q(created_at__gte=start, created_at__lt=end),
+            'devices_active': Q(is_active=True),
+        }
+        aggregates = {
+            metric: Count('id', filter=device_filters[metric])
+            for metric in cls.DEVICE_METRICS if metric in metrics
+        }
+        
+        rows = []
+        
+        # Les lignes 'all' sont écrites même à zéro : elles marquent le jour comme calculé
+        def add(metric, dimension, value, count, size=0):
+            if count or size or dimension == 'all':
+                rows.append(cls(date=day, metric=metric, dimension=dimension,
+                                value='' if value is None else str(value), count=count, size=size))
+        
+        totals = Device.objects.aggregate(**aggregates)
+        for metric, count in totals.items():
+            add(metric, 'all', '', count)
+        
+        for dimension in cls.DEVICE_DIMENSIONS:
+            for row in Device.objects.values(dimension).annotate(**aggregates).order_by():
+                for metric in aggregates:
+                    add(metric, dimension, row[dimension], row[metric])
+        
+        # Scans terminés dans la journée et leurs fichiers par type
+        scans = FileList.objects.filter(status='completed').annotate(
+            completed_at=Coalesce('scan_completed_at', 'created_at')
+        ).filter(completed_at__gte=start, completed_at__lt=end)
+        add('scans_completed', 'all', '', scans.count())
+        
+        files = FileItem.objects.filter(file_list__in=scans.values('pk'), is_directory=False)
+        files_total, bytes_total = 0, 0
+        for row in files.values('file_type').annotate(count=Count('id'), total_size=Sum('size_bytes')).order_by():
+            add('files_scanned', 'file_type', row['file_type'] or 'other', row['count'], row['total_size'] or 0)
+            files_total += row['count']
+            bytes_total += row['total_size'] or 0
+        add('files_scanned', 'all', '', files_total, bytes_total)
+        
+        with transaction.atomic():
+            cls.objects.filter(date=day, metric__in=metrics).delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+
+class ExportJob(models.Model):
+    """
+    Export de scans en tâche de fond (sélections trop grosses pour l'admin)
+    Créé en attente par l'admin, exécuté par le worker run_export_jobs
+    (hors des workers web) ; le fichier est écrit par morceaux dans
+    MEDIA_ROOT/exports/
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('completed', 'Terminé'),
+        ('failed', 'Échoué'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('json', 'JSON'),
+        ('ndjson', 'NDJSON'),
+    ]
+    
+    scan_ids = models.JSONField(default=list, verbose_name="Scans exportés")
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='json', verbose_name="Format")
+    compress = models.BooleanField(default=True, verbose_name="Compression gzip")
+    requested_by = models.CharField(max_length=150, blank=True, verbose_name="Demandé par")
+    
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name="Statut"
+    )
+    
+    # Progression
+    total_rows = models.BigIntegerField(default=0, verbose_name="Fichiers à exporter")
+    rows_written = models.BigIntegerField(default=0, verbose_name="Fichiers écrits")
+    
+    file = models.FileField(upload_to='exports/', blank=True, verbose_name="Fichier")
+    error_message = models.TextField(blank=True, verbose_name="Message d'erreur")
+    
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Démarré le")
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="Terminé le")
+    # Rafraîchi à chaque paquet écrit : un export en cours qui ne bouge plus est orphelin
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Mis à jour le")
+    
+    class Meta:
+        verbose_name = "Export de scans"
+        verbose_name_plural = "Exports de scans"
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Export #{self.id} - {len(self.scan_ids)} scan(s) ({self.get_status_display()})"
+    
+    @property
+    def filename(self):
+        return f"scans_{self.id}.{self.export_format}" + ('.gz' if self.compress else '')
+    
+    @property
+    def progress(self):
+        """Pourcentage de fichiers écrits"""
+        if not self.total_rows:
+            return 100.0 if self.status == 'completed' else 0.0
+        return round(min(self.rows_written / self.total_rows, 1) * 100, 1)
+    
+    def run(self):
+        """
+        Écrit l'export sur disque, morceau par morceau
+        En cas d'erreur, le job est marqué en échec et l'exception relancée.
+        """
+        import os
+        from django.db.models import F
+        from django.utils import timezone
+        from .exports import iter_bytes, iter_scans_export
+        
+        now = timezone.now()
+        ExportJob.objects.filter(pk=self.pk).update(status='running', started_at=now, updated_at=now)
+        
+        def progress(rows):
+            ExportJob.objects.filter(pk=self.pk).update(
+                rows_written=F('rows_written') + rows,
+                updated_at=timezone.now()
+            )
+        
+        name = f"exports/{self.filename}"
+        path = self.file.storage.path(name)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            scans = FileList.objects.filter(pk__in=self.scan_ids)
+            with open(path, 'wb') as output:
+                for chunk in iter_bytes(iter_scans_export(scans, self.export_format, progress), self.compress):
+                    output.write(chunk)
+        except Exception as e:
+            ExportJob.objects.filter(pk=self.pk).update(
+                status='failed',
+                error_message=str(e),
+                completed_at=timezone.now()
+            )
+            raise
+        
+        ExportJob.objects.filter(pk=self.pk).update(
+            status='completed',
+            file=name,
+            completed_at=timezone.now()
+        )
+        self.refresh_from_db()
+    
+    @classmethod
+    def claim_next(cls):
+        """
+        Réserve le plus ancien export en attente (None s'il n'y en a pas)
+        La réservation est un UPDATE ... WHERE status='pending' : plusieurs
+        workers ne prennent jamais le même export.
+        """
+        from django.utils import timezone
+        
+        pending = cls.objects.filter(status='pending').order_by('created_at', 'id')
+        for pk in pending.values_list('pk', flat=True)[:10]:
+            now = timezone.now()
+            if cls.objects.filter(pk=pk, status='pending').update(status='running', started_at=now, updated_at=now):
+                return cls.objects.get(pk=pk)
+        return None
+    
+    @classmethod
+    def fail_stale(cls, stale_after):
+        """
+        Marque en échec les exports « en cours » sans progression depuis
+        `stale_after` (timedelta) : worker arrêté ou redémarré en plein export
+        """
+        from django.utils import timezone
+        
+        now = timezone.now()
+        return cls.objects.filter(status='running', updated_at__lt=now - stale_after).update(
+            status='failed',
+            error_message="Export interrompu (worker arrêté), à relancer",
+            completed_at=now,
+            updated_at=now
+        )
+
+# ===== FILE D'ATTENTE DES COMMANDES SERVEUR → TÉLÉPHONE =====
+
+class CommandFanOut(models.Model):
+    """
+    Diffusion d'une même commande à tous les appareils correspondant à un filtre
+    Les commandes sont insérées par lots ensemblistes (INSERT ... SELECT)
+    plutôt qu'appareil par appareil
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('completed', 'Terminé'),
+        ('failed', 'Échoué'),
+    ]
+    
+    command = models.CharField(max_length=50, verbose_name="Commande")
+    params = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Paramètres",
+        help_text="Paramètres communs à toutes les commandes de la diffusion"
+    )
+    priority = models.CharField(max_length=20, default='normal', verbose_name="Priorité")
+    expires_in = models.IntegerField(null=True, blank=True, verbose_name="Expiration (s)")
+    require_ack = models.BooleanField(default=True, verbose_name="Accusé requis")
+    
+    # Programmation : date absolue, ou heure locale de chaque appareil ("HH:MM")
+    schedule_at = models.DateTimeField(null=True, blank=True, verbose_name="Programmée pour")
+    local_time = models.CharField(
+        max_length=5,
+        blank=True,
+        verbose_name="Heure locale",
+        help_text="Exécution à cette heure dans le fuseau de chaque appareil"
+    )
+    
+    # Filtre de ciblage (manufacturer, android_version, is_active, last_seen, device_ids)
+    filters = models.JSONField(default=dict, blank=True, verbose_name="Filtres")
+    
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name="Statut"
+    )
+    
+    # Compteurs de progression
+    total_targets = models.IntegerField(default=0, verbose_name="Appareils ciblés")
+    queued_count = models.IntegerField(default=0, verbose_name="Commandes insérées")
+    coalesced_count = models.IntegerField(
+        default=0,
+        verbose_name="Commandes fusionnées",
+        help_text="Appareils ayant déjà la même commande en file"
+    )
+    
+    error_message = models.TextField(blank=True, verbose_name="Message d'erreur")
+    
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Démarré le")
+    progress_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Dernière progression",
+        help_text="Mis à jour après chaque lot inséré"
+    )
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="Terminé le")
+    
+    class Meta:
+        verbose_name = "Diffusion de commande"
+        verbose_name_plural = "Diffusions de commandes"
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Diffusion #{self.id} - {self.command} ({self.queued_count}/{self.total_targets})"
+    
+    def target_queryset(self):
+        """
+        Appareils ciblés par les filtres de la diffusion
+        """
+        from django.utils.dateparse import parse_datetime
+        
+        queryset = Device.objects.all()
+        filters = self.filters or {}
+        
+        if filters.get('device_ids'):
+            queryset = queryset.filter(id__in=filters['device_ids'])
+        if filters.get('manufacturer'):
+            queryset = queryset.filter(manufacturer__iexact=filters['manufacturer'])
+        if filters.get('android_version'):
+            queryset = queryset.filter(android_version=filters['android_version'])
+        if filters.get('is_active') is not None:
+            queryset = queryset.filter(is_active=filters['is_active'])
+        if filters.get('last_seen_after'):
+            queryset = queryset.filter(last_seen__gte=parse_datetime(filters['last_seen_after']))
+        if filters.get('last_seen_before'):
+            queryset = queryset.filter(last_seen__lt=parse_datetime(filters['last_seen_before']))
+        
+        return queryset
+    
+    @classmethod
+    def claim_next(cls):
+        """
+        Réserve la plus ancienne diffusion en attente (None s'il n'y en a pas)
+        Les diffusions sont créées en attente par l'API et l'admin, puis
+        insérées par le dispatcher (UPDATE ... WHERE status='pending' : deux
+        dispatchers ne prennent jamais la même).
+        """
+        from django.utils import timezone
+        
+        pending = cls.objects.filter(status='pending').order_by('created_at', 'id')
+        for pk in pending.values_list('pk', flat=True)[:10]:
+            now = timezone.now()
+            if cls.objects.filter(pk=pk, status='pending').update(status='running', started_at=now, progress_at=now):
+                return cls.objects.get(pk=pk)
+        return None
+    
+    @classmethod
+    def fail_stale(cls, stale_after):
+        """
+        Marque en échec les diffusions « en cours » sans progression depuis
+        plus de `stale_after` (timedelta) : dispatcher arrêté en pleine
+        insertion. Une grosse diffusion qui insère encore ses lots avance
+        progress_at à chaque lot et n'est pas concernée.
+        """
+        from django.db.models import Q
+        from django.utils import timezone
+        
+        now = timezone.now()
+        limit = now - stale_after
+        stale = Q(progress_at__lt=limit) | Q(progress_at__isnull=True, started_at__lt=limit)
+        return cls.objects.filter(stale, status='running').update(
+            status='failed',
+            error_message="Diffusion interrompue (dispatcher arrêté), commandes partiellement insérées",
+            completed_at=now
+        )
+    
+    def dispatch(self, batch_size=5000):
+        """
+        Insère une commande par appareil ciblé, par lots de `batch_size`
+        
+        Chaque lot est un unique INSERT ... SELECT borné par une plage d'id
+        (parcours par clé, sans OFFSET), les compteurs sont mis à jour
+        après chaque lot. Avec `local_time`, les appareils sont regroupés par
+        fuseau horaire : un lot ensembliste par fuseau, chacun programmé à la
+        prochaine occurrence de l'heure locale.
+        """
+        from django.utils import timezone
+        
+        now = timezone.now()
+        targets = self.target_queryset().order_by()
+        
+        self.total_targets = targets.count()
+        self.status = 'running'
+        self.started_at = self.started_at or now
+        self.progress_at = now
+        self.save(update_fields=['total_targets', 'status', 'started_at', 'progress_at'])
+        
+        try:
+            if self.local_time:
+                timezones = targets.values_list('timezone', flat=True).distinct()
+                for tz_name in list(timezones):
+                    schedule_at = next_local_occurrence(self.local_time, tz_name, now)
+                    self._insert_batches(targets.filter(timezone=tz_name), now, schedule_at, batch_size)
+            else:
+                schedule_at = self.schedule_at if self.schedule_at and self.schedule_at > now else None
+                self._insert_batches(targets, now, schedule_at, batch_size)
+        except Exception as e:
+            CommandFanOut.objects.filter(pk=self.pk).update(
+                status='failed',
+                error_message=str(e),
+                completed_at=timezone.now()
+            )
+            raise
+        
+        CommandFanOut.objects.filter(pk=self.pk).update(
+            status='completed',
+            completed_at=timezone.now()
+        )
+        self.refresh_from_db()
+        return self.queued_count
+    
+    def _insert_batches(self, targets, now, schedule_at, batch_size):
+        """
+        INSERT ... SELECT des commandes pour `targets`, par plages d'id
+        """
+        from django.db import connection, transaction
+        from django.db.models import F, Value, CharField, DateTimeField, Exists, OuterRef
+        from django.db.models.expressions import RawSQL
+        from django.db.models.functions import Concat, Cast
+        from django.utils import timezone
+        from datetime import timedelta
+        
+        start = schedule_at or now
+        expires_at = start + timedelta(seconds=self.expires_in) if self.expires_in else None
+        
+        # Fusion : les appareils ayant déjà cette commande en file ne reçoivent
+        # pas de doublon, leur commande existante est comptée comme fusionnée
+        coalesce_key = DeviceCommand.coalesce_key_for(self.command, self.params)
+        coalesce = bool(coalesce_key) and not schedule_at
+        all_targets = targets
+        if coalesce:
+            targets = targets.filter(~Exists(DeviceCommand.objects.filter(
+                device=OuterRef('pk'),
+                status='queued',
+                coalesce_key=coalesce_key
+            )))
+        
+        # Colonnes de la commande : valeurs communes à la diffusion, les autres
+        # colonnes reçoivent leur valeur par défaut Django. Un défaut None doit
+        # donner un NULL SQL typé : Value(None) sur un JSONField produirait le
+        # JSON 'null', que params__isnull ne voit pas
+        row = {
+            'device_id': F('id'),
+            'fanout_id': Value(self.id),
+            'command_id': Concat(Value(f"cmd_f{self.id}_"), Cast('id', CharField())),
+            'command': Value(self.command),
+            'priority': Value(self.priority),
+            'status': Value('scheduled' if schedule_at else 'queued'),
+            'coalesce_key': Value(coalesce_key),
+            'require_ack': Value(self.require_ack),
+            'schedule_at': Value(schedule_at, output_field=DateTimeField()),
+            'expires_at': Value(expires_at, output_field=DateTimeField()),
+            'created_at': Value(now, output_field=DateTimeField()),
+            'updated_at': Value(now, output_field=DateTimeField()),
+        }
+        for field in DeviceCommand._meta.concrete_fields:
+            if not field.primary_key and field.column not in row:
+                default = field.get_default()
+                if default is None:
+                    row[field.column] = Cast(RawSQL('NULL', ()), output_field=field)
+                else:
+                    row[field.column] = Value(default, output_field=field)
+        
+        table = DeviceCommand._meta.db_table
+        insert_sql = f"INSERT INTO {table} ({', '.join(row)}) "
+        # Filet de sécurité contre une fusion concurrente (contrainte unique)
+        conflict_sql = " ON CONFLICT DO NOTHING"
+        
+        last_id = 0
+        while True:
+            # Borne haute du lot courant (dernier id du lot)
+            bound = list(
+                all_targets.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[batch_size - 1:batch_size]
+            )
+            id_range = {'id__gt': last_id}
+            if bound:
+                id_range['id__lte'] = bound[0]
+            
+            # Horodatage du lot : le dispatcher rafraîchit sur updated_at
+            row['updated_at'] = Value(timezone.now(), output_field=DateTimeField())
+            select = targets.filter(**id_range).values_list(*row.values())
+            sql, params = select.query.sql_with_params()
+            
+            with transaction.atomic():
+                coalesced = 0
+                if coalesce:
+                    coalesced = DeviceCommand.objects.filter(
+                        device__in=all_targets.filter(**id_range).values('id'),
+                        status='queued',
+                        coalesce_key=coalesce_key
+                    ).update(coalesced_count=F('coalesced_count') + 1, updated_at=now)
+                with connection.cursor() as cursor:
+                    cursor.execute(insert_sql + sql + conflict_sql, params)
+                    inserted = max(cursor.rowcount, 0)
+                CommandFanOut.objects.filter(pk=self.pk).update(
+                    queued_count=F('queued_count') + inserted,
+                    coalesced_count=F('coalesced_count') + coalesced,
+                    progress_at=timezone.now()
+                )
+            
+            if not bound:
+                break
+            last_id = bound[0]
+
+
+def next_local_occurrence(local_time, tz_name, now):
+    """
+    Prochaine occurrence de l'heure locale `local_time` ("HH:MM") dans le
+    fuseau `tz_name` (fuseau par défaut du serveur si vide ou inconnu)
+    """
+    from datetime import datetime, timedelta, time
+    from zoneinfo import ZoneInfo
+    from django.utils import timezone
+    
+    try:
+        tz = ZoneInfo(tz_name) if tz_name else timezone.get_default_timezone()
+    except (ValueError, LookupError):
+        tz = timezone.get_default_timezone()
+    
+    hour, minute = (int(part) for part in local_time.split(':'))
+    local_now = now.astimezone(tz)
+    candidate = datetime.combine(local_now.date(), time(hour, minute), tzinfo=tz)
+    if candidate <= local_now:
+        candidate = datetime.combine(local_now.date() + timedelta(days=1), time(hour, minute), tzinfo=tz)
+    return candidate
+
+
+class DeviceCommand(models.Model):
+    """
+    Commande en file d'attente pour un appareil
+    Créée par send_command, request_file_list ou une diffusion (CommandFanOut)
+    """
+    
+    STATUS_CHOICES = [
+        ('scheduled', 'Programmée'),
+        ('queued', 'En file'),
+        ('delivered', 'Délivrée'),
+        ('received', 'Reçue'),
+        ('executing', 'En cours d\'exécution'),
+        ('done', 'Terminée'),
+        ('failed', 'Échouée'),
+        ('expired', 'Expirée'),
+        ('cancelled', 'Annulée'),
+        ('coalesced', 'Fusionnée'),
+    ]
+    
+    # Statuts que le téléphone peut remonter, dans l'ordre du cycle de vie
+    ACK_STATUSES = ['received', 'executing', 'done', 'failed']
+    FINAL_STATUSES = ['done', 'failed', 'expired', 'cancelled', 'coalesced']
+    
+    # Commandes fusionnables tant qu'elles ne sont pas délivrées :
+    # paramètres (et valeur par défaut) composant la clé de fusion.
+    # Seules deux demandes au résultat identique sont fusionnées : pour
+    # list_files, tous les paramètres du scan (hors scan_id) en font partie.
+    COALESCE_PARAMS = {
+        'list_files': {
+            'path': '/storage/emulated/0',
+            'max_depth': 10,
+            'include_hidden': False,
+            'file_types': [],
+            'min_size': None,
+            'max_size': None,
+            'generate_hashes': False,
+            'scan_media_metadata': True,
+        },
+        'sync': {'folder': ''},
+        'location': {},
+        'backup': {},
+    }
+    
+    PRIORITY_ORDER = ['low', 'normal', 'high', 'critical']
+    
+    device = models.ForeignKey(
+        Device,
+        on_delete=models.CASCADE,
+        related_name='commands',
+        verbose_name="Appareil"
+    )
+    fanout = models.ForeignKey(
+        CommandFanOut,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='commands',
+        verbose_name="Diffusion"
+    )
+    
+    command_id = models.CharField(max_length=100, unique=True, verbose_name="ID commande")
+    command = models.CharField(max_length=50, verbose_name="Commande")
+    params = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="Paramètres",
+        help_text="Vide pour une diffusion : les paramètres sont ceux de la diffusion"
+    )
+    priority = models.CharField(max_length=20, default='normal', verbose_name="Priorité")
+    require_ack = models.BooleanField(default=True, verbose_name="Accusé requis")
+    
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued',
+        verbose_name="Statut"
+    )
+    coalesce_key = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name="Clé de fusion",
+        help_text="Deux commandes en file avec la même clé pour un appareil sont fusionnées"
+    )
+    coalesced_count = models.IntegerField(default=0, verbose_name="Demandes fusionnées")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Expire le")
+    schedule_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Programmée pour",
+        help_text="Libérée dans la file par le dispatcher à cette date"
+    )
+    
+    # Résultat remonté par le téléphone
+    result = models.JSONField(null=True, blank=True, verbose_name="Résultat")
+    error_message = models.TextField(blank=True, verbose_name="Message d'erreur")
+    
+    # Cycle de vie : mise en file → délivrée → accusée → terminée
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Mise en file le")
+    delivered_at = models.DateTimeField(null=True, blank=True, verbose_name="Délivrée le")
+    acked_at = models.DateTimeField(null=True, blank=True, verbose_name="Accusée le")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Exécution le")
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="Terminée le")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Mis à jour le")
+    
+    class Meta:
+        verbose_name = "Commande"
+        verbose_name_plural = "Commandes"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['device', 'status']),
+            models.Index(fields=['fanout', 'status']),
+            models.Index(fields=['status', 'schedule_at']),
+        ]
+        constraints = [
+            # Au plus une commande en file par appareil et par clé de fusion
+            models.UniqueConstraint(
+                fields=['device', 'coalesce_key'],
+                condition=models.Q(status='queued') & ~models.Q(coalesce_key=''),
+                name='unique_queued_coalesce_key',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.command_id} - {self.command} ({self.status})"
+    
+    @classmethod
+    def coalesce_key_for(cls, command, params=None):
+        """
+        Clé de fusion d'une commande ('' si la commande n'est pas fusionnable)
+        """
+        if command not in cls.COALESCE_PARAMS:
+            return ''
+        params = params or {}
+        parts = [command]
+        for name, default in sorted(cls.COALESCE_PARAMS[command].items()):
+            value = params.get(name, default)
+            if isinstance(value, (list, tuple)):
+                # Listes comparées sans tenir compte de l'ordre
+                value = ','.join(sorted(str(item) for item in value))
+            parts.append(f"{name}={value}")
+        key = '|'.join(parts)
+        if len(key) > 255:
+            # Chemin très long : empreinte plutôt que troncature (pas de collision)
+            import hashlib
+            key = f"{command}|sha1={hashlib.sha1(key.encode()).hexdigest()}"
+        return key
+    
+    @classmethod
+    def enqueue(cls, device, command_id, command, params=None, priority='normal',
+                expires_in=None, require_ack=True, schedule_at=None):
+        """
+        Met une commande en file, ou la programme si schedule_at est dans le futur
+        L'expiration court à partir de la mise à disposition de la commande.
+        
+        Si une commande de même clé de fusion attend déjà d'être délivrée à
+        l'appareil, elle absorbe la nouvelle demande (priorité la plus haute,
+        expiration la plus tardive). Retourne (commande, created).
+        """
+        from django.db import IntegrityError, transaction
+        from django.utils import timezone
+        from datetime import timedelta
+        
+        now = timezone.now()
+        if schedule_at is not None and schedule_at <= now:
+            schedule_at = None
+        start = schedule_at or now
+        expires_at = start + timedelta(seconds=expires_in) if expires_in else None
+        coalesce_key = cls.coalesce_key_for(command, params)
+        
+        if coalesce_key and not schedule_at:
+            existing = cls._coalesce_into(device, coalesce_key, priority, expires_at)
+            if existing:
+                return existing, False
+        
+        try:
+            with transaction.atomic():
+                return cls.objects.create(
+                    device=device,
+                    command_id=command_id,
+                    command=command,
+                    params=params or {},
+                    priority=priority,
+                    require_ack=require_ack,
+                    status='scheduled' if schedule_at else 'queued',
+                    coalesce_key=coalesce_key,
+                    schedule_at=schedule_at,
+                    expires_at=expires_at,
+                ), True
+        except IntegrityError:
+            # Course avec une autre requête : la commande concurrente l'emporte
+            existing = cls._coalesce_into(device, coalesce_key, priority, expires_at)
+            if existing is None:
+                raise
+            return existing, False
+    
+    @classmethod
+    def _coalesce_into(cls, device, coalesce_key, priority, expires_at):
+        """Fusionne une demande dans la commande en file de même clé, si elle existe"""
+        from django.db.models import F
+        
+        existing = cls.objects.filter(
+            device=device,
+            coalesce_key=coalesce_key,
+            status='queued'
+        ).first()
+        if existing is None:
+            return None
+        
+        existing.coalesced_count += 1
+        updates = {'coalesced_count': F('coalesced_count') + 1}
+        if cls.PRIORITY_ORDER.index(priority) > cls.PRIORITY_ORDER.index(existing.priority):
+            existing.priority = updates['priority'] = priority
+        if existing.expires_at and (expires_at is None or expires_at > existing.expires_at):
+            existing.expires_at = updates['expires_at'] = expires_at
+        cls.objects.filter(pk=existing.pk).update(**updates)
+        return existing
+    
+    @property
+    def enqueued_at(self):
+        """Mise à disposition du téléphone (date de programmation le cas échéant)"""
+        return self.schedule_at or self.created_at
+    
+    def acknowledge(self, new_status, result=None, error_message=''):
+        """
+        Applique un accusé du téléphone (received, executing, done, failed)
+        
+        Les étapes sautées sont horodatées au même instant (un 'done' direct
+        vaut aussi accusé de réception). Une commande jamais récupérée par
+        fetch_commands garde delivered_at vide et ne produit pas de mesure
+        deliver_to_ack. Un accusé répété est sans effet.
+        Retourne False si la commande est déjà dans un état final ou si le
+        statut ferait reculer le cycle de vie.
+        """
+        from django.utils import timezone
+        from . import metrics
+        
+        if new_status == self.status:
+            return True
+        if self.status in self.FINAL_STATUSES:
+            return False
+        if self.status in self.ACK_STATUSES and \
+                self.ACK_STATUSES.index(new_status) < self.ACK_STATUSES.index(self.status):
+            return False
+        
+        now = timezone.now()
+        if not self.acked_at:
+            self.acked_at = now
+            if self.delivered_at:
+                metrics.record_command_latency(self.command, 'deliver_to_ack', self.acked_at - self.delivered_at)
+        if new_status in ['executing', 'done', 'failed'] and not self.started_at:
+            self.started_at = now
+        if new_status in ['done', 'failed']:
+            self.completed_at = now
+            self.result = result
+            self.error_message = error_message or ''
+            metrics.record_command_latency(self.command, 'ack_to_done', self.completed_at - self.acked_at)
+            metrics.record_command_latency(self.command, 'enqueue_to_done', self.completed_at - self.enqueued_at)
+        
+        self.status = new_status
+        self.save()
+        return True
+    
+    @property
+    def effective_params(self):
+        """Paramètres propres à la commande, sinon ceux de la diffusion"""
+        if self.params is None and self.fanout_id:
+            return self.fanout.params
+        return self.params or {}
@@ -0,0 +1,176 @@
+# api/pagination.py
+"""
+Pagination par curseur (keyset) pour les listes de l'API
+
+Contrairement à limit/offset, chaque page est lue à partir de la position
+de la précédente : WHERE (a, id) < (x, y) ORDER BY a DESC, id DESC LIMIT n.
+Avec un index sur (a, id), la 1000e page coûte autant que la première.
+Le curseur est opaque (base64) et contient la position + le sens de lecture.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination keyset sur `ordering` (le dernier champ doit être unique)
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    max_page_size = 1000
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Curseur invalide'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        def fetch(position, reverse, limit):
+            if position is not None:
+                queryset_page = queryset.filter(self.keyset_filter(position, reverse))
+            else:
+                queryset_page = queryset
+            return list(queryset_page.order_by(*self.get_ordering(reverse))[:limit])
+
+        return self.paginate_fetch(fetch, request, queryset.model)
+
+    def paginate_fetch(self, fetch, request, model):
+        """
+        Pagine une source quelconque
+
+        `fetch(position, reverse, limit)` retourne au plus `limit` objets
+        situés strictement après `position` dans l'ordre (inversé si `reverse`).
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, model)
+
+        rows = list(fetch(position, reverse, self.page_size + 1))
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, reverse=False):
+        if not reverse:
+            return list(self.ordering)
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def keyset_filter(self, position, reverse=False):
+        """
+        (a, b, c) après (x, y, z) : a > x OU (a = x ET b > y) OU ...
+
+        Le OU seul n'est pas utilisable comme borne d'index par PostgreSQL :
+        la condition redondante a >= x placée devant (ET) lui donne un début
+        de parcours sur l'index (a, b, c), quel que soit le sens de chaque champ.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+
+        if len(self.ordering) > 1:
+            first = self.ordering[0]
+            descending = first.startswith('-') != reverse
+            bound = f"{first.lstrip('-')}__{'lte' if descending else 'gte'}"
+            condition = Q(**{bound: position[0]}) & condition
+        return condition
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    # ===== CURSEURS =====
+
+    def encode_cursor(self, position, reverse):
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+        payload = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError(cursor)
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    # ===== LIENS ET RÉPONSE =====
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class DeviceCursorPagination(KeysetPagination):
+    """
+    Appareils, du plus récemment enregistré au plus ancien
+
+    Clé stable (id) : last_seen, réécrit à chaque heartbeat, ferait sauter
+    ou répéter des appareils d'une page à l'autre pendant le parcours.
+    """
+    ordering = ('-id',)
+    page_size = 50
+
+
+class ScanCursorPagination(KeysetPagination):
+    """Scans d'un appareil, du plus récent au plus ancien"""
+    ordering = ('-created_at', '-id')
+    page_size = 20
+
+
+class FileSizeCursorPagination(KeysetPagination):
+    """Fichiers, du plus gros au plus petit"""
+    ordering = ('-size_bytes', '-id')
+    page_size = 100
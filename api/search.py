@@ -0,0 +1,176 @@
+# api/search.py
+"""
+Index de recherche par sous-chaîne pour search_files
+
+Sur PostgreSQL, la recherche passe par les index GIN pg_trgm créés par la
+migration 0007 (UPPER(name) / UPPER(path) LIKE '%x%').
+
+Sur SQLite (développement), aucun index ne peut servir un LIKE '%x%' :
+pour une recherche limitée à un appareil, on construit en mémoire un index
+inversé de trigrammes de son scan courant. Un scan terminé est immuable tant
+qu'il n'est pas ré-uploadé, l'index est donc mis en cache et reconstruit
+uniquement quand le scan change. Une recherche sur toute la flotte demanderait
+un index par appareil et viderait le cache LRU (MAX_CACHED_SCANS) à chaque
+requête : elle reste un icontains en base.
+"""
+import heapq
+import threading
+from collections import OrderedDict
+
+from django.db import connection
+
+NGRAM_SIZE = 3
+MAX_CACHED_SCANS = 64
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    """Ensemble des n-grammes d'une chaîne (déjà en minuscules)"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def use_database_index():
+    """
+    True si la base sait servir la recherche par sous-chaîne elle-même
+    """
+    return connection.vendor == 'postgresql'
+
+
+class ScanSearchIndex:
+    """
+    Index inversé trigramme -> positions des fichiers d'un scan
+
+    Chaque fichier est gardé sous forme de tuple compact avec les colonnes
+    nécessaires aux filtres de search_files, ce qui permet de filtrer et de
+    trier sans retourner à la base.
+    """
+
+    ID, NAME, PATH, SIZE, FILE_TYPE, EXTENSION, IS_HIDDEN = range(7)
+
+    def __init__(self, rows):
+        self.rows = []
+        self.postings = {}
+        for file_id, name, path, size_bytes, file_type, extension, is_hidden in rows:
+            name = (name or '').lower()
+            path = (path or '').lower()
+            position = len(self.rows)
+            self.rows.append((file_id, name, path, size_bytes or 0, file_type,
+                              (extension or '').lower(), is_hidden))
+            for gram in ngrams(name) | ngrams(path):
+                self.postings.setdefault(gram, []).append(position)
+
+    @classmethod
+    def build(cls, file_list_id):
+        from .models import FileItem
+
+        rows = FileItem.objects.filter(
+            file_list_id=file_list_id, is_directory=False
+        ).values_list(
+            'id', 'name', 'path', 'size_bytes', 'file_type', 'extension', 'is_hidden'
+        ).iterator(chunk_size=5000)
+        return cls(rows)
+
+    def candidates(self, query):
+        """
+        Positions contenant tous les trigrammes de la requête
+
+        Les listes sont croisées de la plus courte à la plus longue ;
+        la sous-chaîne est ensuite vérifiée sur chaque candidat.
+        """
+        postings = []
+        for gram in ngrams(query):
+            posting = self.postings.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return result
+
+    def search(self, query, file_type=None, extension=None, min_size=None,
+               max_size=None, hidden_only=False):
+        """
+        Génère les lignes correspondant à la requête et aux filtres
+        """
+        query = query.lower()
+        extension = extension.lower() if extension else None
+
+        for position in self.candidates(query):
+            row = self.rows[position]
+            if query not in row[self.NAME] and query not in row[self.PATH]:
+                continue
+            if file_type and row[self.FILE_TYPE] != file_type:
+                continue
+            if extension and row[self.EXTENSION] != extension:
+                continue
+            if min_size and row[self.SIZE] < min_size:
+                continue
+            if max_size and row[self.SIZE] > max_size:
+                continue
+            if hidden_only and not row[self.IS_HIDDEN]:
+                continue
+            yield row
+
+
+class SearchIndexCache:
+    """
+    Cache LRU des index par scan, invalidé par (updated_at, total_files)
+    """
+
+    def __init__(self, max_scans=MAX_CACHED_SCANS):
+        self.max_scans = max_scans
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_list):
+        version = (file_list.updated_at, file_list.total_files)
+        with self._lock:
+            cached = self._indexes.get(file_list.id)
+            if cached and cached[0] == version:
+                self._indexes.move_to_end(file_list.id)
+                return cached[1]
+
+        # Construction hors verrou : les autres scans restent disponibles
+        index = ScanSearchIndex.build(file_list.id)
+        with self._lock:
+            self._indexes[file_list.id] = (version, index)
+            self._indexes.move_to_end(file_list.id)
+            while len(self._indexes) > self.max_scans:
+                self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, file_list_id):
+        with self._lock:
+            self._indexes.pop(file_list_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+search_index_cache = SearchIndexCache()
+
+
+def search_file_ids(file_lists, query, limit, position=None, reverse=False, **filters):
+    """
+    Identifiants des `limit` fichiers correspondant à la requête dans les
+    scans donnés, dans l'ordre (-size_bytes, -id) de search_files
+
+    `position` (taille, id) et `reverse` suivent la pagination keyset :
+    on ne garde que les fichiers situés après la position dans le sens de lecture.
+    """
+    position = tuple(position) if position is not None else None
+
+    def matches():
+        for file_list in file_lists:
+            for row in search_index_cache.get(file_list).search(query, **filters):
+                key = (row[ScanSearchIndex.SIZE], row[ScanSearchIndex.ID])
+                if position is None or (key > position if reverse else key < position):
+                    yield key
+
+    select = heapq.nsmallest if reverse else heapq.nlargest
+    return [file_id for _, file_id in select(limit, matches())]
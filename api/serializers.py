@@ -1,6 +1,108 @@
 # api/serializers.py
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
-from .models import Device, FileList, FileItem, FileScanStats
+from .models import (
+    Device, FileList, FileItem, FileScanStats, DuplicateGroup, DailyRollup, CommandFanOut, DeviceCommand
+)
+
+
+# ===== CHAMPS À LA DEMANDE (?fields= / ?omit=) =====
+
+class SparseFieldsMixin:
+    """
+    Restreint les champs sérialisés à ceux demandés par le client
+
+    ?fields=id,name,size_bytes garde uniquement ces champs, ?omit=device_info
+    retire ceux-là (noms inconnus ignorés). Les champs calculés retirés ne
+    sont pas évalués. `sparse_sources` indique les colonnes lues par chaque
+    SerializerMethodField, pour que sparse_queryset() ne charge (.only())
+    que les colonnes utiles.
+    """
+    sparse_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        requested, omitted = self.sparse_params(request)
+        if requested is None and not omitted:
+            return
+        for name in list(self.fields):
+            if (requested is not None and name not in requested) or name in omitted:
+                self.fields.pop(name)
+
+    @staticmethod
+    def sparse_params(request):
+        """(champs demandés ou None, champs omis) d'après la query string"""
+        def split(value):
+            return {name.strip() for name in value.split(',') if name.strip()}
+
+        fields = request.query_params.get('fields')
+        omit = request.query_params.get('omit')
+        return (split(fields) if fields else None), (split(omit) if omit else set())
+
+    @classmethod
+    def wants_field(cls, request, name):
+        """Le champ sera-t-il sérialisé ? (annotations coûteuses à la demande)"""
+        requested, omitted = cls.sparse_params(request)
+        return (requested is None or name in requested) and name not in omitted
+
+    def sparse_columns(self):
+        """
+        Colonnes du modèle nécessaires aux champs restants
+
+        None si la liste ne peut pas être établie (champ calculé sans
+        sparse_sources) : le queryset est alors laissé tel quel.
+        """
+        model = self.Meta.model
+        columns = set()
+        for name, field in self.fields.items():
+            if name in self.sparse_sources:
+                columns.update(self.sparse_sources[name])
+                continue
+            if field.source == '*':
+                return None
+            try:
+                model_field = model._meta.get_field(field.source_attrs[0])
+            except FieldDoesNotExist:
+                return None
+            # Relations inverses (files.count...) : pas de colonne
+            if model_field.concrete:
+                columns.add(model_field.name)
+        return columns
+
+    @classmethod
+    def sparse_queryset(cls, queryset, request, keep=()):
+        """
+        Applique .only() pour les champs demandés par la requête
+
+        `keep` : colonnes à charger en plus (champs d'ordre de la pagination
+        keyset, lus sur les objets pour construire le curseur). Les
+        select_related de premier niveau dont aucune colonne n'est demandée
+        sont abandonnés.
+        """
+        requested, omitted = cls.sparse_params(request)
+        if requested is None and not omitted:
+            return queryset
+
+        columns = cls(context={'request': request}).sparse_columns()
+        if columns is None:
+            return queryset
+        columns.update(field.lstrip('-') for field in keep)
+
+        related = queryset.query.select_related
+        if isinstance(related, dict):
+            kept = [
+                name for name in related
+                if any(column == name or column.startswith(f'{name}__') for column in columns)
+            ]
+            queryset = queryset.select_related(None)
+            if kept:
+                queryset = queryset.select_related(*kept)
+        return queryset.only(*columns)
+
 
 # ===== SERIALIZERS POUR LES APPAREILS (EXISTANTS) =====
 
@@ -116,7 +218,7 @@ class DeviceRegistrationSerializer(serializers.ModelSerializer):
         return value.strip()
 
 
-class DeviceDetailSerializer(serializers.ModelSerializer):
+class DeviceDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer pour afficher les détails d'un appareil (sans la clé)
     """
@@ -173,7 +275,7 @@ class DeviceHeartbeatSerializer(serializers.Serializer):
         return value.strip()
 
 
-class DeviceListSerializer(serializers.ModelSerializer):
+class DeviceListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer pour la liste des appareils (version légère)
     """
@@ -378,15 +480,180 @@ class ServerKeyRegenerateSerializer(serializers.Serializer):
     instructions = serializers.CharField()
 
 
+class DeviceCommandSerializer(serializers.ModelSerializer):
+    """
+    Serializer pour une commande en file d'attente
+    """
+    params = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = DeviceCommand
+        fields = [
+            'command_id',
+            'command',
+            'params',
+            'priority',
+            'require_ack',
+            'status',
+            'coalesced_count',
+            'schedule_at',
+            'expires_at',
+            'created_at',
+        ]
+        read_only_fields = fields
+    
+    def get_params(self, obj):
+        return obj.effective_params
+
+
+class CommandFetchSerializer(serializers.Serializer):
+    """
+    Serializer pour la récupération des commandes en attente par le téléphone
+    """
+    androidId = serializers.CharField(required=True)
+    limit = serializers.IntegerField(default=20, min_value=1, max_value=100)
+    
+    def validate_androidId(self, value):
+        if not value or not value.strip():
+            raise serializers.ValidationError("androidId requis")
+        return value.strip()
+
+
+class CommandAckSerializer(serializers.Serializer):
+    """
+    Serializer pour l'accusé / le résultat d'une commande envoyé par le téléphone
+    """
+    androidId = serializers.CharField(required=True)
+    command_id = serializers.CharField(required=True)
+    status = serializers.ChoiceField(choices=DeviceCommand.ACK_STATUSES)
+    result = serializers.JSONField(required=False, allow_null=True)
+    error_message = serializers.CharField(required=False, allow_blank=True)
+    
+    def validate_androidId(self, value):
+        if not value or not value.strip():
+            raise serializers.ValidationError("androidId requis")
+        return value.strip()
+
+
+class FanOutCommandSerializer(ServerCommandSerializer):
+    """
+    Serializer pour la diffusion d'une commande à une flotte d'appareils
+    Reprend la validation de ServerCommandSerializer et ajoute le filtre de ciblage
+    """
+    device_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        help_text="Limiter la diffusion à ces appareils"
+    )
+    manufacturer = serializers.CharField(required=False, allow_blank=True)
+    android_version = serializers.CharField(required=False, allow_blank=True)
+    is_active = serializers.BooleanField(
+        required=False,
+        allow_null=True,
+        default=True,
+        help_text="null = actifs et inactifs"
+    )
+    last_seen_after = serializers.DateTimeField(required=False, allow_null=True)
+    last_seen_before = serializers.DateTimeField(required=False, allow_null=True)
+    seen_within_hours = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        help_text="Raccourci pour last_seen_after = maintenant - N heures"
+    )
+    local_time = serializers.RegexField(
+        r'^([01]\d|2[0-3]):[0-5]\d$',
+        required=False,
+        allow_blank=True,
+        help_text="Heure locale HH:MM, programmée dans le fuseau de chaque appareil"
+    )
+    
+    FILTER_FIELDS = [
+        'device_ids', 'manufacturer', 'android_version', 'is_active',
+        'last_seen_after', 'last_seen_before',
+    ]
+    
+    def validate(self, data):
+        data = super().validate(data)
+        if data.get('local_time') and data.get('schedule_at'):
+            raise serializers.ValidationError(
+                "schedule_at et local_time sont mutuellement exclusifs"
+            )
+        return data
+    
+    def get_filters(self):
+        """Filtre de ciblage sérialisable en JSON"""
+        from django.utils import timezone
+        from datetime import timedelta
+        
+        data = self.validated_data
+        filters = {}
+        for field in self.FILTER_FIELDS:
+            value = data.get(field)
+            if value is None or value == '' or value == []:
+                continue
+            filters[field] = value.isoformat() if hasattr(value, 'isoformat') else value
+        
+        if data.get('seen_within_hours'):
+            since = timezone.now() - timedelta(hours=data['seen_within_hours'])
+            filters['last_seen_after'] = since.isoformat()
+        
+        return filters
+
+
+class CommandFanOutSerializer(serializers.ModelSerializer):
+    """
+    Serializer pour le suivi d'une diffusion (compteurs de progression)
+    """
+    fanout_id = serializers.IntegerField(source='id', read_only=True)
+    progress = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = CommandFanOut
+        fields = [
+            'fanout_id',
+            'command',
+            'params',
+            'priority',
+            'filters',
+            'status',
+            'schedule_at',
+            'local_time',
+            'total_targets',
+            'queued_count',
+            'coalesced_count',
+            'progress',
+            'error_message',
+            'created_at',
+            'started_at',
+            'progress_at',
+            'completed_at',
+        ]
+        read_only_fields = fields
+    
+    def get_progress(self, obj):
+        """Répartition des commandes de la diffusion par statut"""
+        from django.db.models import Count
+        
+        by_status = dict(
+            obj.commands.order_by().values_list('status').annotate(count=Count('id'))
+        )
+        return {
+            'by_status': by_status,
+            'percentage': round(obj.queued_count / obj.total_targets * 100, 2) if obj.total_targets else 0
+        }
+
+
 # ===== NOUVEAUX SERIALIZERS POUR LA GESTION DES FICHIERS =====
 
-class FileItemSerializer(serializers.ModelSerializer):
+class FileItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer pour un fichier individuel
     """
     size_mb = serializers.SerializerMethodField()
     size_formatted = serializers.SerializerMethodField()
     
+    sparse_sources = {'size_mb': ['size_bytes'], 'size_formatted': ['size_bytes']}
+    
     class Meta:
         model = FileItem
         fields = '__all__'
@@ -411,15 +678,22 @@ class FileItemSerializer(serializers.ModelSerializer):
             return f"{size/1024**3:.2f} Go"
 
 
-class FileListSerializer(serializers.ModelSerializer):
+class FileListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer pour une liste de fichiers (sans les items)
     """
     device_info = serializers.SerializerMethodField()
-    files_count = serializers.IntegerField(source='files.count', read_only=True)
+    files_count = serializers.SerializerMethodField()
     size_gb = serializers.SerializerMethodField()
     duration_formatted = serializers.SerializerMethodField()
     
+    sparse_sources = {
+        'device_info': ['device'],
+        'files_count': [],
+        'size_gb': ['total_size_bytes'],
+        'duration_formatted': ['scan_duration_ms'],
+    }
+    
     class Meta:
         model = FileList
         fields = [
@@ -451,6 +725,12 @@ class FileListSerializer(serializers.ModelSerializer):
             'android_version': obj.device.android_version
         }
     
+    def get_files_count(self, obj):
+        """Fichiers stockés (annoté par FileList.with_files_count)"""
+        if hasattr(obj, 'files_count'):
+            return obj.files_count
+        return obj.files.count()
+    
     def get_size_gb(self, obj):
         """Taille totale en GB"""
         if obj.total_size_bytes:
@@ -474,14 +754,14 @@ class FileListSerializer(serializers.ModelSerializer):
         return "N/A"
 
 
-class FileListDetailSerializer(serializers.ModelSerializer):
+class FileListDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
-    Serializer pour une liste de fichiers avec tous les détails
+    En-tête d'un scan (sans les fichiers)
+    
+    Les fichiers sont servis page par page par file_scan_items.
     """
     device_info = serializers.SerializerMethodField()
-    files = FileItemSerializer(many=True, read_only=True)
     stats = serializers.SerializerMethodField()
-    files_by_type = serializers.SerializerMethodField()
     size_gb = serializers.SerializerMethodField()
     
     class Meta:
@@ -503,33 +783,23 @@ class FileListDetailSerializer(serializers.ModelSerializer):
         }
     
     def get_stats(self, obj):
-        """Statistiques rapides par type de fichier"""
-        from django.db.models import Count, Sum
-        
-        stats = obj.files.values('file_type').annotate(
-            count=Count('id'),
-            total_size=Sum('size_bytes')
-        ).order_by('file_type')
+        """Statistiques par type de fichier (pré-calculées à l'upload)"""
+        breakdown = {
+            item['file_type']: {'count': item['count'], 'size_bytes': item['total_size']}
+            for item in FileScanStats.for_file_list(obj).type_histogram
+        }
         
         result = {}
-        for stat in stats:
-            result[stat['file_type']] = {
+        for file_type, stat in breakdown.items():
+            total_size = stat['size_bytes'] or 0
+            result[file_type] = {
                 'count': stat['count'],
-                'size_bytes': stat['total_size'],
-                'size_mb': round(stat['total_size'] / (1024 * 1024), 2) if stat['total_size'] else 0,
-                'size_gb': round(stat['total_size'] / (1024 ** 3), 2) if stat['total_size'] else 0
+                'size_bytes': total_size,
+                'size_mb': round(total_size / (1024 * 1024), 2),
+                'size_gb': round(total_size / (1024 ** 3), 2)
             }
         return result
     
-    def get_files_by_type(self, obj):
-        """Liste des fichiers groupés par type (limité)"""
-        result = {}
-        for file_type in ['image', 'video', 'audio', 'document', 'apk']:
-            files = obj.files.filter(file_type=file_type)[:10]
-            if files.exists():
-                result[file_type] = FileItemSerializer(files, many=True).data
-        return result
-    
     def get_size_gb(self, obj):
         """Taille totale en GB"""
         if obj.total_size_bytes:
@@ -537,6 +807,27 @@ class FileListDetailSerializer(serializers.ModelSerializer):
         return 0
 
 
+class FileScanItemsSerializer(serializers.Serializer):
+    """
+    Filtres des fichiers d'un scan (file_scan_items)
+    """
+    scan_id = serializers.CharField(required=True)
+    file_type = serializers.ChoiceField(
+        choices=[choice[0] for choice in FileItem.FILE_TYPE_CHOICES] + ['all'],
+        default='all',
+        required=False
+    )
+    extension = serializers.CharField(required=False, allow_blank=True)
+    parent_path = serializers.CharField(required=False, allow_blank=True,
+                                        help_text="Dossier parent exact")
+    query = serializers.CharField(required=False, allow_blank=True,
+                                  help_text="Sous-chaîne du nom")
+    min_size = serializers.IntegerField(required=False, min_value=0)
+    max_size = serializers.IntegerField(required=False, min_value=0)
+    hidden_only = serializers.BooleanField(default=False)
+    include_directories = serializers.BooleanField(default=False)
+
+
 class FileUploadSerializer(serializers.Serializer):
     """
     Serializer pour l'upload de la liste des fichiers par le téléphone
@@ -622,6 +913,105 @@ class FileSearchSerializer(serializers.Serializer):
     limit = serializers.IntegerField(default=100, min_value=1, max_value=1000)
 
 
+class DirectoryTreeSerializer(serializers.Serializer):
+    """
+    Navigation dans l'arbre des tailles de dossiers (directory_tree)
+    """
+    scan_id = serializers.CharField(required=False, help_text="Par défaut : dernier scan complété")
+    path = serializers.CharField(default='/', help_text="Dossier à détailler")
+    limit = serializers.IntegerField(default=100, min_value=1, max_value=1000)
+    include_files = serializers.BooleanField(default=False, help_text="Ajouter les plus gros fichiers directs")
+
+
+class ScanDiffSerializer(serializers.Serializer):
+    """
+    Options de scan_diff (les scans comparés sont passés en ?from= et ?to=)
+    """
+    output = serializers.ChoiceField(choices=['json', 'ndjson'], default='json')
+    limit = serializers.IntegerField(default=100, min_value=0, max_value=1000,
+                                     help_text="Changements détaillés en JSON (le flux NDJSON les donne tous)")
+
+
+class DuplicateGroupSerializer(serializers.ModelSerializer):
+    """
+    Groupe de doublons d'un scan
+    """
+    confirmed = serializers.BooleanField(read_only=True)
+    reclaimable_mb = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = DuplicateGroup
+        fields = ['id', 'match', 'confirmed', 'content_key', 'size_bytes', 'extension',
+                  'copies', 'reclaimable_bytes', 'reclaimable_mb', 'paths']
+    
+    def get_reclaimable_mb(self, obj):
+        return round(obj.reclaimable_bytes / (1024 * 1024), 2)
+
+
+class DuplicatesSerializer(serializers.Serializer):
+    """
+    Paramètres des rapports de doublons (duplicates / duplicates_report / fleet_duplicates)
+    """
+    scan_id = serializers.CharField(required=False, help_text="Par défaut : dernier scan complété")
+    match = serializers.ChoiceField(
+        choices=['all', 'confirmed', 'md5', 'sha1', 'size'],
+        default='all',
+        help_text="confirmed = md5 + sha1 (sans les candidats par taille)"
+    )
+    hash = serializers.ChoiceField(choices=['md5', 'sha1'], default='md5',
+                                   help_text="Empreinte comparée entre appareils (fleet_duplicates)")
+    min_devices = serializers.IntegerField(default=2, min_value=2)
+    limit = serializers.IntegerField(default=100, min_value=1, max_value=1000)
+
+
+class TrendsSerializer(serializers.Serializer):
+    """
+    Courbes de tendance lues dans les agrégats journaliers (trends)
+    """
+    metric = serializers.ChoiceField(
+        choices=[choice[0] for choice in DailyRollup.METRIC_CHOICES],
+        default='devices_seen'
+    )
+    dimension = serializers.ChoiceField(
+        choices=['all'] + DailyRollup.DEVICE_DIMENSIONS + ['file_type'],
+        default='all'
+    )
+    days = serializers.IntegerField(default=90, min_value=1, max_value=366)
+    top = serializers.IntegerField(default=10, min_value=1, max_value=50,
+                                   help_text="Nombre de valeurs détaillées (le reste est regroupé)")
+
+
+class RollupSerializer(serializers.Serializer):
+    """
+    Calcul à la demande des agrégats journaliers (rollup)
+    """
+    date = serializers.DateField(required=False, help_text="Par défaut : aujourd'hui")
+    backfill = serializers.IntegerField(default=0, min_value=0, max_value=366)
+
+
+class ExportSerializer(serializers.Serializer):
+    """
+    Paramètres des exports en flux (export_devices_csv / export_files_csv)
+    """
+    # (`format` est réservé par DRF à la négociation de contenu)
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    gzip = serializers.BooleanField(default=False)
+    device_id = serializers.IntegerField(required=False)
+    android_id = serializers.CharField(required=False)
+    is_active = serializers.BooleanField(required=False, allow_null=True, default=None)
+    
+    # Fichiers uniquement
+    scan_id = serializers.CharField(required=False)
+    file_type = serializers.ChoiceField(
+        choices=[choice[0] for choice in FileItem.FILE_TYPE_CHOICES] + ['all'],
+        default='all'
+    )
+    all_scans = serializers.BooleanField(
+        default=False,
+        help_text="Tous les scans (par défaut : dernier scan complété de chaque appareil)"
+    )
+
+
 # ===== COMMANDE SPÉCIFIQUE POUR LIST_FILES =====
 
 class ListFilesCommandSerializer(serializers.Serializer):
@@ -679,15 +1069,24 @@ class ListFilesCommandSerializer(serializers.Serializer):
 
 # ===== NOUVEAUX SERIALIZERS POUR L'INTERFACE ADMIN =====
 
-class DeviceWithFilesSerializer(serializers.ModelSerializer):
+class DeviceWithFilesSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer pour un appareil avec ses derniers scans
     """
     androidId = serializers.CharField(source='android_id', read_only=True)
     last_scan = serializers.SerializerMethodField()
-    scans_count = serializers.IntegerField(source='file_lists.count', read_only=True)
+    scans_count = serializers.SerializerMethodField()
     total_files_scanned = serializers.SerializerMethodField()
     
+    sparse_sources = {
+        'last_scan': [
+            'latest_completed_scan__scan_id', 'latest_completed_scan__scan_completed_at',
+            'latest_completed_scan__total_files', 'latest_completed_scan__total_size_bytes',
+        ],
+        'scans_count': [],
+        'total_files_scanned': [],
+    }
+    
     class Meta:
         model = Device
         fields = [
@@ -706,7 +1105,7 @@ class DeviceWithFilesSerializer(serializers.ModelSerializer):
     
     def get_last_scan(self, obj):
         """Dernier scan de l'appareil"""
-        last_scan = obj.file_lists.filter(status='completed').first()
+        last_scan = obj.latest_completed_scan
         if last_scan:
             return {
                 'scan_id': last_scan.scan_id,
@@ -716,8 +1115,16 @@ class DeviceWithFilesSerializer(serializers.ModelSerializer):
             }
         return None
     
+    def get_scans_count(self, obj):
+        """Nombre de scans (annoté par Device.with_scan_totals)"""
+        if hasattr(obj, 'scans_count'):
+            return obj.scans_count
+        return obj.file_lists.count()
+    
     def get_total_files_scanned(self, obj):
-        """Total des fichiers scannés (tous scans confondus)"""
+        """Total des fichiers scannés (scans complétés, annoté par Device.with_scan_totals)"""
+        if hasattr(obj, 'total_files_scanned'):
+            return obj.total_files_scanned
         from django.db.models import Sum
         result = obj.file_lists.filter(status='completed').aggregate(
             total=Sum('total_files')
@@ -1,3 +1,1955 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.db.models.functions import Collate
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+from .compression import CompressionMiddleware
+from .diff import FileRow, ScanDiff, iter_scan_rows, path_collation
+from .dispatcher import ScheduledCommandDispatcher
+from .exports import FILE_EXPORT_FIELDS, iter_csv, iter_rows, iter_scans_export
+from .fastjson import FastJSONParser, FastJSONRenderer
+from .management.commands.bench_endpoints import BENCHMARKS, Command as BenchEndpointsCommand
+from .models import (CommandFanOut, DailyRollup, Device, DeviceCommand, DirectorySize, DuplicateGroup, ExportJob,
+                     FileItem, FileList, FileScanStats, FleetCounter)
+from .pagination import ScanCursorPagination
+from .search import SearchIndexCache, search_index_cache
+from .throttling import GCRA
+from .views import DeviceViewSet
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ApiTestCase(TestCase):
+    """
+    Base des tests de l'API : caches vidés, superutilisateur connecté, appareil phone-1
+    
+    Les sous-classes ne gardent que leur mise en place propre : `login = False`
+    pour les endpoints publics du téléphone, `default_device = False` quand
+    le test crée sa propre flotte.
+    """
+    
+    login = True
+    default_device = True
+    
+    def setUp(self):
+        cache.clear()
+        search_index_cache.clear()
+        self.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        if self.login:
+            self.client.force_login(self.admin)
+        if self.default_device:
+            self.device = self.create_device('phone-1')
+    
+    def create_device(self, android_id, **fields):
+        return Device.objects.create(android_id=android_id, **{'model': 'Pixel', 'manufacturer': 'Google', **fields})
+    
+    def make_scan(self, scan_id, files=(), device=None, status='completed', **fields):
+        """
+        Scan créé directement en base, avec ses fichiers et le pointeur de dernier scan à jour
+        
+        `files` : champs de chaque FileItem ; name et parent_path sont déduits du chemin.
+        """
+        device = device or self.device
+        fields.setdefault('total_files', len(files))
+        with self.captureOnCommitCallbacks(execute=True):
+            scan = FileList.objects.create(device=device, scan_id=scan_id, status=status,
+                                           scan_requested_at=timezone.now(), **fields)
+            FileItem.objects.bulk_create([
+                FileItem(file_list=scan, **{'name': file['path'].rsplit('/', 1)[1],
+                                            'parent_path': file['path'].rsplit('/', 1)[0], **file})
+                for file in files
+            ])
+            device.refresh_latest_completed_scan()
+        return scan
+    
+    def upload(self, scan_id, files, android_id='phone-1', status='completed'):
+        """
+        Scan envoyé par upload_file_list comme le ferait le téléphone
+        
+        `files` : tuples (nom, taille, type) de fichiers placés dans /sdcard.
+        """
+        now = int(time.time() * 1000)
+        files = [{'path': f'/sdcard/{name}', 'parent_path': '/sdcard', 'name': name, 'size_bytes': size,
+                  'file_type': file_type} for name, size, file_type in files]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/devices/upload_file_list/', {
+                'androidId': android_id, 'scan_id': scan_id, 'status': status,
+                'scan_started_at': now - 1000, 'scan_completed_at': now, 'total_files': len(files),
+                'total_size_bytes': sum(file['size_bytes'] for file in files), 'files': files,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return FileList.objects.get(device__android_id=android_id, scan_id=scan_id)
+
+
+class GCRATests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_burst_then_steady_rate(self):
+        limiter = GCRA(capacity=3, period=60)
+        now = 1000.0
+        self.assertEqual([limiter.consume(cache, 'k', now) for _ in range(3)], [0, 0, 0])
+        # Rafale épuisée : une requête toutes les 20 s
+        self.assertAlmostEqual(limiter.consume(cache, 'k', now), 20.0)
+        self.assertAlmostEqual(limiter.consume(cache, 'k', now + 19), 1.0)
+        self.assertEqual(limiter.consume(cache, 'k', now + 20), 0)
+        self.assertGreater(limiter.consume(cache, 'k', now + 21), 0)
+        # Un autre compteur est indépendant
+        self.assertEqual(limiter.consume(cache, 'other', now), 0)
+    
+    def test_no_double_burst_across_window_edge(self):
+        limiter = GCRA(capacity=3, period=60)
+        # Rafale juste avant une frontière de minute, puis juste après
+        self.assertEqual([limiter.consume(cache, 'k', 1019.9) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.consume(cache, 'k', 1020.1), 19.8)
+        self.assertEqual(limiter.consume(cache, 'k', 1039.9), 0)
+    
+    def test_idle_counter_refills(self):
+        limiter = GCRA(capacity=2, period=60)
+        for _ in range(2):
+            limiter.consume(cache, 'k', 1000.0)
+        # Après une longue pause, la rafale est de nouveau disponible, sans plus
+        self.assertEqual([limiter.consume(cache, 'k', 5000.0) for _ in range(2)], [0, 0])
+        self.assertGreater(limiter.consume(cache, 'k', 5000.0), 0)
+    
+    def test_refund(self):
+        limiter = GCRA(capacity=1, period=60)
+        self.assertEqual(limiter.consume(cache, 'k', 1000.0), 0)
+        limiter.refund(cache, 'k', 1000.0)
+        self.assertEqual(limiter.consume(cache, 'k', 1000.0), 0)
+        self.assertGreater(limiter.consume(cache, 'k', 1000.0), 0)
+    
+    def test_concurrent_update_is_detected(self):
+        limiter = GCRA(capacity=3, period=60)
+        limiter.consume(cache, 'k', 1000.0)
+        stale = cache.get('k')
+        limiter.consume(cache, 'k', 1000.0)
+        current = cache.get('k')
+        # L'état lu a été remplacé entre-temps : pas d'écrasement
+        self.assertFalse(limiter._swap(cache, 'k', stale, 1020.0, 1000.0))
+        self.assertEqual(cache.get('k'), current)
+        
+        # État réservé par une autre requête qui n'a pas encore écrit : refus après les tentatives
+        cache.add(f"k:{current[0]}", 1)
+        self.assertEqual(limiter.consume(cache, 'k', 1000.0), limiter.interval)
+        self.assertEqual(cache.get('k'), current)
+
+
+@mock.patch('api.throttling.time.time', return_value=1000.0)
+class DeviceRateThrottleTests(ApiTestCase):
+    
+    login = False
+    
+    def heartbeat(self, android_id):
+        return self.client.post('/api/devices/heartbeat/', {'androidId': android_id},
+                                content_type='application/json')
+    
+    @override_settings(DEVICE_RATE_LIMITS={'heartbeat': {'android_id': '2/min'}})
+    def test_heartbeat_per_android_id(self, _time):
+        for _ in range(2):
+            self.assertEqual(self.heartbeat('phone-1').status_code, 200)
+        
+        response = self.heartbeat('phone-1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        
+        # Un autre appareil a son propre quota
+        self.assertEqual(self.heartbeat('phone-2').status_code, 404)
+    
+    @override_settings(DEVICE_RATE_LIMITS={'heartbeat': {'android_id': '1/min', 'ip': '2/min'}})
+    def test_android_id_refusal_does_not_spend_ip_quota(self, _time):
+        self.assertEqual(self.heartbeat('phone-1').status_code, 200)
+        for _ in range(3):
+            self.assertEqual(self.heartbeat('phone-1').status_code, 429)
+        # Les refus par android_id n'ont pas entamé le quota IP
+        self.assertEqual(self.heartbeat('phone-2').status_code, 404)
+        self.assertEqual(self.heartbeat('phone-3').status_code, 429)
+    
+    @override_settings(DEVICE_RATE_LIMITS={'register': {'ip': '1/hour'}})
+    def test_register_per_ip(self, _time):
+        response = self.client.post('/api/devices/register/', {'androidId': 'phone-2', 'model': 'A', 'manufacturer': 'B'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/devices/register/', {'androidId': 'phone-3', 'model': 'A', 'manufacturer': 'B'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3600')
+
+
+class ListingQueryCountTests(ApiTestCase):
+    """
+    Les listes coûtent un nombre constant de requêtes, quelle que soit la taille de la page
+    """
+    
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        self.devices = []
+    
+    def add_devices(self, count, scans=2, files=3):
+        for _ in range(count):
+            index = len(self.devices)
+            device = self.create_device(f'phone-{index}')
+            for scan_index in range(scans):
+                self.make_scan(f'scan-{index}-{scan_index}', [
+                    {'path': f'/sdcard/f{i}.jpg', 'size_bytes': 1024 * i, 'file_type': 'image', 'extension': 'jpg'}
+                    for i in range(files)
+                ], device=device)
+            self.devices.append(device)
+    
+    def get(self, url):
+        # Pas de réponse servie depuis le cache (les invalidations on_commit
+        # ne s'exécutent pas dans un TestCase)
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+    
+    def assert_constant(self, url, queries):
+        with self.assertNumQueries(queries):
+            self.get(url)
+        self.add_devices(5)
+        with self.assertNumQueries(queries):
+            self.get(url)
+    
+    def test_search(self):
+        self.add_devices(1)
+        # session, utilisateur, count, appareils annotés
+        self.assert_constant('/api/devices/search/?q=phone', 4)
+        self.assertEqual(len(self.get('/api/devices/search/?q=phone').json()['results']), 6)
+        result = self.get('/api/devices/search/?q=phone-0').json()['results'][0]
+        self.assertEqual((result['scans_count'], result['total_files_scanned']), (2, 6))
+    
+    def test_file_scans(self):
+        self.add_devices(1, scans=2)
+        url = f'/api/devices/{self.devices[0].pk}/file_scans/'
+        # session, utilisateur, appareil, page annotée, total des scans
+        with self.assertNumQueries(5):
+            self.get(url)
+        for scan_index in range(2, 12):
+            FileList.objects.create(device=self.devices[0], scan_id=f'extra-{scan_index}',
+                                    scan_requested_at=timezone.now())
+        with self.assertNumQueries(5):
+            scans = self.get(url).json()['scans']
+        self.assertEqual(len(scans), 12)
+        self.assertEqual(scans[-1]['files_count'], 3)
+    
+    def test_device_admin_changelist(self):
+        self.add_devices(1)
+        with CaptureQueriesContext(connection) as baseline:
+            self.get('/admin/api/device/')
+        self.add_devices(5)
+        with self.assertNumQueries(len(baseline)):
+            response = self.get('/admin/api/device/')
+        self.assertContains(response, '6<br><small>')
+    
+    def test_file_list_admin_changelist(self):
+        self.add_devices(1)
+        with CaptureQueriesContext(connection) as baseline:
+            self.get('/admin/api/filelist/')
+        self.add_devices(5)
+        with self.assertNumQueries(len(baseline)):
+            self.get('/admin/api/filelist/')
+
+
+@override_settings(
+    SECURE_SSL_REDIRECT=False,
+    DEVICE_RATE_LIMITS={},
+)
+class QueryBudgetTests(TestCase):
+    """
+    Budgets de requêtes SQL (nombre et temps cumulé) par endpoint
+
+    Toutes les actions de DeviceViewSet et toutes les listes de l'admin
+    sont appelées sur un jeu de données fixe ; chaque mesure est comparée
+    à query_budgets.json. Pour accepter de nouvelles valeurs (après une
+    évolution voulue) :
+
+        UPDATE_QUERY_BUDGETS=1 python manage.py test api.tests.QueryBudgetTests
+
+    puis relire et committer le diff du fichier.
+    """
+    BUDGETS_FILE = Path(__file__).resolve().parent / 'query_budgets.json'
+    # Le temps SQL varie d'une machine à l'autre : marge à l'enregistrement
+    TIME_HEADROOM = 3
+    TIME_FLOOR_MS = 50
+    
+    DEVICES = 6
+    FILES_PER_SCAN = 40
+    
+    # (nom, méthode, URL, corps) ; {device}, {scan}... remplis par seed_context().
+    # L'ordre compte : fetch_commands délivre la commande acquittée ensuite,
+    # destroy vient en dernier.
+    DEVICE_ENDPOINTS = [
+        ('register', 'post', '/api/devices/register/', {'androidId': 'budget-new', 'model': 'A1', 'manufacturer': 'Acme'}),
+        ('heartbeat', 'post', '/api/devices/heartbeat/', {'androidId': '{android_id}', 'battery_level': 50}),
+        ('upload_file_list', 'post', '/api/devices/upload_file_list/', '{upload}'),
+        ('fetch_commands', 'post', '/api/devices/fetch_commands/', {'androidId': '{android_id}'}),
+        ('command_ack', 'post', '/api/devices/command_ack/',
+         {'androidId': '{android_id}', 'command_id': '{command_id}', 'status': 'received'}),
+        ('list', 'get', '/api/devices/', None),
+        ('retrieve', 'get', '/api/devices/{device}/', None),
+        ('update', 'put', '/api/devices/{device}/', {'androidId': '{android_id}', 'model': 'Pixel 9'}),
+        ('partial_update', 'patch', '/api/devices/{device}/', {'battery_level': 42}),
+        ('active', 'get', '/api/devices/active/', None),
+        ('stats', 'get', '/api/devices/stats/', None),
+        ('search', 'get', '/api/devices/search/?q=budget', None),
+        ('info_complete', 'get', '/api/devices/{device}/info_complete/', None),
+        ('send_command', 'post', '/api/devices/{device}/send_command/', {'command': 'sync'}),
+        ('request_file_list', 'post', '/api/devices/{device}/request_file_list/', {}),
+        ('pending_commands', 'get', '/api/devices/{device}/pending_commands/', None),
+        ('regenerate_server_key', 'post', '/api/devices/{device}/regenerate_server_key/', {}),
+        ('fan_out', 'post', '/api/devices/fan_out/', {'command': 'sync', 'manufacturer': 'Google'}),
+        ('fan_out_status', 'get', '/api/devices/fan_out_status/?fanout_id={fanout}', None),
+        ('command_metrics', 'get', '/api/devices/command_metrics/', None),
+        ('cache_metrics', 'get', '/api/devices/cache_metrics/', None),
+        ('file_scans', 'get', '/api/devices/{device}/file_scans/', None),
+        ('file_scan_detail', 'get', '/api/devices/{device}/file_scan_detail/?scan_id={scan}', None),
+        ('file_scan_items', 'get', '/api/devices/{device}/file_scan_items/?scan_id={scan}', None),
+        ('file_stats', 'get', '/api/devices/{device}/file_stats/', None),
+        ('directory_tree', 'get', '/api/devices/{device}/directory_tree/?path=/sdcard', None),
+        ('scan_diff', 'get', '/api/devices/{device}/scan_diff/?from={previous_scan}&to={scan}', None),
+        ('duplicates', 'get', '/api/devices/{device}/duplicates/', None),
+        ('duplicates_report', 'get', '/api/devices/duplicates_report/', None),
+        ('fleet_duplicates', 'get', '/api/devices/fleet_duplicates/', None),
+        ('search_files', 'get', '/api/devices/search_files/?query=photo', None),
+        ('trends', 'get', '/api/devices/trends/?days=7', None),
+        ('rollup', 'post', '/api/devices/rollup/', {}),
+        ('deactivate', 'post', '/api/devices/{device}/deactivate/', {}),
+        ('activate', 'post', '/api/devices/{device}/activate/', {}),
+        ('destroy', 'delete', '/api/devices/{last_device}/', None),
+    ]
+    
+    @classmethod
+    def upload_payload(cls, android_id, scan_id, shift=0):
+        now = int(time.time() * 1000)
+        files = [
+            {
+                'path': f'/sdcard/DCIM/photo_{i + shift}.jpg', 'parent_path': '/sdcard/DCIM',
+                'name': f'photo_{i + shift}.jpg', 'extension': 'jpg', 'file_type': 'image',
+                'size_bytes': (i + 1) * 1024 * 1024, 'md5_hash': f'{i:032x}',
+            }
+            for i in range(cls.FILES_PER_SCAN)
+        ]
+        return {
+            'androidId': android_id, 'scan_id': scan_id, 'status': 'completed',
+            'scan_started_at': now - 1000, 'scan_completed_at': now,
+            'total_files': len(files), 'total_size_bytes': sum(f['size_bytes'] for f in files),
+            'files': files,
+        }
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('budget', 'budget@example.com', 'secret')
+        cls.devices = []
+        for index in range(cls.DEVICES):
+            device = Device.objects.create(
+                android_id=f'budget-{index}', model='Pixel', manufacturer='Google', timezone='Europe/Paris'
+            )
+            for scan_index in range(2):
+                response = cls.client_class().post(
+                    '/api/devices/upload_file_list/',
+                    cls.upload_payload(device.android_id, f'budget-{index}-{scan_index}', shift=scan_index * 5),
+                    content_type='application/json'
+                )
+                assert response.status_code == 201, response.content
+            cls.devices.append(device)
+        cls.command = DeviceCommand.enqueue(cls.devices[0], 'cmd-budget', 'sync')[0]
+        cls.fanout = CommandFanOut.objects.create(command='sync', filters={'manufacturer': 'Google'})
+        cls.fanout.dispatch()
+    
+    def setUp(self):
+        self.client.force_login(self.admin)
+    
+    def seed_context(self):
+        device = self.devices[0]
+        return {
+            'device': device.pk,
+            'android_id': device.android_id,
+            'scan': 'budget-0-1',
+            'previous_scan': 'budget-0-0',
+            'last_device': self.devices[-1].pk,
+            'command_id': self.command.command_id,
+            'fanout': self.fanout.pk,
+        }
+    
+    def fill(self, value, context):
+        if value == '{upload}':
+            return self.upload_payload(context['android_id'], 'budget-0-new', shift=2)
+        if isinstance(value, str):
+            return value.format(**context)
+        if isinstance(value, dict):
+            return {key: self.fill(item, context) for key, item in value.items()}
+        return value
+    
+    def measure(self, method, url, data=None):
+        """(requêtes, temps SQL en ms) d'un appel, cache des réponses vidé"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            if data is None:
+                response = getattr(self.client, method)(url)
+            else:
+                response = getattr(self.client, method)(url, json.dumps(data), content_type='application/json')
+        self.assertLess(response.status_code, 400, f'{method.upper()} {url} : {response.status_code}')
+        sql_ms = sum(float(query['time']) for query in captured.captured_queries) * 1000
+        return len(captured), round(sql_ms, 2)
+    
+    def check_budgets(self, measurements):
+        budgets = json.loads(self.BUDGETS_FILE.read_text()) if self.BUDGETS_FILE.exists() else {}
+        
+        if os.environ.get('UPDATE_QUERY_BUDGETS'):
+            for name, (queries, sql_ms) in measurements.items():
+                budgets[name] = {
+                    'queries': queries,
+                    'time_ms': max(round(sql_ms * self.TIME_HEADROOM), self.TIME_FLOOR_MS),
+                }
+            self.BUDGETS_FILE.write_text(json.dumps(dict(sorted(budgets.items())), indent=2) + '\n')
+            return
+        
+        failures = []
+        for name, (queries, sql_ms) in measurements.items():
+            budget = budgets.get(name)
+            if budget is None:
+                failures.append(f'{name} : pas de budget (UPDATE_QUERY_BUDGETS=1 pour l\'enregistrer)')
+                continue
+            if queries > budget['queries']:
+                failures.append(f'{name} : {queries} requêtes (budget {budget["queries"]})')
+            if sql_ms > budget['time_ms']:
+                failures.append(f'{name} : {sql_ms} ms de SQL (budget {budget["time_ms"]} ms)')
+        if failures:
+            self.fail('Budgets de requêtes dépassés :\n' + '\n'.join(failures))
+    
+    def test_every_action_is_budgeted(self):
+        actions = {action.__name__ for action in DeviceViewSet.get_extra_actions()}
+        actions |= {'list', 'retrieve', 'update', 'partial_update', 'destroy'}
+        self.assertEqual(actions - {name for name, *_ in self.DEVICE_ENDPOINTS}, set())
+    
+    def test_device_endpoints(self):
+        context = self.seed_context()
+        measurements = {}
+        for name, method, url, data in self.DEVICE_ENDPOINTS:
+            measurements[f'devices.{name}'] = self.measure(method, self.fill(url, context), self.fill(data, context))
+        self.check_budgets(measurements)
+    
+    def test_admin_changelists(self):
+        measurements = {}
+        for model in admin.site._registry:
+            if model._meta.app_label != 'api':
+                continue
+            url = reverse(f'admin:api_{model._meta.model_name}_changelist')
+            measurements[f'admin.{model._meta.model_name}'] = self.measure('get', url)
+        self.check_budgets(measurements)
+
+
+class DeviceAdminActionTests(ApiTestCase):
+    """
+    Les actions de masse de l'admin maintiennent les compteurs de flotte
+    """
+    
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        self.devices = [self.create_device(f'phone-{i}') for i in range(2)]
+    
+    def run_action(self, action):
+        response = self.client.post('/admin/api/device/', {
+            'action': action,
+            '_selected_action': [device.pk for device in self.devices],
+        })
+        self.assertEqual(response.status_code, 302)
+    
+    def stats(self):
+        cache.clear()
+        return self.client.get('/api/devices/stats/').json()['devices']
+    
+    def test_deactivate_then_activate(self):
+        self.assertEqual(self.stats()['active'], 2)
+        self.run_action('deactivate_devices')
+        self.assertEqual(self.stats()['active'], 0)
+        self.assertEqual(self.stats()['inactive'], 2)
+        self.run_action('activate_devices')
+        self.assertEqual(self.stats()['active'], 2)
+    
+    def test_action_invalidates_cached_responses(self):
+        device = self.devices[0]
+        self.assertEqual(self.client.get('/api/devices/stats/').json()['devices']['active'], 2)
+        self.assertTrue(self.client.get(f'/api/devices/{device.pk}/info_complete/').json()['is_active'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_action('deactivate_devices')
+        # Sans vider le cache : les versions ont été incrémentées
+        self.assertEqual(self.client.get('/api/devices/stats/').json()['devices']['active'], 0)
+        self.assertFalse(self.client.get(f'/api/devices/{device.pk}/info_complete/').json()['is_active'])
+    
+    def test_mark_as_emulator(self):
+        self.run_action('mark_as_emulator')
+        self.run_action('mark_as_emulator')
+        self.assertEqual(self.stats()['emulators'], 2)
+        self.assertEqual(FleetCounter.reconcile(dry_run=True), {})
+
+
+class ConditionalResponseTests(ApiTestCase):
+    """
+    GET conditionnels (ETag / Last-Modified) des vues d'appareil et de scan
+    """
+    
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/devices/{self.device.pk}/'
+    
+    def test_retrieve_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_admin_bulk_action_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/api/device/', {
+                'action': 'deactivate_devices', '_selected_action': [self.device.pk],
+            })
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['is_active'])
+    
+    def test_update_fields_save_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.device.is_emulator = True
+        self.device.save(update_fields=['is_emulator'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def make_scan(self, scan_id):
+        return super().make_scan(scan_id, [{'path': '/sdcard/a.jpg', 'size_bytes': 10}])
+    
+    def test_scan_views_not_modified(self):
+        self.make_scan('scan-1')
+        for action in ['file_scan_detail', 'file_scan_items', 'file_stats']:
+            with self.subTest(action=action):
+                url = f'/api/devices/{self.device.pk}/{action}/?scan_id=scan-1'
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('no-cache', response['Cache-Control'])
+                # 304 décidé sur les validateurs seuls : session, utilisateur, scan, version
+                with self.assertNumQueries(3):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                
+                other = self.client.get(f'{url}&limit=1')
+                self.assertNotEqual(other['ETag'], response['ETag'])
+    
+    def test_rescan_changes_etag(self):
+        scan = self.make_scan('scan-1')
+        url = f'/api/devices/{self.device.pk}/file_stats/'
+        etag = self.client.get(url)['ETag']
+        
+        # Ré-upload du même scan
+        with self.captureOnCommitCallbacks(execute=True):
+            scan.total_files = 2
+            scan.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        
+        # Nouveau scan complété : file_stats sans scan_id suit le pointeur
+        etag = response['ETag']
+        self.make_scan('scan-2')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['scan']['scan_id'], 'scan-2')
+    
+    def test_missing_scan_id_is_not_revalidated(self):
+        self.make_scan('scan-1')
+        # Sans scan_id, detail et items répondent 400 : pas de 304 sur le dernier scan
+        for action in ['file_scan_detail', 'file_scan_items']:
+            with self.subTest(action=action):
+                response = self.client.get(f'/api/devices/{self.device.pk}/{action}/', HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, 400)
+                self.assertNotIn('ETag', response)
+        # file_stats suit le dernier scan complété
+        response = self.client.get(f'/api/devices/{self.device.pk}/file_stats/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 304)
+    
+    def test_unknown_scan_has_no_etag(self):
+        response = self.client.get(f'/api/devices/{self.device.pk}/file_scan_detail/?scan_id=missing',
+                                   HTTP_IF_NONE_MATCH='"anything"')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class CommandCoalescingTests(ApiTestCase):
+    """
+    Fusion des commandes en attente (clé de fusion, file et dispatcher)
+    """
+    
+    def request_file_list(self, **params):
+        response = self.client.post(f'/api/devices/{self.device.pk}/request_file_list/', params,
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+    
+    def test_coalesce_key_covers_scan_params(self):
+        key = DeviceCommand.coalesce_key_for
+        self.assertEqual(key('list_files', {'scan_id': 'a'}), key('list_files', {'scan_id': 'b', 'max_depth': 10}))
+        self.assertEqual(key('list_files', {'file_types': ['image', 'video']}),
+                         key('list_files', {'file_types': ['video', 'image']}))
+        for params in [{'generate_hashes': True}, {'include_hidden': True},
+                       {'file_types': ['image']}, {'max_depth': 3}]:
+            self.assertNotEqual(key('list_files', {}), key('list_files', params), params)
+        self.assertLessEqual(len(key('list_files', {'path': '/x' * 300})), 255)
+        self.assertNotEqual(key('list_files', {'path': '/x' * 300}), key('list_files', {'path': '/x' * 301}))
+        self.assertEqual(key('reboot', {}), '')
+    
+    def test_identical_scans_are_coalesced(self):
+        first = self.request_file_list()
+        second = self.request_file_list()
+        self.assertEqual(first['status'], 'command_sent')
+        self.assertEqual(second['status'], 'command_coalesced')
+        self.assertEqual(second['scan']['scan_id'], first['scan']['scan_id'])
+        self.assertEqual(second['command']['coalesced_count'], 1)
+        self.assertEqual(DeviceCommand.objects.filter(status='queued').count(), 1)
+    
+    def test_different_scan_params_are_not_coalesced(self):
+        self.request_file_list()
+        response = self.request_file_list(generate_hashes=True)
+        self.assertEqual(response['status'], 'command_sent')
+        self.assertEqual(DeviceCommand.objects.filter(status='queued').count(), 2)
+    
+    def test_released_duplicate_cancels_its_scan(self):
+        queued = self.request_file_list()
+        schedule_at = timezone.now() + timedelta(minutes=5)
+        scheduled = self.request_file_list(schedule_at=schedule_at.isoformat())
+        self.assertEqual(scheduled['status'], 'command_sent')
+        
+        dispatcher = ScheduledCommandDispatcher()
+        dispatcher.load_window(now=schedule_at - timedelta(seconds=1))
+        self.assertEqual(dispatcher.release_due(now=schedule_at), 0)
+        
+        command = DeviceCommand.objects.get(command_id=scheduled['command']['command_id'])
+        self.assertEqual(command.status, 'coalesced')
+        scan = FileList.objects.get(scan_id=scheduled['scan']['scan_id'])
+        self.assertEqual(scan.status, 'cancelled')
+        self.assertIn(queued['command']['command_id'], scan.error_message)
+        self.assertEqual(FileList.objects.get(scan_id=queued['scan']['scan_id']).status, 'scanning')
+
+
+class ScheduledCommandDispatcherTests(ApiTestCase):
+    """
+    Chargement par fenêtre, rafraîchissement, libération et reprise du dispatcher
+    """
+    
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        self.counter = 0
+    
+    def schedule(self, seconds, command='reboot'):
+        self.counter += 1
+        command, _ = DeviceCommand.enqueue(self.device, f'cmd_{self.counter}', command,
+                                           schedule_at=self.now + timedelta(seconds=seconds))
+        return command
+    
+    def status(self, command):
+        return DeviceCommand.objects.get(pk=command.pk).status
+    
+    def test_load_window_and_release(self):
+        soon, later, outside = self.schedule(10), self.schedule(60), self.schedule(600)
+        dispatcher = ScheduledCommandDispatcher(window_seconds=300)
+        self.assertEqual(dispatcher.load_window(self.now), 2)
+        
+        self.assertEqual(dispatcher.release_due(self.now + timedelta(seconds=30)), 1)
+        self.assertEqual(self.status(soon), 'queued')
+        self.assertEqual(self.status(later), 'scheduled')
+        self.assertEqual(dispatcher.release_due(self.now + timedelta(seconds=60)), 1)
+        self.assertEqual(self.status(later), 'queued')
+        self.assertEqual(self.status(outside), 'scheduled')
+        self.assertEqual(dispatcher.released_count, 2)
+    
+    def test_refresh_adds_new_commands_once(self):
+        dispatcher = ScheduledCommandDispatcher()
+        dispatcher.load_window(self.now)
+        command = self.schedule(10)
+        self.assertEqual(dispatcher.refresh(self.now + timedelta(seconds=1)), 1)
+        self.assertEqual(dispatcher.refresh(self.now + timedelta(seconds=2)), 0)
+        self.assertEqual(dispatcher.release_due(self.now + timedelta(seconds=10)), 1)
+        self.assertEqual(self.status(command), 'queued')
+    
+    def test_refresh_catches_late_commit(self):
+        # Transaction ouverte avant le chargement, validée après : invisible
+        # au chargement, horodatée avant lui, d'id inférieur aux commandes vues
+        command = self.schedule(10)
+        DeviceCommand.objects.filter(pk=command.pk).update(status='cancelled')
+        dispatcher = ScheduledCommandDispatcher(overlap_seconds=30)
+        self.schedule(15)
+        self.assertEqual(dispatcher.load_window(self.now), 1)
+        DeviceCommand.objects.filter(pk=command.pk).update(
+            status='scheduled', updated_at=self.now - timedelta(seconds=5)
+        )
+        self.assertEqual(dispatcher.refresh(self.now + timedelta(seconds=1)), 1)
+        
+        stale = self.schedule(20)
+        DeviceCommand.objects.filter(pk=stale.pk).update(updated_at=self.now - timedelta(minutes=5))
+        self.assertEqual(dispatcher.refresh(self.now + timedelta(seconds=2)), 0)
+    
+    def test_restart_releases_overdue_commands(self):
+        overdue = self.schedule(10)
+        ScheduledCommandDispatcher().load_window(self.now)
+        # Arrêt avant l'échéance, redémarrage après : la commande en retard
+        # est chargée et libérée immédiatement
+        restarted = ScheduledCommandDispatcher()
+        later = self.now + timedelta(minutes=10)
+        self.assertEqual(restarted.load_window(later), 1)
+        self.assertEqual(restarted.release_due(later), 1)
+        self.assertEqual(self.status(overdue), 'queued')
+    
+    def test_release_is_idempotent_across_dispatchers(self):
+        self.schedule(10)
+        first, second = ScheduledCommandDispatcher(), ScheduledCommandDispatcher()
+        first.load_window(self.now)
+        second.load_window(self.now)
+        due = self.now + timedelta(seconds=10)
+        self.assertEqual(first.release_due(due), 1)
+        self.assertEqual(second.release_due(due), 0)
+        self.assertEqual(DeviceCommand.objects.filter(status='queued').count(), 1)
+    
+    def test_scheduled_fan_out_is_refreshed(self):
+        dispatcher = ScheduledCommandDispatcher()
+        dispatcher.load_window(self.now)
+        fanout = CommandFanOut.objects.create(command='reboot', schedule_at=timezone.now() + timedelta(seconds=10))
+        fanout.dispatch()
+        self.assertEqual(dispatcher.refresh(timezone.now()), 1)
+        self.assertEqual(dispatcher.release_due(fanout.schedule_at), 1)
+
+
+@override_settings(DEVICE_RATE_LIMITS={})
+class KeysetPaginationTests(ApiTestCase):
+    """
+    Pagination par curseur : parcours complet, retour arrière, clé stable
+    """
+    
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        self.devices = [self.create_device(f'phone-{i}') for i in range(7)]
+    
+    def get(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_forward_and_backward_round_trip(self):
+        pages, url = [], '/api/devices/?limit=3'
+        while url:
+            page = self.get(url)
+            pages.append([device['id'] for device in page['results']])
+            url = page['next']
+        expected = sorted((device.pk for device in self.devices), reverse=True)
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 1])
+        
+        second = self.get('/api/devices/?limit=3')['next']
+        previous = self.get(self.get(second)['previous'])
+        self.assertEqual([device['id'] for device in previous['results']], pages[0])
+        self.assertIsNone(previous['previous'])
+    
+    def test_heartbeats_do_not_shift_pages(self):
+        first = self.get('/api/devices/?limit=3')
+        seen = [device['id'] for device in first['results']]
+        # Les appareils pas encore lus se connectent pendant le parcours
+        for device in self.devices[:4]:
+            self.client.post('/api/devices/heartbeat/', {'androidId': device.android_id},
+                             content_type='application/json')
+        url = first['next']
+        while url:
+            page = self.get(url)
+            seen += [device['id'] for device in page['results']]
+            url = page['next']
+        self.assertEqual(sorted(seen), sorted(device.pk for device in self.devices))
+    
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/devices/?cursor=not-a-cursor').status_code, 404)
+    
+    def test_keyset_filter_has_leading_bound(self):
+        paginator = ScanCursorPagination()
+        now = timezone.now()
+        condition = paginator.keyset_filter([now, 10])
+        sql = str(FileList.objects.filter(condition).query)
+        self.assertIn('"created_at" <=', sql)
+        self.assertEqual(str(FileList.objects.filter(paginator.keyset_filter([now, 10], reverse=True)).query)
+                         .count('"created_at" >='), 1)
+    
+    def test_scan_pages_with_equal_timestamps(self):
+        device = self.devices[0]
+        scans = [FileList.objects.create(device=device, scan_id=f'scan-{i}', status='completed',
+                                          scan_requested_at=timezone.now()) for i in range(5)]
+        FileList.objects.update(created_at=timezone.now())
+        ids, url = [], f'/api/devices/{device.pk}/file_scans/?limit=2'
+        while url:
+            page = self.get(url)
+            ids += [scan['id'] for scan in page['scans']]
+            url = page['next']
+        self.assertEqual(ids, sorted((scan.pk for scan in scans), reverse=True))
+
+
+@override_settings(ADMIN_EXPORT_SYNC_MAX_FILES=0, ADMIN_EXPORT_COMPRESS=True)
+class ExportJobTests(ApiTestCase):
+    """
+    Exports en file : créés par l'admin, exécutés par run_export_jobs
+    """
+    
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        
+        self.scan = self.make_scan('scan-1', [
+            {'path': f'/sdcard/f{i}.jpg', 'size_bytes': 1024 * i, 'file_type': 'image', 'extension': 'jpg'}
+            for i in range(3)
+        ])
+    
+    def request_export(self):
+        response = self.client.post('/admin/api/filelist/', {
+            'action': 'download_as_ndjson', '_selected_action': [self.scan.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        return ExportJob.objects.get()
+    
+    def test_admin_queues_job_for_worker(self):
+        job = self.request_export()
+        self.assertEqual(job.status, 'pending')
+        
+        call_command('run_export_jobs', once=True, stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.rows_written, 3)
+        with job.file.open('rb') as exported:
+            lines = gzip.decompress(exported.read()).decode().splitlines()
+        self.assertEqual(sum('/sdcard/f' in line for line in lines), 3)
+    
+    def test_failure_is_recorded_and_worker_continues(self):
+        failing = self.request_export()
+        second = ExportJob.objects.create(scan_ids=[self.scan.pk], export_format='json', total_rows=3)
+        with mock.patch('api.exports.iter_scans_export', side_effect=RuntimeError('disque plein')), \
+                self.assertLogs('api.management.commands.run_export_jobs', 'ERROR'):
+            call_command('run_export_jobs', once=True, stdout=io.StringIO())
+        failing.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((failing.status, failing.error_message), ('failed', 'disque plein'))
+        self.assertEqual(second.status, 'failed')
+        self.assertIsNotNone(second.completed_at)
+    
+    def test_claim_is_exclusive(self):
+        job = self.request_export()
+        self.assertEqual(ExportJob.claim_next().pk, job.pk)
+        self.assertIsNone(ExportJob.claim_next())
+    
+    def test_stale_running_job_is_failed(self):
+        job = self.request_export()
+        ExportJob.claim_next()
+        ExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(ExportJob.fail_stale(timedelta(minutes=10)), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('interrompu', job.error_message)
+        self.assertEqual(ExportJob.fail_stale(timedelta(minutes=10)), 0)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTests(TestCase):
+    """
+    Compression négociée : données de l'API seulement, jamais le HTML ni le cross-site
+    """
+    
+    BODY = json.dumps([{'path': f'/sdcard/DCIM/IMG_{i:04d}.jpg', 'size': i} for i in range(200)])
+    
+    def process(self, content_type, body=BODY, **headers):
+        request = RequestFactory().get('/api/devices/', **{'HTTP_ACCEPT_ENCODING': 'gzip, br', **headers})
+        response = HttpResponse(body, content_type=content_type)
+        response['ETag'] = '"abc"'
+        return CompressionMiddleware(lambda request: response)(request)
+    
+    def test_api_json_is_compressed(self):
+        for content_type in ['application/json', 'application/x-ndjson', 'text/csv; charset=utf-8',
+                             'application/problem+json']:
+            response = self.process(content_type)
+            self.assertEqual(response['Content-Encoding'], 'gzip', content_type)
+            self.assertEqual(gzip.decompress(response.content).decode(), self.BODY)
+            self.assertEqual(response['ETag'], 'W/"abc"')
+            self.assertIn('Accept-Encoding', response['Vary'])
+    
+    def test_html_is_never_compressed(self):
+        for content_type in ['text/html; charset=utf-8', 'text/plain', 'application/javascript',
+                             'application/jsonp']:
+            response = self.process(content_type)
+            self.assertFalse(response.has_header('Content-Encoding'), content_type)
+            self.assertEqual(response.content.decode(), self.BODY)
+    
+    def test_cross_site_request_is_not_compressed(self):
+        response = self.process('application/json', HTTP_SEC_FETCH_SITE='cross-site')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Sec-Fetch-Site', response['Vary'])
+        self.assertEqual(self.process('application/json', HTTP_SEC_FETCH_SITE='same-origin')['Content-Encoding'],
+                         'gzip')
+    
+    def test_small_response_is_not_compressed(self):
+        self.assertFalse(self.process('application/json', body='{}').has_header('Content-Encoding'))
+    
+    def test_accept_encoding_negotiation(self):
+        for accept, encoded in [('br, zstd', False), ('gzip;q=0, br', False), ('*', True),
+                                ('br;q=1, gzip;q=0.5', True)]:
+            response = self.process('application/json', HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response.get('Content-Encoding'), 'gzip' if encoded else None, accept)
+    
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_admin_page_is_not_compressed(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.get('/admin/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class ScanDiffTests(ApiTestCase):
+    """
+    Différence entre scans : fusion triée, déplacements, mémoire bornée
+    """
+    
+    OLD = [('/a/IMG_1.jpg', 100), ('/a/IMG_2.jpg', 200), ('/a/doc.pdf', 300), ('/b/song.mp3', 400)]
+    NEW = [('/a/IMG_1.jpg', 150), ('/a/doc.pdf', 300), ('/c/IMG_2.jpg', 200), ('/c/new.jpg', 50)]
+    
+    def setUp(self):
+        super().setUp()
+        self.old = self.make_scan('scan-old', self.OLD)
+        self.new = self.make_scan('scan-new', self.NEW)
+    
+    def make_scan(self, scan_id, files):
+        return super().make_scan(scan_id, [
+            {'path': path, 'size_bytes': size, 'file_type': 'image' if path.endswith('.jpg') else 'other',
+             'last_modified': 0}
+            for path, size in files
+        ] + [{'path': '/a', 'parent_path': '/', 'size_bytes': 0, 'is_directory': True}], total_files=len(files))
+    
+    def changes(self, diff):
+        return sorted((change['change'], change['path']) for change in diff)
+    
+    def test_changes_and_summary(self):
+        diff = ScanDiff(iter_scan_rows(self.old), iter_scan_rows(self.new))
+        self.assertEqual(self.changes(diff), [
+            ('added', '/c/new.jpg'), ('modified', '/a/IMG_1.jpg'),
+            ('moved', '/c/IMG_2.jpg'), ('removed', '/b/song.mp3'),
+        ])
+        summary = diff.summary
+        self.assertEqual((summary['added'], summary['removed'], summary['modified'], summary['moved']), (1, 1, 1, 1))
+        self.assertTrue(summary['moves_complete'])
+        self.assertEqual(summary['size_delta'], 50 - 400 + 50)
+        self.assertEqual(summary['by_type']['image'], {'count_delta': 1, 'size_delta': 100})
+    
+    def test_pending_changes_are_bounded(self):
+        diff = ScanDiff(iter_scan_rows(self.old), iter_scan_rows(self.new), max_pending=1)
+        changes = self.changes(diff)
+        # Lots d'un fichier : plus aucun déplacement apparié, mêmes totaux
+        self.assertNotIn('moved', [change for change, _ in changes])
+        self.assertEqual(len(changes), 5)
+        self.assertFalse(diff.summary['moves_complete'])
+        self.assertEqual(diff.summary['size_delta'], 50 - 400 + 50)
+    
+    def test_unsorted_stream_is_rejected(self):
+        rows = [FileRow('/b', 'b', 1, 0, 'other'), FileRow('/a', 'a', 1, 0, 'other')]
+        with self.assertRaises(ValueError):
+            list(ScanDiff(iter(rows), iter([])))
+    
+    def test_endpoint_json_and_ndjson(self):
+        url = f'/api/devices/{self.device.pk}/scan_diff/?from=scan-old&to=scan-new'
+        data = self.client.get(url).json()
+        self.assertEqual(data['summary']['moved'], 1)
+        self.assertEqual(len(data['changes']), 4)
+        self.assertFalse(data['truncated'])
+        
+        response = self.client.get(url + '&output=ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(lines[0]['from']['scan_id'], 'scan-old')
+        self.assertEqual(lines[-1]['summary'], data['summary'])
+        self.assertEqual(len(lines), 6)
+    
+    def test_path_order_uses_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Plan propre à SQLite")
+        rows = self.old.files.filter(is_directory=False).order_by(Collate('path', path_collation()))
+        plan = rows.values_list(*FileRow._fields).explain()
+        self.assertIn('api_fileitem_list_path_bin', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class CommandFanOutTests(ApiTestCase):
+    """
+    Diffusions : enregistrées par la requête, insérées par le dispatcher
+    """
+    
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        self.devices = [
+            self.create_device(f'phone-{i}', manufacturer=manufacturer)
+            for i, manufacturer in enumerate(['Google', 'Google', 'Samsung'])
+        ]
+    
+    def fan_out(self, **data):
+        response = self.client.post('/api/devices/fan_out/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+    
+    def status(self, fanout_id):
+        return self.client.get(f'/api/devices/fan_out_status/?fanout_id={fanout_id}').json()
+    
+    def test_request_returns_before_dispatch(self):
+        data = self.fan_out(command='sync', manufacturer='Google')
+        self.assertEqual(data['status'], 'fan_out_pending')
+        self.assertEqual(data['fanout']['status'], 'pending')
+        self.assertFalse(DeviceCommand.objects.exists())
+        
+        ScheduledCommandDispatcher().tick()
+        status = self.status(data['fanout_id'])
+        self.assertEqual((status['status'], status['total_targets'], status['queued_count']), ('completed', 2, 2))
+        self.assertEqual(
+            set(DeviceCommand.objects.values_list('device_id', flat=True)),
+            {self.devices[0].pk, self.devices[1].pk}
+        )
+    
+    def test_queued_duplicates_are_coalesced(self):
+        dispatcher = ScheduledCommandDispatcher()
+        first = self.fan_out(command='sync', manufacturer='Google')
+        dispatcher.tick()
+        second = self.fan_out(command='sync', manufacturer='Google')
+        dispatcher.tick()
+        status = self.status(second['fanout_id'])
+        self.assertEqual((status['queued_count'], status['coalesced_count']), (0, 2))
+        self.assertEqual(DeviceCommand.objects.filter(status='queued').count(), 2)
+        self.assertEqual(set(DeviceCommand.objects.values_list('coalesced_count', flat=True)), {1})
+        self.assertEqual(self.status(first['fanout_id'])['queued_count'], 2)
+    
+    def test_local_time_fan_out_is_scheduled_per_timezone(self):
+        Device.objects.filter(pk=self.devices[0].pk).update(timezone='Asia/Tokyo')
+        Device.objects.filter(pk=self.devices[1].pk).update(timezone='America/New_York')
+        self.fan_out(command='reboot', manufacturer='Google', local_time='03:00')
+        ScheduledCommandDispatcher().tick()
+        commands = DeviceCommand.objects.select_related('device')
+        self.assertEqual({command.status for command in commands}, {'scheduled'})
+        for command in commands:
+            local = command.schedule_at.astimezone(ZoneInfo(command.device.timezone))
+            self.assertEqual((local.hour, local.minute), (3, 0))
+    
+    def test_admin_action_is_dispatched_by_dispatcher(self):
+        response = self.client.post('/admin/api/device/', {
+            'action': 'request_file_list_action', '_selected_action': [self.devices[0].pk, self.devices[2].pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        fanout = CommandFanOut.objects.get()
+        self.assertEqual(fanout.status, 'pending')
+        self.assertFalse(DeviceCommand.objects.exists())
+        ScheduledCommandDispatcher().dispatch_fanout()
+        self.assertEqual(DeviceCommand.objects.filter(command='list_files').count(), 2)
+    
+    def test_claim_and_stale_fan_outs(self):
+        fanout = CommandFanOut.objects.create(command='sync')
+        self.assertEqual(CommandFanOut.claim_next().pk, fanout.pk)
+        self.assertIsNone(CommandFanOut.claim_next())
+        CommandFanOut.objects.filter(pk=fanout.pk).update(started_at=timezone.now() - timedelta(hours=2),
+                                                          progress_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(CommandFanOut.fail_stale(timedelta(minutes=30)), 1)
+        self.assertEqual(CommandFanOut.objects.get(pk=fanout.pk).status, 'failed')
+    
+    def test_long_fan_out_with_recent_progress_is_not_stale(self):
+        fanout = CommandFanOut.objects.create(command='sync')
+        CommandFanOut.claim_next()
+        CommandFanOut.objects.filter(pk=fanout.pk).update(started_at=timezone.now() - timedelta(hours=2),
+                                                          progress_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(CommandFanOut.fail_stale(timedelta(minutes=30)), 0)
+        self.assertEqual(CommandFanOut.objects.get(pk=fanout.pk).status, 'running')
+    
+    def test_dispatch_records_progress(self):
+        fanout = CommandFanOut.objects.create(command='sync')
+        fanout.dispatch(batch_size=2)
+        fanout.refresh_from_db()
+        self.assertIsNotNone(fanout.progress_at)
+        self.assertGreaterEqual(fanout.progress_at, fanout.started_at)
+    
+    def test_dispatch_leaves_json_columns_sql_null(self):
+        fanout = CommandFanOut.objects.create(command='sync', params={'full': True})
+        fanout.dispatch()
+        commands = DeviceCommand.objects.filter(fanout=fanout)
+        self.assertEqual(commands.count(), 3)
+        self.assertEqual(commands.filter(params__isnull=True, result__isnull=True).count(), 3)
+    
+    def test_request_file_list_is_atomic(self):
+        device = self.devices[0]
+        with mock.patch.object(FileList.objects, 'create', side_effect=DatabaseError('disque plein')):
+            with self.assertRaises(DatabaseError):
+                self.client.post(f'/api/devices/{device.pk}/request_file_list/', {},
+                                 content_type='application/json')
+        self.assertFalse(DeviceCommand.objects.exists())
+        
+        response = self.client.post(f'/api/devices/{device.pk}/request_file_list/', {},
+                                    content_type='application/json').json()
+        command = DeviceCommand.objects.get()
+        self.assertEqual(FileList.objects.get(command_id=command.command_id).scan_id, response['scan']['scan_id'])
+
+
+class DuplicateGroupTests(ApiTestCase):
+    """
+    Groupes de doublons construits à l'upload et rapports qui les lisent
+    """
+    
+    MB = 1024 * 1024
+    default_device = False
+    
+    def make_scan(self, android_id, files):
+        scan = super().make_scan(f'scan-{android_id}', [
+            {'path': path, 'extension': path.rsplit('.', 1)[1], 'size_bytes': size, 'md5_hash': md5, 'sha1_hash': sha1}
+            for path, size, md5, sha1 in files
+        ], device=self.create_device(android_id))
+        DuplicateGroup.build_for_file_list(scan)
+        return scan
+    
+    def test_groups_per_criterion(self):
+        scan = self.make_scan('phone-1', [
+            ('/a/x.jpg', 10, 'aaa', ''), ('/b/x.jpg', 10, 'aaa', ''),
+            ('/a/y.mp4', 20, '', 'bbb'), ('/b/y.mp4', 20, '', 'bbb'), ('/c/y.mp4', 20, '', 'bbb'),
+            ('/a/big.zip', 2 * self.MB, '', ''), ('/b/big.zip', 2 * self.MB, '', ''),
+            ('/a/small.txt', 100, '', ''), ('/b/small.txt', 100, '', ''),
+            ('/a/unique.jpg', 30, 'ccc', ''),
+        ])
+        groups = {group.match: group for group in scan.duplicate_groups.all()}
+        self.assertEqual(set(groups), {'md5', 'sha1', 'size'})
+        self.assertEqual((groups['md5'].content_key, groups['md5'].copies, groups['md5'].reclaimable_bytes),
+                         ('aaa', 2, 10))
+        self.assertEqual((groups['sha1'].copies, groups['sha1'].reclaimable_bytes), (3, 40))
+        self.assertEqual(groups['size'].content_key, f'{2 * self.MB}:zip')
+        self.assertFalse(groups['size'].confirmed)
+        self.assertEqual(groups['sha1'].paths, ['/a/y.mp4', '/b/y.mp4', '/c/y.mp4'])
+    
+    def test_paths_lookup_is_batched(self):
+        files = [(f'/{folder}/f{i}.jpg', 10, f'{i:032x}', '') for i in range(7) for folder in 'ab']
+        with mock.patch.object(DuplicateGroup, 'PATHS_LOOKUP_BATCH', 3):
+            scan = self.make_scan('phone-1', files)
+        groups = scan.duplicate_groups.all()
+        self.assertEqual(len(groups), 7)
+        for group in groups:
+            self.assertEqual(len(group.paths), 2)
+    
+    def test_fleet_duplicates_reads_groups(self):
+        shared = [('/a/x.jpg', 10, 'aaa', ''), ('/b/x.jpg', 10, 'aaa', '')]
+        self.make_scan('phone-1', shared + [('/c/x.jpg', 10, 'aaa', '')])
+        self.make_scan('phone-2', shared + [('/a/y.jpg', 5, 'bbb', ''), ('/b/y.jpg', 5, 'bbb', '')])
+        
+        data = self.client.get('/api/devices/fleet_duplicates/').json()
+        self.assertEqual(len(data['results']), 1)
+        result = data['results'][0]
+        self.assertEqual((result['content_key'], result['name'], result['devices'], result['copies']),
+                         ('aaa', 'x.jpg', 2, 5))
+        self.assertEqual((result['total_size_bytes'], result['reclaimable_bytes']), (50, 30))
+        
+        cache.clear()
+        data = self.client.get('/api/devices/fleet_duplicates/?min_devices=3').json()
+        self.assertEqual(data['results'], [])
+    
+    def test_duplicates_report_ranks_devices(self):
+        self.make_scan('phone-1', [('/a/x.jpg', 10, 'aaa', ''), ('/b/x.jpg', 10, 'aaa', '')])
+        self.make_scan('phone-2', [('/a/big.zip', 2 * self.MB, '', ''), ('/b/big.zip', 2 * self.MB, '', '')])
+        data = self.client.get('/api/devices/duplicates_report/').json()
+        self.assertEqual([row['android_id'] for row in data['devices']], ['phone-2', 'phone-1'])
+        self.assertEqual(data['devices'][0]['candidate_bytes'], 2 * self.MB)
+        self.assertEqual(data['devices'][1]['confirmed_bytes'], 10)
+        
+        cache.clear()
+        confirmed = self.client.get('/api/devices/duplicates_report/?match=confirmed').json()
+        self.assertEqual([row['android_id'] for row in confirmed['devices']], ['phone-1'])
+
+
+@override_settings(DEVICE_RATE_LIMITS={})
+class CommandAckTests(ApiTestCase):
+    """
+    Accusés du téléphone (command_ack) et latences par étape
+    """
+    
+    login = False
+    
+    def setUp(self):
+        super().setUp()
+        metrics.reset_command_latencies()
+        self.command, _ = DeviceCommand.enqueue(self.device, 'cmd-1', 'ping')
+    
+    def ack(self, status, **extra):
+        return self.client.post('/api/devices/command_ack/', {
+            'androidId': 'phone-1', 'command_id': 'cmd-1', 'status': status, **extra,
+        }, content_type='application/json')
+    
+    def test_full_lifecycle(self):
+        response = self.client.post('/api/devices/fetch_commands/', {'androidId': 'phone-1'},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['commands_count'], 1)
+        
+        for status in ['received', 'executing', 'done']:
+            response = self.ack(status, result={'pong': True} if status == 'done' else None)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['command_status'], status)
+        
+        self.command.refresh_from_db()
+        self.assertEqual(self.command.result, {'pong': True})
+        self.assertTrue(self.command.delivered_at <= self.command.acked_at <= self.command.completed_at)
+        
+        self.client.force_login(self.admin)
+        latencies = self.client.get('/api/devices/command_metrics/').json()['latencies']['ping']
+        self.assertEqual(set(latencies), {'enqueue_to_deliver', 'deliver_to_ack', 'ack_to_done', 'enqueue_to_done'})
+        self.assertEqual(latencies['ack_to_done']['count'], 1)
+    
+    def test_direct_done_fills_skipped_steps(self):
+        self.assertEqual(self.ack('done').status_code, 200)
+        self.command.refresh_from_db()
+        self.assertEqual(self.command.status, 'done')
+        self.assertEqual(self.command.acked_at, self.command.started_at)
+    
+    def test_ack_without_fetch_records_no_delivery_latency(self):
+        self.ack('received')
+        self.ack('done')
+        self.command.refresh_from_db()
+        self.assertIsNone(self.command.delivered_at)
+        latencies = metrics.command_latency_summary()['ping']
+        self.assertNotIn('deliver_to_ack', latencies)
+        self.assertEqual(latencies['ack_to_done']['count'], 1)
+    
+    def test_backward_and_final_transitions_are_refused(self):
+        self.ack('executing')
+        response = self.ack('received')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'executing')
+        
+        self.assertEqual(self.ack('executing').status_code, 200)  # accusé répété sans effet
+        self.ack('failed', error_message='timeout')
+        self.assertEqual(self.ack('done').status_code, 409)
+        self.command.refresh_from_db()
+        self.assertEqual((self.command.status, self.command.error_message), ('failed', 'timeout'))
+    
+    def test_unknown_command_or_device(self):
+        self.assertEqual(self.ack('done', command_id='cmd-x').status_code, 404)
+        self.assertEqual(self.ack('done', androidId='phone-2').status_code, 404)
+    
+    def test_failed_scan_command_closes_scan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            DeviceCommand.enqueue(self.device, 'scan-1', 'list_files', {'path': '/sdcard'})
+            scan = FileList.objects.create(device=self.device, scan_id='scan-1', command_id='scan-1',
+                                           status='pending', scan_requested_at=timezone.now())
+        response = self.ack('failed', command_id='scan-1', error_message='permission refusée')
+        self.assertEqual(response.status_code, 200)
+        scan.refresh_from_db()
+        self.assertEqual((scan.status, scan.error_message), ('failed', 'permission refusée'))
+
+
+class SearchFilesTests(ApiTestCase):
+    """
+    search_files : index trigramme en mémoire (SQLite, un appareil) et icontains en base
+    """
+    
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        names = ['IMG_0001.jpg', 'img_0002.JPG', 'Screenshot_1.png', 'notes.txt', 'VID_0001.mp4', '.hidden_img.jpg']
+        for index in range(2):
+            self.make_scan(f'scan-{index}', [
+                {'path': f'/sdcard/DCIM/{name}', 'extension': name.rsplit('.', 1)[1].lower(),
+                 'file_type': 'image' if 'IMG' in name.upper() else 'other',
+                 'size_bytes': 1000 * (position + 1) + index, 'is_hidden': name.startswith('.')}
+                for position, name in enumerate(names)
+            ], device=self.create_device(f'phone-{index}'))
+    
+    def search(self, query_string):
+        cache.clear()
+        response = self.client.get(f'/api/devices/search_files/?{query_string}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def ids(self, query_string):
+        return [result['id'] for result in self.search(query_string)['results']]
+    
+    def device_filter(self, android_id='phone-0'):
+        return f'device_id={Device.objects.get(android_id=android_id).pk}'
+    
+    def test_trigram_index_matches_icontains(self):
+        device_filter = self.device_filter()
+        for query_string in ['query=img', 'query=DCIM&extension=jpg', 'query=0001&min_size=2000',
+                             'query=img&hidden_only=true', 'query=img&file_type=image', 'query=zzz', 'query=im']:
+            with self.subTest(query_string=query_string):
+                memory = self.ids(f'{query_string}&{device_filter}')
+                with mock.patch('api.views.use_database_index', return_value=True):
+                    database = self.ids(f'{query_string}&{device_filter}')
+                self.assertEqual(memory, database)
+        self.assertEqual(len(self.ids(f'query=img&{device_filter}')), 3)
+        self.assertEqual(len(search_index_cache._indexes), 1)
+    
+    def test_fleet_search_does_not_build_indexes(self):
+        with mock.patch('api.search.ScanSearchIndex.build') as build:
+            self.assertEqual(len(self.ids('query=img')), 6)
+        build.assert_not_called()
+    
+    def test_pages_follow_size_order(self):
+        data = self.search(f'query=dcim&limit=2&{self.device_filter()}')
+        sizes = [result['size_bytes'] for result in data['results']]
+        self.assertEqual(len(sizes), 2)
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        seen = [result['id'] for result in data['results']]
+        while data['next']:
+            cache.clear()
+            data = self.client.get(data['next']).json()
+            seen += [result['id'] for result in data['results']]
+        self.assertEqual(sorted(seen), sorted(FileItem.objects.filter(
+            file_list__scan_id='scan-0').values_list('id', flat=True)))
+    
+    def test_reupload_rebuilds_index(self):
+        device_filter = self.device_filter()
+        self.assertEqual(len(self.ids(f'query=report&{device_filter}')), 0)
+        scan = FileList.objects.get(scan_id='scan-0')
+        FileItem.objects.create(file_list=scan, path='/sdcard/report.pdf', parent_path='/sdcard',
+                                name='report.pdf', extension='pdf', size_bytes=10)
+        FileList.objects.filter(pk=scan.pk).update(total_files=scan.total_files + 1)
+        self.assertEqual(len(self.ids(f'query=report&{device_filter}')), 1)
+    
+    def test_index_cache_is_bounded(self):
+        index_cache = SearchIndexCache(max_scans=1)
+        first, second = FileList.objects.order_by('pk')
+        index = index_cache.get(first)
+        self.assertIs(index_cache.get(first), index)
+        index_cache.get(second)
+        self.assertIsNot(index_cache.get(first), index)
+
+
+@override_settings(DEVICE_RATE_LIMITS={})
+class LatestCompletedScanTests(ApiTestCase):
+    """
+    Pointeur Device.latest_completed_scan maintenu à l'upload et à la suppression
+    """
+    
+    login = False
+    
+    def upload(self, scan_id, status='completed', names=('photo.jpg',)):
+        scan = super().upload(scan_id, [(name, 100, 'image') for name in names], status=status)
+        self.device.refresh_from_db()
+        return scan
+    
+    def test_pointer_follows_completed_uploads(self):
+        first = self.upload('scan-a', names=['old.jpg'])
+        self.assertEqual(self.device.latest_completed_scan, first)
+        
+        self.upload('scan-b', status='failed')
+        self.assertEqual(self.device.latest_completed_scan, first)
+        
+        latest = self.upload('scan-c', names=['new.jpg'])
+        self.assertEqual(self.device.latest_completed_scan, latest)
+        
+        # search_files ne lit que le scan courant de chaque appareil
+        self.client.force_login(self.admin)
+        names = [result['name'] for result in self.client.get('/api/devices/search_files/?query=jpg').json()['results']]
+        self.assertEqual(names, ['new.jpg'])
+    
+    def test_deleting_pointed_scan_repoints(self):
+        first = self.upload('scan-a')
+        latest = self.upload('scan-c')
+        latest.delete()
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.latest_completed_scan, first)
+        
+        first.delete()
+        self.device.refresh_from_db()
+        self.assertIsNone(self.device.latest_completed_scan)
+    
+    def test_refresh_does_not_touch_last_seen(self):
+        last_seen = self.device.last_seen
+        self.upload('scan-a')
+        self.assertEqual(self.device.last_seen, last_seen)
+
+
+class ScanItemsTests(ApiTestCase):
+    """
+    Détail de scan léger et fichiers servis page par page
+    """
+    
+    def setUp(self):
+        super().setUp()
+        self.scan = self.make_scan('scan-1')
+        self.add_files(10)
+    
+    def add_files(self, count):
+        start = self.scan.files.count()
+        FileItem.objects.bulk_create([
+            FileItem(file_list=self.scan, path=f'/sdcard/{folder}/f{i}.{extension}', parent_path=f'/sdcard/{folder}',
+                     name=f'f{i}.{extension}', extension=extension, file_type=file_type, size_bytes=100 * (i + 1))
+            for i in range(start, start + count)
+            for folder, extension, file_type in [('DCIM' if i % 2 else 'Music', 'jpg' if i % 2 else 'mp3',
+                                                  'image' if i % 2 else 'audio')]
+        ])
+        FileList.objects.filter(pk=self.scan.pk).update(total_files=start + count)
+        # Statistiques recalculées comme à l'upload
+        FileScanStats.objects.filter(file_list=self.scan).delete()
+        FileScanStats.generate_from_file_list(self.scan)
+    
+    def get(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_detail_does_not_embed_files(self):
+        url = f'/api/devices/{self.device.pk}/file_scan_detail/?scan_id=scan-1'
+        with CaptureQueriesContext(connection) as small:
+            data = self.get(url)
+        self.assertNotIn('files', data)
+        self.assertEqual(data['stats']['image']['count'], 5)
+        self.assertIn('file_scan_items', data['items_url'])
+        
+        self.add_files(200)
+        with self.assertNumQueries(len(small)):
+            self.get(url)
+    
+    def test_items_pages_and_filters(self):
+        url = f'/api/devices/{self.device.pk}/file_scan_items/?scan_id=scan-1&limit=4'
+        data = self.get(url)
+        sizes = [file['size_bytes'] for file in data['files']]
+        self.assertEqual(sizes, [1000, 900, 800, 700])
+        seen = sizes
+        while data['next']:
+            data = self.get(data['next'])
+            seen += [file['size_bytes'] for file in data['files']]
+        self.assertEqual(seen, sorted((100 * (i + 1) for i in range(10)), reverse=True))
+        
+        images = self.get(f'{url}&file_type=image&min_size=500')['files']
+        self.assertEqual([file['name'] for file in images], ['f9.jpg', 'f7.jpg', 'f5.jpg'])
+        music = self.get(f'{url}&parent_path=/sdcard/Music&query=f2')['files']
+        self.assertEqual([file['name'] for file in music], ['f2.mp3'])
+    
+    def test_unknown_scan(self):
+        response = self.client.get(f'/api/devices/{self.device.pk}/file_scan_items/?scan_id=missing')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/api/devices/{self.device.pk}/file_scan_items/')
+        self.assertEqual(response.status_code, 400)
+
+
+class StreamingExportTests(ApiTestCase):
+    """
+    Exports CSV / NDJSON en flux, gzip optionnel
+    """
+    
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        for index in range(2):
+            device = self.create_device(f'phone-{index}', is_active=index == 0)
+            for scan_index in range(2):
+                self.make_scan(f'scan-{index}-{scan_index}', [
+                    {'path': f'/sdcard/f{i},"x".jpg', 'file_type': 'image' if i % 2 else 'other', 'size_bytes': i}
+                    for i in range(3)
+                ], device=device)
+    
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+    
+    def test_devices_csv(self):
+        response, content = self.download('/api/export/devices/?output=csv&is_active=true')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('devices.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[0][:2], ['id', 'android_id'])
+        self.assertEqual([row[1] for row in rows[1:]], ['phone-0'])
+    
+    def test_files_ndjson_reads_latest_scans(self):
+        _, content = self.download('/api/export/files/?output=ndjson&file_type=image')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual({row['scan_id'] for row in rows}, {'scan-0-1', 'scan-1-1'})
+        self.assertEqual({row['name'] for row in rows}, {'f1,"x".jpg'})
+        
+        _, content = self.download('/api/export/files/?output=ndjson&all_scans=true')
+        self.assertEqual(len(content.decode().splitlines()), 12)
+    
+    def test_gzip_round_trip(self):
+        response, content = self.download('/api/export/files/?output=csv&scan_id=scan-0-0&gzip=true')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = list(csv.reader(io.StringIO(gzip.decompress(content).decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][rows[0].index('path')], '/sdcard/f0,"x".jpg')
+    
+    def test_chunk_boundaries(self):
+        rows = iter_rows(FileItem.objects.order_by('id'), FILE_EXPORT_FIELDS)
+        chunks = list(iter_csv(FILE_EXPORT_FIELDS, rows, chunk_size=5))
+        self.assertEqual(len(chunks), 1 + 3)  # en-tête, puis 12 lignes par paquets de 5
+        self.assertEqual(len(list(csv.reader(io.StringIO(''.join(chunks))))), 13)
+        
+        progress = []
+        exported = json.loads(''.join(iter_scans_export(FileList.objects.all(), progress=progress.append,
+                                                        chunk_size=2)))
+        self.assertEqual([len(scan['files']) for scan in exported], [3, 3, 3, 3])
+        self.assertEqual(sum(progress), 12)
+
+
+class FileStatsTests(ApiTestCase):
+    """
+    file_stats servi depuis les histogrammes pré-calculés (FileScanStats)
+    """
+    
+    def setUp(self):
+        super().setUp()
+        self.scan = self.make_scan('scan-1', [
+            {'path': path, 'extension': extension, 'file_type': file_type, 'size_bytes': size, 'is_hidden': hidden}
+            for path, extension, file_type, size, hidden in [
+                ('/sdcard/DCIM/a.jpg', 'jpg', 'image', 300, False),
+                ('/sdcard/DCIM/b.jpg', 'jpg', 'image', 200, False),
+                ('/sdcard/DCIM/c.mp4', 'mp4', 'video', 5000, False),
+                ('/sdcard/Download/d.pdf', 'pdf', 'document', 100, False),
+                ('/sdcard/.cache/e.tmp', 'tmp', 'other', 50, True),
+                ('/sdcard/Download/f.jpg', 'jpg', 'image', 10, False),
+            ]
+        ])
+        FileScanStats.generate_from_file_list(self.scan)
+        self.url = f'/api/devices/{self.device.pk}/file_stats/'
+    
+    def get(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), queries
+    
+    def test_histograms(self):
+        data, queries = self.get()
+        self.assertFalse([query for query in queries if 'api_fileitem' in query['sql']])
+        by_type = {item['file_type']: item for item in data['stats_by_type']}
+        self.assertEqual((by_type['image']['count'], by_type['image']['total_size_bytes']), (3, 510))
+        self.assertEqual(by_type['image']['percentage'], 50.0)
+        self.assertEqual(data['top_extensions'][0], {'extension': 'jpg', 'count': 3})
+        self.assertEqual([item['path'] for item in data['top_folders']],
+                         ['/sdcard/DCIM', '/sdcard/Download', '/sdcard/.cache'])
+        self.assertEqual(data['largest_files'][0]['name'], 'c.mp4')
+        self.assertEqual(data['hidden_files_count'], 1)
+    
+    def test_outdated_stats_are_recomputed_once(self):
+        FileScanStats.objects.filter(file_list=self.scan).update(stats_version=0, type_histogram=[])
+        data, queries = self.get()
+        self.assertTrue([query for query in queries if 'api_fileitem' in query['sql']])
+        self.assertEqual(len(data['stats_by_type']), 4)
+        self.assertEqual(FileScanStats.objects.get(file_list=self.scan).stats_version, FileScanStats.STATS_VERSION)
+        
+        _, queries = self.get()
+        self.assertFalse([query for query in queries if 'api_fileitem' in query['sql']])
+    
+    def test_no_completed_scan(self):
+        FileList.objects.filter(pk=self.scan.pk).update(status='failed')
+        self.device.refresh_latest_completed_scan()
+        cache.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class DirectoryTreeTests(ApiTestCase):
+    """
+    Tailles récursives des dossiers (DirectorySize) et navigation directory_tree
+    """
+    
+    def setUp(self):
+        super().setUp()
+        self.scan = self.make_scan('scan-1', [
+            {'path': path, 'parent_path': parent_path, 'size_bytes': size, 'is_directory': is_directory}
+            for path, parent_path, size, is_directory in [
+                ('/sdcard/DCIM/Camera/a.jpg', '/sdcard/DCIM/Camera', 400, False),
+                ('/sdcard/DCIM/Camera/b.jpg', '/sdcard/DCIM/Camera', 600, False),
+                ('/sdcard/DCIM/cover.jpg', '/sdcard/DCIM', 50, False),
+                ('/sdcard/Music/song.mp3', '', 300, False),  # parent_path absent : déduit du chemin
+                ('/sdcard/notes.txt', '/sdcard', 5, False),
+                ('/sdcard/Empty', '/sdcard', 0, True),
+            ]
+        ])
+        self.url = f'/api/devices/{self.device.pk}/directory_tree/'
+    
+    def tree(self, query=''):
+        response = self.client.get(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_recursive_totals(self):
+        DirectorySize.build_for_file_list(self.scan)
+        sizes = dict(self.scan.directories.values_list('path', 'total_size'))
+        self.assertEqual(sizes, {'/': 1355, '/sdcard': 1355, '/sdcard/DCIM': 1050, '/sdcard/DCIM/Camera': 1000,
+                                 '/sdcard/Music': 300, '/sdcard/Empty': 0})
+        dcim = self.scan.directories.get(path='/sdcard/DCIM')
+        self.assertEqual((dcim.files_count, dcim.direct_files_count, dcim.direct_size), (3, 1, 50))
+        
+        # Reconstruction idempotente
+        DirectorySize.build_for_file_list(self.scan)
+        self.assertEqual(self.scan.directories.count(), 6)
+    
+    def test_drill_down(self):
+        # Scan sans arbre : construit à la première consultation
+        data = self.tree('path=/sdcard/')
+        self.assertEqual(data['path'], '/sdcard')
+        self.assertEqual([child['name'] for child in data['children']], ['DCIM', 'Music', 'Empty'])
+        self.assertEqual(data['children'][0]['percentage'], round(1050 / 1355 * 100, 2))
+        
+        data = self.tree('path=/sdcard/DCIM&include_files=true&limit=1')
+        self.assertEqual(data['parent'], '/sdcard')
+        self.assertEqual([child['name'] for child in data['children']], ['Camera'])
+        self.assertEqual([file['name'] for file in data['files']], ['cover.jpg'])
+    
+    def test_unknown_path_or_scan(self):
+        self.assertEqual(self.client.get(f'{self.url}?path=/missing').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}?scan_id=missing').status_code, 404)
+
+
+@override_settings(DEVICE_RATE_LIMITS={})
+class FleetCounterTests(ApiTestCase):
+    """
+    Compteurs de flotte maintenus par deltas : égaux au recalcul complet après chaque écriture
+    """
+    
+    login = False
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        self.devices = [
+            self.create_device(f'phone-{index}', manufacturer=manufacturer)
+            for index, manufacturer in enumerate(['Google', 'Google', 'Samsung'])
+        ]
+    
+    def stats(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        data = self.client.get('/api/devices/stats/').json()
+        self.client.logout()
+        self.assertEqual(FleetCounter.reconcile(dry_run=True), {})
+        return data
+    
+    def test_device_writes(self):
+        data = self.stats()
+        self.assertEqual((data['devices']['total'], data['devices']['active']), (3, 3))
+        self.assertEqual(data['top_manufacturers'][0], {'manufacturer': 'Google', 'count': 2})
+        
+        device = self.devices[0]
+        device.is_active = False
+        device.is_rooted_score = 0.9
+        device.save()
+        data = self.stats()
+        self.assertEqual((data['devices']['active'], data['devices']['rooted']), (2, 1))
+        
+        Device.update_in_bulk(Device.objects.filter(manufacturer='Google'), manufacturer='Pixel Corp')
+        self.assertEqual(self.stats()['top_manufacturers'][0], {'manufacturer': 'Pixel Corp', 'count': 2})
+        
+        self.devices[2].delete()
+        self.assertEqual(self.stats()['devices']['total'], 2)
+    
+    def test_update_in_bulk_groups_contributions(self):
+        Device.objects.filter(pk=self.devices[0].pk).update(is_rooted_score=0.9, last_seen=timezone.now() - timedelta(days=1))
+        FleetCounter.reconcile()
+        
+        # Le filtre porte sur un champ modifié : la sélection reste celle d'avant l'update.
+        # Savepoint, clés, requête groupée, UPDATE, puis un UPDATE par compteur modifié
+        with self.assertNumQueries(2 + 3 + 3):
+            updated = Device.update_in_bulk(Device.objects.filter(is_active=True), is_active=False,
+                                            is_emulator=True, is_rooted_score=0.1)
+        self.assertEqual(updated, 3)
+        data = self.stats()
+        self.assertEqual((data['devices']['active'], data['devices']['rooted'], data['devices']['emulators']), (0, 0, 3))
+        
+        Device.update_in_bulk(Device.objects.filter(manufacturer='Google'), last_seen=timezone.now() - timedelta(days=3))
+        self.stats()
+    
+    def test_scan_writes(self):
+        self.upload('scan-a', [('a.jpg', 100, 'image'), ('b.mp4', 1000, 'video')], android_id='phone-0')
+        self.upload('scan-b', [('c.jpg', 50, 'image')], android_id='phone-1', status='partial')
+        data = self.stats()['files']
+        self.assertEqual((data['total_scans'], data['completed_scans'], data['total_files']), (2, 1, 3))
+        self.assertEqual(data['total_size_bytes'], 1150)
+        
+        # Ré-upload : l'ancienne contribution du scan est retirée
+        self.upload('scan-a', [('a.jpg', 100, 'image')], android_id='phone-0')
+        data = self.stats()
+        self.assertEqual((data['files']['total_scans'], data['files']['total_files']), (2, 2))
+        self.assertEqual([item['type'] for item in data['files']['files_by_type']], ['image'])
+        self.assertEqual([device['file_count'] for device in data['top_devices_by_files']], [1, 1])
+        
+        FileList.objects.get(scan_id='scan-b').delete()
+        self.assertEqual(self.stats()['files']['total_files'], 1)
+        
+        self.devices[0].delete()  # cascade sur ses scans et fichiers
+        self.assertEqual(self.stats()['files']['total_scans'], 0)
+    
+    def test_reconcile_corrects_drift(self):
+        FleetCounter.objects.filter(scope='devices', key='total').update(count=42)
+        FleetCounter.objects.create(scope='manufacturer', key='Ghost', count=1)
+        
+        out = io.StringIO()
+        call_command('reconcile_fleet_counters', '--dry-run', stdout=out)
+        self.assertIn('devices:total (42, 0) -> (3, 0)', out.getvalue())
+        self.assertEqual(FleetCounter.objects.get(scope='devices', key='total').count, 42)
+        
+        call_command('reconcile_fleet_counters', stdout=io.StringIO())
+        self.assertEqual(FleetCounter.reconcile(dry_run=True), {})
+        self.assertFalse(FleetCounter.objects.filter(key='Ghost').exists())
+
+
+class DailyRollupTests(ApiTestCase):
+    """
+    Agrégats journaliers (rollup_daily) et courbes trends
+    """
+    
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+        devices = [
+            self.create_device(f'phone-{index}', manufacturer=manufacturer, is_active=index != 3)
+            for index, manufacturer in enumerate(['Google', 'Google', 'Samsung', 'Xiaomi'])
+        ]
+        # Un appareil enregistré et vu la veille
+        yesterday_noon = timezone.now() - timedelta(days=1)
+        Device.objects.filter(android_id='phone-3').update(created_at=yesterday_noon, last_seen=yesterday_noon)
+        self.make_scan('scan-1', [
+            {'path': f'/sdcard/f{i}', 'size_bytes': 100, 'file_type': 'image' if i < 2 else 'video'}
+            for i in range(3)
+        ], device=devices[0], scan_completed_at=timezone.now())
+    
+    def rollup(self, day, metric, dimension='all'):
+        return dict(DailyRollup.objects.filter(date=day, metric=metric, dimension=dimension)
+                    .values_list('value', 'count'))
+    
+    def test_build_for_today(self):
+        rows = DailyRollup.build_for_day(self.today)
+        self.assertEqual(DailyRollup.build_for_day(self.today), rows)  # idempotent
+        self.assertEqual(DailyRollup.objects.filter(date=self.today).count(), rows)
+        
+        self.assertEqual(self.rollup(self.today, 'devices_seen'), {'': 3})
+        self.assertEqual(self.rollup(self.today, 'devices_active', 'manufacturer'), {'Google': 2, 'Samsung': 1})
+        self.assertEqual(self.rollup(self.today, 'devices_registered', 'manufacturer'), {'Google': 2, 'Samsung': 1})
+        self.assertEqual(self.rollup(self.today, 'scans_completed'), {'': 1})
+        self.assertEqual(self.rollup(self.today, 'files_scanned', 'file_type'), {'image': 2, 'video': 1})
+        self.assertEqual(DailyRollup.objects.get(date=self.today, metric='files_scanned', dimension='all').size, 300)
+    
+    def test_past_days_skip_snapshots(self):
+        out = io.StringIO()
+        call_command('rollup_daily', '--backfill', '1', stdout=out)
+        self.assertIn(str(self.yesterday), out.getvalue())
+        self.assertEqual(self.rollup(self.yesterday, 'devices_registered', 'manufacturer'), {'Xiaomi': 1})
+        self.assertFalse(DailyRollup.objects.filter(date=self.yesterday, metric__in=DailyRollup.SNAPSHOT_METRICS))
+        self.assertEqual(self.rollup(self.yesterday, 'scans_completed'), {'': 0})
+    
+    def test_trends(self):
+        DailyRollup.build_for_day(self.today)
+        data = self.client.get('/api/devices/trends/?metric=devices_registered&dimension=manufacturer'
+                               '&days=2&top=1').json()
+        self.assertEqual(data['dates'], [str(self.yesterday), str(self.today)])
+        self.assertEqual(data['series'], [{'value': 'Google', 'total': 2, 'counts': [None, 2]}])
+        self.assertEqual(data['others'], {'value': None, 'total': 1, 'counts': [None, 1]})
+        
+        files = self.client.get('/api/devices/trends/?metric=files_scanned&days=1').json()
+        self.assertEqual(files['series'][0]['sizes'], [300])
+        
+        response = self.client.post('/api/devices/rollup/', {'date': str(self.today), 'backfill': 1},
+                                    content_type='application/json')
+        self.assertEqual(list(response.json()['rows']), [str(self.yesterday), str(self.today)])
+        data = self.client.get('/api/devices/trends/?metric=devices_registered&days=2').json()
+        self.assertEqual(data['series'][0]['counts'], [1, 3])
+
+
+class FastJSONTests(TestCase):
+    """
+    FastJSONRenderer / FastJSONParser (orjson) : même sortie que JSONRenderer / JSONParser de DRF
+    """
+    
+    PAYLOAD = {
+        'utc': datetime(2026, 1, 31, 12, 30, 15, 123456, tzinfo=ZoneInfo('UTC')),
+        'paris': datetime(2026, 7, 1, 8, 0, tzinfo=ZoneInfo('Europe/Paris')),
+        'naive': datetime(2026, 1, 31, 12, 30),
+        'day': date(2026, 1, 31),
+        'hour': dt_time(8, 15, 30),
+        'amount': Decimal('12.50'),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'lazy': gettext_lazy('Appareils'),
+        'text': 'é\u2028\u2029"',
+        'numbers': [1, -2, 3.5, 2 ** 63 - 1, None, True],
+        'nested': {1: 'clé entière', 'empty': [], 'set_like': ('a', 'b')},
+    }
+    
+    def render(self, renderer, data, media_type='application/json'):
+        return renderer.render(data, media_type, {})
+    
+    def test_renderer_parity(self):
+        self.assertEqual(self.render(FastJSONRenderer(), self.PAYLOAD), self.render(JSONRenderer(), self.PAYLOAD))
+        
+        # Cas repassés par le chemin standard
+        for data in [{'big': 2 ** 70}, None]:
+            self.assertEqual(self.render(FastJSONRenderer(), data), self.render(JSONRenderer(), data))
+        indented = 'application/json; indent=2'
+        self.assertEqual(self.render(FastJSONRenderer(), self.PAYLOAD, indented),
+                         self.render(JSONRenderer(), self.PAYLOAD, indented))
+    
+    def test_renderer_without_orjson(self):
+        with mock.patch('api.fastjson.orjson', None):
+            self.assertEqual(self.render(FastJSONRenderer(), self.PAYLOAD), self.render(JSONRenderer(), self.PAYLOAD))
+    
+    def parse(self, parser, body, encoding='utf-8'):
+        return parser.parse(io.BytesIO(body), 'application/json', {'encoding': encoding})
+    
+    def test_parser_parity(self):
+        for body in [b'{"a": [1, 2.5, null, true], "b": "\\u00e9\\n"}', '{"nom": "é"}'.encode(), b'[]', b'  3 ']:
+            with self.subTest(body=body):
+                self.assertEqual(self.parse(FastJSONParser(), body), self.parse(JSONParser(), body))
+        
+        latin = '{"nom": "é"}'.encode('latin-1')
+        self.assertEqual(self.parse(FastJSONParser(), latin, 'latin-1'), {'nom': 'é'})
+        
+        # Erreurs : repli sur le chemin standard, même message (NaN refusé comme par DRF)
+        for body in [b'{"a": ', b'\xff', b'{"a": NaN}']:
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as fast:
+                    self.parse(FastJSONParser(), body)
+                with self.assertRaises(ParseError) as reference:
+                    self.parse(JSONParser(), body)
+                self.assertEqual(str(fast.exception), str(reference.exception))
+
+
+class SparseFieldsTests(ApiTestCase):
+    """
+    ?fields= / ?omit= : champs sérialisés et colonnes chargées
+    """
+    
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        self.device = self.create_device('phone-0')
+        self.create_device('phone-1', model='Galaxy', manufacturer='Samsung')
+        self.make_scan('scan-1', [{'path': f'/sdcard/f{i}.jpg', 'size_bytes': 10 * (i + 1)} for i in range(2)])
+    
+    def get(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), ' '.join(query['sql'] for query in queries)
+    
+    def test_device_list_fields(self):
+        data, sql = self.get('/api/devices/?fields=id,androidId,unknown&limit=1')
+        self.assertEqual(list(data['results'][0]), ['id', 'androidId'])
+        self.assertNotIn('"model"', sql)
+        
+        # La pagination keyset lit toujours sa colonne d'ordre
+        data, _ = self.get(data['next'])
+        self.assertEqual(list(data['results'][0]), ['id', 'androidId'])
+        
+        data, sql = self.get('/api/devices/?omit=created_at,last_seen')
+        self.assertNotIn('last_seen', data['results'][0])
+        self.assertIn('manufacturer', data['results'][0])
+    
+    def test_file_scans_skip_unrequested_annotations(self):
+        url = f'/api/devices/{self.device.pk}/file_scans/'
+        data, sql = self.get(url)
+        self.assertEqual(data['scans'][0]['files_count'], 2)
+        self.assertIn('COUNT(', sql.upper().replace('COUNT(*)', ''))
+        
+        data, sql = self.get(f'{url}?fields=scan_id,status')
+        self.assertEqual(data['scans'], [{'scan_id': 'scan-1', 'status': 'completed'}])
+        self.assertNotIn('COUNT(', sql.upper().replace('COUNT(*)', ''))
+    
+    def test_file_items_fields_keep_cursor(self):
+        url = f'/api/devices/{self.device.pk}/file_scan_items/?scan_id=scan-1&fields=name&limit=1'
+        data, _ = self.get(url)
+        self.assertEqual(data['files'], [{'name': 'f1.jpg'}])
+        data, _ = self.get(data['next'])
+        self.assertEqual(data['files'], [{'name': 'f0.jpg'}])
+    
+    def test_search_fields(self):
+        data, sql = self.get('/api/devices/search/?q=phone-0&fields=id,androidId')
+        self.assertEqual(data['results'], [{'id': self.device.pk, 'androidId': 'phone-0'}])
+        self.assertNotIn('api_filelist', sql)
+
+
+@override_settings(DEVICE_RATE_LIMITS={})
+class BenchEndpointsTests(ApiTestCase):
+    """
+    Commande bench_endpoints : scénarios, percentiles et comparaison à une référence
+    """
+    
+    login = False
+    default_device = False
+    
+    def setUp(self):
+        super().setUp()
+        self.command = BenchEndpointsCommand(stdout=io.StringIO())
+    
+    def test_scenarios_run(self):
+        options = {'requests': 3, 'uploads': 2}
+        results = self.command.run_benchmarks(set(BENCHMARKS), [20, 40], options)
+        expected = set(BENCHMARKS) - {'upload_file_list'} | {'upload_file_list_20', 'upload_file_list_40'}
+        self.assertEqual(set(results), expected)
+        for result in results.values():
+            self.assertTrue(result['min_ms'] <= result['p50_ms'] <= result['p95_ms'] <= result['max_ms'])
+        self.assertEqual(results['heartbeat']['requests'], 3)
+        self.assertEqual(FileList.objects.filter(scan_id__startswith='bench-40-').count(), 2)
+        self.assertEqual(FileItem.objects.filter(file_list__scan_id='bench-40-0').count(), 40)
+    
+    def test_http_error_fails(self):
+        with self.assertRaisesMessage(CommandError, 'HTTP 403'):
+            self.command.timed(lambda i: self.client.get('/api/devices/0/'), 1)
+    
+    def test_compare_flags_regressions(self):
+        baseline = {'heartbeat': {'p50_ms': 1.0, 'p95_ms': 2.0}, 'stats': {'p50_ms': 1.0, 'p95_ms': 2.0}}
+        results = {
+            'heartbeat': {'p50_ms': 1.05, 'p95_ms': 2.1},
+            'stats': {'p50_ms': 1.0, 'p95_ms': 2.5},
+            'search_files': {'p50_ms': 1.0, 'p95_ms': 2.0},
+        }
+        self.assertEqual(self.command.compare(baseline, results, threshold=10.0), ['stats'])
+        self.assertIn('absent de la référence', self.command.stdout.getvalue())
+    
+    def test_invalid_options(self):
+        with self.assertRaisesMessage(CommandError, 'Benchmarks inconnus : nope'):
+            call_command('bench_endpoints', '--only', 'heartbeat,nope')
+        with self.assertRaisesMessage(CommandError, '--sizes'):
+            call_command('bench_endpoints', '--sizes', '10,abc')
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as baseline:
+            baseline.write('{}')
+            baseline.flush()
+            with self.assertRaisesMessage(CommandError, 'Référence illisible'):
+                call_command('bench_endpoints', '--compare', baseline.name)
@@ -0,0 +1,160 @@
+# api/throttling.py
+"""
+Limitation de débit des endpoints publics (téléphone → serveur)
+
+Quotas par action, par android_id et par IP, appliqués par GCRA (Generic
+Cell Rate Algorithm, équivalent d'un seau à jetons) : une seule clé de
+cache par compteur, qui contient l'heure d'arrivée théorique (TAT) de la
+prochaine requête. "N/période" autorise une rafale de N requêtes, puis une
+requête toutes les période/N secondes ; pas de double rafale autour d'une
+frontière de fenêtre comme avec un compteur par fenêtre fixe.
+
+Le cache Django n'a pas de compare-and-set : la mise à jour du TAT est
+rendue atomique par cache.add (atomique sur Redis, Memcached et la base) :
+chaque état porte un jeton unique, et seul le premier qui « réserve » le
+jeton de l'état lu (add de <clé>:<jeton>) peut le remplacer. Les autres
+relisent l'état et recommencent.
+"""
+import math
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    "10/min" → (10, 60) : rafale autorisée et période sur laquelle elle se reconstitue
+    """
+    num, period = rate.split('/')
+    return int(num), PERIODS[period.strip()[0].lower()]
+
+
+class GCRA:
+    """
+    Au plus `capacity` requêtes d'affilée, puis une toutes les `period / capacity` secondes
+    """
+    
+    # Tentatives de mise à jour concurrente avant de refuser la requête
+    MAX_ATTEMPTS = 8
+    # Durée de vie d'une réservation (le temps d'écrire le nouvel état)
+    CLAIM_TIMEOUT = 2
+    # Marge des arrondis flottants sur les TAT
+    EPSILON = 1e-6
+    
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.interval = period / capacity
+    
+    def consume(self, cache, key, now=None):
+        """
+        Compte une requête ; retourne 0 si acceptée, sinon l'attente en secondes
+        """
+        now = time.time() if now is None else now
+        for _ in range(self.MAX_ATTEMPTS):
+            state = cache.get(key)
+            tat = max(state[1], now) if state else now
+            new_tat = tat + self.interval
+            if new_tat - now - self.period > self.EPSILON:
+                # Refus : rien n'est écrit
+                return new_tat - self.period - now
+            if self._swap(cache, key, state, new_tat, now):
+                return 0
+        # Compteur disputé sans relâche : la requête attend son tour
+        return self.interval
+    
+    def refund(self, cache, key, now=None):
+        """Rend une requête comptée par consume (refusée par un autre quota)"""
+        now = time.time() if now is None else now
+        for _ in range(self.MAX_ATTEMPTS):
+            state = cache.get(key)
+            if state is None or self._swap(cache, key, state, state[1] - self.interval, now):
+                return
+    
+    def _swap(self, cache, key, state, tat, now):
+        """
+        Remplace l'état lu `state` par `tat`, sauf s'il a été modifié entre-temps
+        
+        La clé expire quand le TAT est passé : son absence vaut alors un compteur plein.
+        """
+        new_state = (secrets.token_hex(8), tat)
+        timeout = max(math.ceil(tat - now), 0) + 1
+        if state is None:
+            return cache.add(key, new_state, timeout=timeout)
+        if not cache.add(f"{key}:{state[0]}", 1, timeout=self.CLAIM_TIMEOUT):
+            return False
+        cache.set(key, new_state, timeout=timeout)
+        return True
+
+
+class DeviceRateThrottle(BaseThrottle):
+    """
+    Throttle DRF configuré par settings.DEVICE_RATE_LIMITS :
+    
+        {'heartbeat': {'android_id': '12/min', 'ip': '600/min'}, ...}
+    
+    Le quota IP est vérifié en premier (sans lire le corps de la requête) ;
+    une requête refusée par le quota android_id ne compte pas pour l'IP. Un
+    refus renvoie 429 avec l'en-tête Retry-After.
+    """
+    
+    _limiters = {}
+    
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'DEVICE_RATE_LIMIT_CACHE', 'default')]
+        self.wait_seconds = None
+    
+    @classmethod
+    def get_limiter(cls, rate):
+        limiter = cls._limiters.get(rate)
+        if limiter is None:
+            limiter = cls._limiters[rate] = GCRA(*parse_rate(rate))
+        return limiter
+    
+    def get_android_id(self, request):
+        android_id = request.META.get('HTTP_X_ANDROID_ID')
+        if not android_id:
+            data = request.data
+            android_id = data.get('androidId') if hasattr(data, 'get') else None
+        return str(android_id).strip() if android_id else None
+    
+    def allow_request(self, request, view):
+        action = getattr(view, 'action', None)
+        limits = getattr(settings, 'DEVICE_RATE_LIMITS', {}).get(action)
+        if not limits:
+            return True
+        
+        now = time.time()
+        ip_counted = None
+        if limits.get('ip'):
+            ip_limiter = self.get_limiter(limits['ip'])
+            ip_key = f"throttle:{action}:ip:{self.get_ident(request)}"
+            wait = ip_limiter.consume(self.cache, ip_key, now)
+            if wait:
+                self.wait_seconds = wait
+                return False
+            ip_counted = (ip_limiter, ip_key)
+        
+        if limits.get('android_id'):
+            android_id = self.get_android_id(request)
+            if android_id:
+                wait = self.get_limiter(limits['android_id']).consume(
+                    self.cache, f"throttle:{action}:aid:{android_id}", now
+                )
+                if wait:
+                    if ip_counted:
+                        ip_limiter, ip_key = ip_counted
+                        ip_limiter.refund(self.cache, ip_key, now)
+                    self.wait_seconds = wait
+                    return False
+        
+        return True
+    
+    def wait(self):
+        return self.wait_seconds
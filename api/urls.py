@@ -15,8 +15,8 @@ extra_urlpatterns = [
     # COMMENTEZ CES LIGNES POUR L'INSTANT
     # path('stats/global/', views.global_stats, name='global-stats'),
     # path('stats/files/', views.files_global_stats, name='files-global-stats'),
-    # path('export/devices/', views.export_devices_csv, name='export-devices'),
-    # path('export/files/', views.export_files_csv, name='export-files'),
+    path('export/devices/', views.export_devices_csv, name='export-devices'),
+    path('export/files/', views.export_files_csv, name='export-files'),
     # path('dashboard/', views.dashboard, name='dashboard'),
     # path('webhook/device/<str:android_id>/', views.device_webhook, name='device-webhook'),
 ]
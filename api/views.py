@@ -1,12 +1,32 @@
 # api/views.py
 from rest_framework import viewsets, status, generics
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.utils.urls import replace_query_param
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Count, Sum, Q
+from django.db.models import Count, Max, Sum, Q
 from django.shortcuts import get_object_or_404
-from .models import Device, FileList, FileItem, FileScanStats
+from django.db import transaction
+from .models import (
+    Device, FileList, FileItem, FileScanStats, DirectorySize, DuplicateGroup, FleetCounter, DailyRollup,
+    CommandFanOut, DeviceCommand
+)
+from . import metrics
+from .cache import (
+    cache_summary, cache_timeout, cached_response, conditional_response, get_cache, get_version,
+    invalidate_device, strong_etag
+)
+from .counters import counter_delta, scan_contributions
+from .throttling import DeviceRateThrottle
+from .pagination import DeviceCursorPagination, ScanCursorPagination, FileSizeCursorPagination
+from .diff import ScanDiff, iter_scan_rows
+from .exports import (
+    CONTENT_TYPES, DEVICE_EXPORT_FIELDS, FILE_EXPORT_FIELDS,
+    iter_bytes, json_encoder, streaming_export_response
+)
+from .search import NGRAM_SIZE, search_file_ids, search_index_cache, use_database_index
 from .serializers import (
     # Serializers existants
     DeviceRegistrationSerializer, 
@@ -17,14 +37,27 @@ from .serializers import (
     CommandResponseSerializer,
     PendingCommandsSerializer,
     ServerKeyRegenerateSerializer,
+    DeviceCommandSerializer,
+    FanOutCommandSerializer,
+    CommandFanOutSerializer,
+    CommandFetchSerializer,
+    CommandAckSerializer,
     
     # Nouveaux serializers pour les fichiers
     FileItemSerializer,
     FileListSerializer,
     FileListDetailSerializer,
+    FileScanItemsSerializer,
     FileUploadSerializer,
     FileScanStatsSerializer,
     FileSearchSerializer,
+    ExportSerializer,
+    DirectoryTreeSerializer,
+    ScanDiffSerializer,
+    DuplicateGroupSerializer,
+    DuplicatesSerializer,
+    TrendsSerializer,
+    RollupSerializer,
     ListFilesCommandSerializer,
     DeviceWithFilesSerializer,
     FileTypeSummarySerializer,
@@ -41,20 +74,23 @@ class DeviceViewSet(viewsets.ModelViewSet):
     ViewSet pour gérer les appareils Android
     """
     queryset = Device.objects.all()
+    pagination_class = DeviceCursorPagination
     
     def get_permissions(self):
         """
         Définit les permissions selon l'action
-        - PUBLIC (téléphone → serveur) : register, heartbeat, upload_file_list
-        - ADMIN (serveur → téléphone) : send_command, pending_commands, request_file_list
+        - PUBLIC (téléphone → serveur) : register, heartbeat, upload_file_list, fetch_commands, command_ack
+        - ADMIN (serveur → téléphone) : send_command, pending_commands, request_file_list, fan_out
         - ADMIN (gestion) : tout le reste
         """
-        if self.action in ['register', 'heartbeat', 'upload_file_list']:
+        if self.action in ['register', 'heartbeat', 'upload_file_list', 'fetch_commands', 'command_ack']:
             # Actions du téléphone vers le serveur (publiques)
             permission_classes = [AllowAny]
         elif self.action in ['send_command', 'pending_commands', 'regenerate_server_key', 
-                            'request_file_list', 'file_scans', 'file_scan_detail', 
-                            'file_stats', 'search_files']:
+                            'request_file_list', 'file_scans', 'file_scan_detail', 'file_scan_items',
+                            'file_stats', 'directory_tree', 'scan_diff', 'duplicates', 'duplicates_report',
+                            'fleet_duplicates', 'trends', 'rollup', 'search_files', 'fan_out', 'fan_out_status',
+                            'command_metrics', 'cache_metrics']:
             # Actions du serveur vers le téléphone (admin seulement)
             permission_classes = [IsAdminUser]
         else:
@@ -74,6 +110,14 @@ class DeviceViewSet(viewsets.ModelViewSet):
             return DeviceHeartbeatSerializer
         elif self.action == 'send_command':
             return ServerCommandSerializer
+        elif self.action == 'fan_out':
+            return FanOutCommandSerializer
+        elif self.action == 'fan_out_status':
+            return CommandFanOutSerializer
+        elif self.action == 'fetch_commands':
+            return CommandFetchSerializer
+        elif self.action == 'command_ack':
+            return CommandAckSerializer
         elif self.action == 'list':
             return DeviceListSerializer
         elif self.action == 'retrieve':
@@ -90,8 +134,22 @@ class DeviceViewSet(viewsets.ModelViewSet):
             return FileListSerializer
         elif self.action == 'file_scan_detail':
             return FileListDetailSerializer
+        elif self.action == 'file_scan_items':
+            return FileScanItemsSerializer
         elif self.action == 'file_stats':
             return FileScanStatsSerializer
+        elif self.action == 'directory_tree':
+            return DirectoryTreeSerializer
+        elif self.action == 'scan_diff':
+            return ScanDiffSerializer
+        elif self.action == 'duplicates':
+            return DuplicateGroupSerializer
+        elif self.action in ['duplicates_report', 'fleet_duplicates']:
+            return DuplicatesSerializer
+        elif self.action == 'trends':
+            return TrendsSerializer
+        elif self.action == 'rollup':
+            return RollupSerializer
         elif self.action == 'search_files':
             return FileSearchSerializer
         
@@ -129,11 +187,67 @@ class DeviceViewSet(viewsets.ModelViewSet):
         if last_24h and last_24h.lower() == 'true':
             queryset = queryset.filter(last_seen__gte=timezone.now() - timedelta(hours=24))
         
-        return queryset.order_by('-last_seen')
+        # ?fields= / ?omit= : seules les colonnes utiles sont chargées
+        if self.action in ['list', 'retrieve']:
+            queryset = self.get_serializer_class().sparse_queryset(
+                queryset, self.request, keep=DeviceCursorPagination.ordering
+            )
+        
+        return queryset.order_by(*DeviceCursorPagination.ordering)
+    
+    # ===== VALIDATEURS DES REQUÊTES CONDITIONNELLES =====
+    
+    def _device_validators(self, request, pk=None):
+        """Détail d'un appareil : toute écriture met à jour updated_at"""
+        updated_at = Device.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        return strong_etag(request.get_full_path(), pk, updated_at.isoformat()), updated_at
+    
+    def _scan_validators(self, request, pk=None):
+        """
+        Vues d'un scan désigné par ?scan_id= (obligatoire, comme dans la vue :
+        sans lui, pas d'ETag et la vue répond 400)
+        """
+        scan_id = request.query_params.get('scan_id')
+        if not scan_id:
+            return None
+        scan = FileList.objects.filter(device_id=pk, scan_id=scan_id).values_list('id', 'updated_at').first()
+        return self._scan_etag(request, pk, scan)
+    
+    def _file_stats_validators(self, request, pk=None):
+        """file_stats : ?scan_id= facultatif, sinon le dernier scan complété"""
+        scan_id = request.query_params.get('scan_id')
+        if scan_id:
+            return self._scan_validators(request, pk)
+        scan = Device.objects.filter(pk=pk, latest_completed_scan__isnull=False).values_list(
+            'latest_completed_scan', 'latest_completed_scan__updated_at'
+        ).first()
+        return self._scan_etag(request, pk, scan)
+    
+    def _scan_etag(self, request, pk, scan):
+        """
+        ETag d'une vue de scan : (scan, updated_at, version des stats) + version
+        de l'appareil du cache des réponses (infos appareil incluses dans le détail)
+        """
+        if scan is None:
+            return None
+        
+        scan_pk, updated_at = scan
+        etag = strong_etag(
+            request.get_full_path(), scan_pk, updated_at.isoformat(),
+            FileScanStats.STATS_VERSION, get_version(f'device:{pk}')
+        )
+        return etag, None
+    
+    @conditional_response(_device_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     # ===== 1. ACTIONS DU TÉLÉPHONE VERS LE SERVEUR (PUBLIQUES) =====
     
-    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=[DeviceRateThrottle])
     def register(self, request):
         """
         Endpoint PUBLIC pour l'enregistrement initial d'un appareil
@@ -174,7 +288,8 @@ class DeviceViewSet(viewsets.ModelViewSet):
                 'instructions': 'Cette clé sera utilisée par le SERVEUR pour vous contacter. Stockez-la pour vérifier l\'identité du serveur.'
             }, status=status.HTTP_201_CREATED)
     
-    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=[DeviceRateThrottle])
     def heartbeat(self, request):
         """
         Endpoint PUBLIC pour les mises à jour périodiques
@@ -202,7 +317,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
             if 'is_roaming' in serializer.validated_data:
                 device.is_roaming = serializer.validated_data['is_roaming']
             
-            device.save()
+            device.save(update_fields=sorted(Device.HEARTBEAT_FIELDS))
             
             return Response({
                 'status': 'ok',
@@ -217,7 +332,8 @@ class DeviceViewSet(viewsets.ModelViewSet):
     
     # ===== 2. NOUVEL ENDPOINT : UPLOAD DE LA LISTE DES FICHIERS =====
     
-    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=[DeviceRateThrottle])
     def upload_file_list(self, request):
         """
         Endpoint PUBLIC pour que le téléphone envoie sa liste de fichiers
@@ -241,85 +357,100 @@ class DeviceViewSet(viewsets.ModelViewSet):
                 'error': 'Appareil non trouvé'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Vérifier si le scan existe déjà
-        file_list, created = FileList.objects.update_or_create(
-            scan_id=scan_id,
-            defaults={
-                'device': device,
-                'scan_requested_at': timezone.now(),
-                'scan_started_at': timezone.datetime.fromtimestamp(
-                    data.get('scan_started_at') / 1000,
-                    tz=timezone.get_current_timezone()
-                ) if data.get('scan_started_at') else None,
-                'scan_completed_at': timezone.datetime.fromtimestamp(
-                    data.get('scan_completed_at') / 1000,
-                    tz=timezone.get_current_timezone()
-                ) if data.get('scan_completed_at') else None,
-                'scan_duration_ms': data.get('scan_duration_ms'),
-                'total_files': data.get('total_files'),
-                'total_size_bytes': data.get('total_size_bytes'),
-                'command_id': data.get('command_id', ''),
-                'status': data.get('status'),
-                'error_message': data.get('error_message', ''),
-            }
-        )
-        
-        if not created:
-            # Si le scan existe déjà, on supprime les anciens fichiers
-            file_list.files.all().delete()
-        
-        # Insérer les fichiers par lots pour optimiser les performances
-        files_to_create = []
-        for file_data in data.get('files', []):
-            # Convertir les timestamps si nécessaire
-            files_to_create.append(FileItem(
-                file_list=file_list,
-                path=file_data.get('path'),
-                parent_path=file_data.get('parent_path', ''),
-                name=file_data.get('name'),
-                extension=file_data.get('extension', ''),
-                size_bytes=file_data.get('size_bytes', 0),
-                last_modified=file_data.get('last_modified'),
-                last_accessed=file_data.get('last_accessed'),
-                created_at_time=file_data.get('created_at_time'),
-                file_type=file_data.get('file_type', 'other'),
-                mime_type=file_data.get('mime_type', ''),
-                is_readable=file_data.get('is_readable', True),
-                is_writable=file_data.get('is_writable', False),
-                is_hidden=file_data.get('is_hidden', False),
-                is_directory=file_data.get('is_directory', False),
-                md5_hash=file_data.get('md5_hash', ''),
-                sha1_hash=file_data.get('sha1_hash', ''),
-                media_width=file_data.get('media_width'),
-                media_height=file_data.get('media_height'),
-                media_duration_ms=file_data.get('media_duration_ms'),
-                media_date_taken=file_data.get('media_date_taken'),
-                media_gps_lat=file_data.get('media_gps_lat'),
-                media_gps_lng=file_data.get('media_gps_lng'),
-                apk_package_name=file_data.get('apk_package_name', ''),
-                apk_version_code=file_data.get('apk_version_code'),
-                apk_version_name=file_data.get('apk_version_name', ''),
-                apk_min_sdk=file_data.get('apk_min_sdk'),
-            ))
-        
-        # Insertion en masse (beaucoup plus rapide)
-        if files_to_create:
-            FileItem.objects.bulk_create(files_to_create, batch_size=1000)
-        
-        # Mettre à jour le compteur réel
-        actual_count = file_list.files.count()
-        if actual_count != data.get('total_files'):
-            file_list.total_files = actual_count
-            file_list.save(update_fields=['total_files'])
+        # Scan, fichiers et compteurs de flotte écrits dans une même transaction
+        with transaction.atomic():
+            # Contribution actuelle du scan aux compteurs (ré-upload)
+            existing = FileList.objects.select_for_update().filter(scan_id=scan_id).first()
+            previous = scan_contributions(existing) if existing else {}
+            
+            # Vérifier si le scan existe déjà
+            file_list, created = FileList.objects.update_or_create(
+                scan_id=scan_id,
+                defaults={
+                    'device': device,
+                    'scan_requested_at': timezone.now(),
+                    'scan_started_at': timezone.datetime.fromtimestamp(
+                        data.get('scan_started_at') / 1000,
+                        tz=timezone.get_current_timezone()
+                    ) if data.get('scan_started_at') else None,
+                    'scan_completed_at': timezone.datetime.fromtimestamp(
+                        data.get('scan_completed_at') / 1000,
+                        tz=timezone.get_current_timezone()
+                    ) if data.get('scan_completed_at') else None,
+                    'scan_duration_ms': data.get('scan_duration_ms'),
+                    'total_files': data.get('total_files'),
+                    'total_size_bytes': data.get('total_size_bytes'),
+                    'command_id': data.get('command_id', ''),
+                    'status': data.get('status'),
+                    'error_message': data.get('error_message', ''),
+                }
+            )
+            
+            if not created:
+                # Si le scan existe déjà, on supprime les anciens fichiers
+                file_list.files.all().delete()
+            
+            # Insérer les fichiers par lots pour optimiser les performances
+            files_to_create = []
+            for file_data in data.get('files', []):
+                # Convertir les timestamps si nécessaire
+                files_to_create.append(FileItem(
+                    file_list=file_list,
+                    path=file_data.get('path'),
+                    parent_path=file_data.get('parent_path', ''),
+                    name=file_data.get('name'),
+                    extension=file_data.get('extension', ''),
+                    size_bytes=file_data.get('size_bytes', 0),
+                    last_modified=file_data.get('last_modified'),
+                    last_accessed=file_data.get('last_accessed'),
+                    created_at_time=file_data.get('created_at_time'),
+                    file_type=file_data.get('file_type', 'other'),
+                    mime_type=file_data.get('mime_type', ''),
+                    is_readable=file_data.get('is_readable', True),
+                    is_writable=file_data.get('is_writable', False),
+                    is_hidden=file_data.get('is_hidden', False),
+                    is_directory=file_data.get('is_directory', False),
+                    md5_hash=file_data.get('md5_hash', ''),
+                    sha1_hash=file_data.get('sha1_hash', ''),
+                    media_width=file_data.get('media_width'),
+                    media_height=file_data.get('media_height'),
+                    media_duration_ms=file_data.get('media_duration_ms'),
+                    media_date_taken=file_data.get('media_date_taken'),
+                    media_gps_lat=file_data.get('media_gps_lat'),
+                    media_gps_lng=file_data.get('media_gps_lng'),
+                    apk_package_name=file_data.get('apk_package_name', ''),
+                    apk_version_code=file_data.get('apk_version_code'),
+                    apk_version_name=file_data.get('apk_version_name', ''),
+                    apk_min_sdk=file_data.get('apk_min_sdk'),
+                ))
+            
+            # Insertion en masse (beaucoup plus rapide)
+            if files_to_create:
+                FileItem.objects.bulk_create(files_to_create, batch_size=1000)
+            search_index_cache.invalidate(file_list.id)
+            
+            # Mettre à jour le compteur réel
+            actual_count = file_list.files.count()
+            if actual_count != data.get('total_files'):
+                file_list.total_files = actual_count
+                file_list.save(update_fields=['total_files'])
+            
+            FleetCounter.apply(counter_delta(previous, scan_contributions(file_list)))
         
         # Générer les statistiques agrégées
         try:
             FileScanStats.objects.filter(file_list=file_list).delete()
             FileScanStats.generate_from_file_list(file_list)
+            DirectorySize.build_for_file_list(file_list)
+            DuplicateGroup.build_for_file_list(file_list)
         except Exception as e:
             # Log l'erreur mais ne pas faire échouer la requête
             print(f"Erreur génération stats: {e}")
         
+        # Pointeur vers le dernier scan complété de l'appareil
+        device.refresh_latest_completed_scan()
+        invalidate_device(device.id)
+        
         return Response({
             'status': 'success',
             'message': f'Liste de fichiers reçue avec {actual_count} fichiers',
@@ -331,6 +462,94 @@ class DeviceViewSet(viewsets.ModelViewSet):
             'total_size_gb': round(file_list.total_size_bytes / (1024 ** 3), 2)
         }, status=status.HTTP_201_CREATED)
     
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=[DeviceRateThrottle])
+    def fetch_commands(self, request):
+        """
+        Endpoint PUBLIC pour que le téléphone récupère ses commandes en attente
+        POST /api/devices/fetch_commands/
+        
+        Les commandes retournées passent au statut 'delivered'.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            device = Device.objects.get(android_id=serializer.validated_data['androidId'])
+        except Device.DoesNotExist:
+            return Response({
+                'error': 'Appareil non trouvé'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        now = timezone.now()
+        commands = list(
+            device.commands.filter(status='queued').filter(
+                Q(expires_at__isnull=True) | Q(expires_at__gt=now)
+            ).select_related('fanout')[:serializer.validated_data['limit']]
+        )
+        
+        # Marquer comme délivrées (seulement celles encore en file)
+        DeviceCommand.objects.filter(
+            id__in=[command.id for command in commands],
+            status='queued'
+        ).update(status='delivered', delivered_at=now, updated_at=now)
+        
+        for command in commands:
+            command.status = 'delivered'
+            metrics.record_command_latency(command.command, 'enqueue_to_deliver', now - command.enqueued_at)
+        
+        return Response({
+            'device_id': device.id,
+            'commands_count': len(commands),
+            'commands': DeviceCommandSerializer(commands, many=True).data,
+            'ack_endpoint': '/api/devices/command_ack/',
+        })
+    
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=[DeviceRateThrottle])
+    def command_ack(self, request):
+        """
+        Endpoint PUBLIC pour accuser réception / remonter le résultat d'une commande
+        POST /api/devices/command_ack/
+        
+        status : received, executing, done, failed (+ result pour done/failed)
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        try:
+            command = DeviceCommand.objects.select_related('device').get(
+                command_id=data['command_id'],
+                device__android_id=data['androidId']
+            )
+        except DeviceCommand.DoesNotExist:
+            return Response({
+                'error': 'Commande non trouvée pour cet appareil'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        previous_status = command.status
+        if not command.acknowledge(data['status'], data.get('result'), data.get('error_message', '')):
+            return Response({
+                'error': f'Transition {previous_status} → {data["status"]} refusée',
+                'command_id': command.command_id,
+                'status': command.status,
+            }, status=status.HTTP_409_CONFLICT)
+        
+        # Un list_files en échec ne produira jamais d'upload : clôturer le scan
+        if command.command == 'list_files' and command.status == 'failed':
+            FileList.objects.filter(
+                command_id=command.command_id,
+                status__in=['pending', 'scanning']
+            ).update(status='failed', error_message=command.error_message, updated_at=timezone.now())
+            invalidate_device(command.device_id)
+        
+        return Response({
+            'status': 'ok',
+            'command_id': command.command_id,
+            'command_status': command.status,
+        })
+    
     # ===== 3. ACTIONS DU SERVEUR VERS LE TÉLÉPHONE (ADMIN SEULEMENT) =====
     
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
@@ -349,12 +568,28 @@ class DeviceViewSet(viewsets.ModelViewSet):
         priority = serializer.validated_data.get('priority', 'normal')
         expires_in = serializer.validated_data.get('expires_in')
         
-        command_id = f"cmd_{device.id}_{int(timezone.now().timestamp())}"
+        require_ack = serializer.validated_data.get('require_ack', True)
+        schedule_at = serializer.validated_data.get('schedule_at')
+        
+        command_id = f"cmd_{device.id}_{int(timezone.now().timestamp())}_{uuid.uuid4().hex[:8]}"
+        
+        queued_command, created = DeviceCommand.enqueue(
+            device,
+            command_id,
+            command,
+            params=params,
+            priority=priority,
+            expires_in=expires_in,
+            require_ack=require_ack,
+            schedule_at=schedule_at,
+        )
         
         return Response({
-            'status': 'command_queued',
-            'message': f'Commande {command} mise en file d\'attente',
-            'command_id': command_id,
+            'status': 'command_scheduled' if queued_command.status == 'scheduled'
+            else 'command_queued' if created else 'command_coalesced',
+            'message': f'Commande {command} mise en file d\'attente' if created
+            else f'Commande {command} fusionnée avec une commande déjà en file',
+            'command_id': queued_command.command_id,
             'device': {
                 'id': device.id,
                 'android_id': device.android_id,
@@ -364,6 +599,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
             'params': params,
             'priority': priority,
             'expires_in': expires_in,
+            'schedule_at': queued_command.schedule_at,
             'queued_at': timezone.now(),
             'verification_required': True,
             'verification_method': 'Le téléphone doit vérifier que l\'expéditeur possède la server_key',
@@ -393,15 +629,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
         
         # Créer un scan_id unique
         scan_id = f"scan_{device.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
-        
-        # Créer l'entrée FileList en attente
-        file_list = FileList.objects.create(
-            device=device,
-            scan_id=scan_id,
-            scan_requested_at=timezone.now(),
-            status='pending',
-            command_id=f"cmd_{device.id}_{int(timezone.now().timestamp())}"
-        )
+        command_id = f"cmd_{device.id}_{int(timezone.now().timestamp())}_{uuid.uuid4().hex[:8]}"
         
         # Préparer la commande pour le téléphone
         command_data = {
@@ -412,18 +640,65 @@ class DeviceViewSet(viewsets.ModelViewSet):
             },
             'priority': request.data.get('priority', 'normal'),
             'expires_in': request.data.get('expires_in', 3600),
-            'require_ack': True
+            'require_ack': True,
+            'schedule_at': request.data.get('schedule_at'),
         }
         
         # Valider la commande
         command_serializer = ServerCommandSerializer(data=command_data)
         command_serializer.is_valid(raise_exception=True)
+        validated_command = command_serializer.validated_data
+        
+        # Commande et scan en attente dans la même transaction : le téléphone
+        # ne peut pas recevoir (ni le dispatcher fusionner) une commande sans scan
+        with transaction.atomic():
+            queued_command, created = DeviceCommand.enqueue(
+                device,
+                command_id,
+                'list_files',
+                params=validated_command['params'],
+                priority=validated_command['priority'],
+                expires_in=validated_command.get('expires_in'),
+                require_ack=validated_command['require_ack'],
+                schedule_at=validated_command.get('schedule_at'),
+            )
+            if created:
+                file_list = FileList.objects.create(
+                    device=device,
+                    scan_id=scan_id,
+                    scan_requested_at=timezone.now(),
+                    status='scanning',
+                    command_id=command_id
+                )
+                FleetCounter.apply(scan_contributions(file_list, with_files=False))
         
-        # Mettre à jour le statut
-        file_list.status = 'scanning'
-        file_list.save()
+        if not created:
+            # Un scan identique attend déjà d'être délivré : pas de second scan
+            file_list = FileList.objects.filter(command_id=queued_command.command_id).first()
+            return Response({
+                'status': 'command_coalesced',
+                'message': f'Une demande de liste de fichiers est déjà en attente pour {device.model}',
+                'device': {
+                    'id': device.id,
+                    'android_id': device.android_id,
+                    'model': device.model,
+                },
+                'scan': {
+                    'id': file_list.id,
+                    'scan_id': file_list.scan_id,
+                    'status': file_list.status,
+                    'requested_at': file_list.scan_requested_at
+                } if file_list else None,
+                'command': {
+                    'command_id': queued_command.command_id,
+                    'command': queued_command.command,
+                    'params': queued_command.effective_params,
+                    'priority': queued_command.priority,
+                    'coalesced_count': queued_command.coalesced_count,
+                },
+            }, status=status.HTTP_202_ACCEPTED)
         
-        # TODO: Ici, vous enverriez réellement la commande au téléphone via votre système de push
+        command_data['command_id'] = command_id
         
         return Response({
             'status': 'command_sent',
@@ -457,8 +732,10 @@ class DeviceViewSet(viewsets.ModelViewSet):
         """
         device = self.get_object()
         
-        # TODO: Implémenter la file d'attente réelle
-        pending_commands = []
+        pending_commands = device.commands.filter(status='queued').filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now())
+        ).select_related('fanout')
+        pending_commands = DeviceCommandSerializer(pending_commands, many=True).data
         
         return Response({
             'device_id': device.id,
@@ -492,9 +769,90 @@ class DeviceViewSet(viewsets.ModelViewSet):
             'instructions': 'Communiquez cette nouvelle clé au téléphone pour qu\'il mette à jour sa vérification.'
         }, status=status.HTTP_200_OK)
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def fan_out(self, request):
+        """
+        Endpoint ADMIN pour envoyer une commande à tous les appareils d'un filtre
+        POST /api/devices/fan_out/
+        
+        Filtres : manufacturer, android_version, is_active, last_seen_after,
+        last_seen_before, seen_within_hours, device_ids
+        Programmation : schedule_at, ou local_time ("HH:MM" dans le fuseau de chaque appareil)
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        fanout = CommandFanOut.objects.create(
+            command=data['command'],
+            params=data.get('params', {}),
+            priority=data.get('priority', 'normal'),
+            expires_in=data.get('expires_in'),
+            require_ack=data.get('require_ack', True),
+            schedule_at=data.get('schedule_at'),
+            local_time=data.get('local_time', ''),
+            filters=serializer.get_filters(),
+        )
+        
+        # Insertion des commandes par le dispatcher (run_command_dispatcher) :
+        # la requête rend la main aussitôt, la progression se suit par status_url
+        return Response({
+            'status': 'fan_out_pending',
+            'message': f'Diffusion de {fanout.command} enregistrée, commandes insérées par le dispatcher',
+            'fanout_id': fanout.id,
+            'fanout': CommandFanOutSerializer(fanout).data,
+            'status_url': f'/api/devices/fan_out_status/?fanout_id={fanout.id}',
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def fan_out_status(self, request):
+        """
+        Progression d'une diffusion
+        GET /api/devices/fan_out_status/?fanout_id=XXX
+        """
+        fanout_id = request.query_params.get('fanout_id')
+        if not fanout_id or not fanout_id.isdigit():
+            return Response({
+                'error': 'fanout_id (entier) requis'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        fanout = get_object_or_404(CommandFanOut, pk=fanout_id)
+        return Response(CommandFanOutSerializer(fanout).data)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def command_metrics(self, request):
+        """
+        Latences des commandes (p50/p95/p99) par type et par étape
+        GET /api/devices/command_metrics/
+        
+        Étapes : enqueue_to_deliver, deliver_to_ack, ack_to_done, enqueue_to_done.
+        Histogrammes en mémoire, propres à chaque processus.
+        """
+        return Response({
+            'stages': metrics.COMMAND_STAGES,
+            'latencies': metrics.command_latency_summary(),
+            'timestamp': timezone.now()
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def cache_metrics(self, request):
+        """
+        Succès / échecs du cache des réponses admin, par vue
+        GET /api/devices/cache_metrics/
+        
+        Compteurs en mémoire, propres à chaque processus.
+        """
+        return Response({
+            'backend': get_cache().__class__.__name__,
+            'timeout': cache_timeout(),
+            'views': cache_summary(),
+            'timestamp': timezone.now()
+        })
+    
     # ===== 4. NOUVEAUX ENDPOINTS DE CONSULTATION DES FICHIERS =====
     
     @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    @cached_response(scope='device')
     def file_scans(self, request, pk=None):
         """
         Liste tous les scans de fichiers pour un appareil
@@ -502,13 +860,17 @@ class DeviceViewSet(viewsets.ModelViewSet):
         """
         device = self.get_object()
         
-        # Pagination
-        limit = int(request.query_params.get('limit', 20))
-        offset = int(request.query_params.get('offset', 0))
-        
-        scans = device.file_lists.all().order_by('-created_at')[offset:offset+limit]
+        # Pagination keyset sur (-created_at, -id) : ?limit=20&cursor=...
+        paginator = ScanCursorPagination()
+        # 'device' : renseigné par le related manager sur chaque scan
+        scans = FileListSerializer.sparse_queryset(
+            device.file_lists.all(), request, keep=[*paginator.ordering, 'device']
+        )
+        if FileListSerializer.wants_field(request, 'files_count'):
+            scans = FileList.with_files_count(scans)
+        scans = paginator.paginate_queryset(scans, request, self)
         
-        serializer = FileListSerializer(scans, many=True)
+        serializer = FileListSerializer(scans, many=True, context={'request': request})
         
         return Response({
             'device_id': device.id,
@@ -516,12 +878,15 @@ class DeviceViewSet(viewsets.ModelViewSet):
             'device_name': f"{device.manufacturer} {device.model}",
             'total_scans': device.file_lists.count(),
             'returned_scans': len(scans),
-            'offset': offset,
-            'limit': limit,
+            'limit': paginator.page_size,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
             'scans': serializer.data
         })
     
     @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    @conditional_response(_scan_validators)
+    @cached_response(scope='device')
     def file_scan_detail(self, request, pk=None):
         """
         Détail d'un scan spécifique
@@ -536,17 +901,80 @@ class DeviceViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            file_list = device.file_lists.get(scan_id=scan_id)
+            file_list = device.file_lists.select_related('device', 'stats').get(scan_id=scan_id)
+        except FileList.DoesNotExist:
+            return Response({
+                'error': 'Scan non trouvé'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = FileListDetailSerializer(file_list, context={'request': request})
+        
+        data = serializer.data
+        data['items_url'] = replace_query_param(
+            self.reverse_action(self.file_scan_items.url_name, args=[device.pk]), 'scan_id', scan_id
+        )
+        return Response(data)
+    
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    @conditional_response(_scan_validators)
+    def file_scan_items(self, request, pk=None):
+        """
+        Fichiers d'un scan, page par page (du plus gros au plus petit)
+        GET /api/devices/{id}/file_scan_items/?scan_id=XXX&file_type=image&limit=100&cursor=...
+        """
+        device = self.get_object()
+        serializer = FileScanItemsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        try:
+            file_list = device.file_lists.get(scan_id=params['scan_id'])
         except FileList.DoesNotExist:
             return Response({
                 'error': 'Scan non trouvé'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = FileListDetailSerializer(file_list)
+        files = file_list.files.all()
+        
+        if params['file_type'] != 'all':
+            files = files.filter(file_type=params['file_type'])
+        
+        if params.get('extension'):
+            files = files.filter(extension__iexact=params['extension'])
         
-        return Response(serializer.data)
+        if params.get('parent_path'):
+            files = files.filter(parent_path=params['parent_path'])
+        
+        if params.get('query'):
+            files = files.filter(name__icontains=params['query'])
+        
+        if params.get('min_size'):
+            files = files.filter(size_bytes__gte=params['min_size'])
+        
+        if params.get('max_size'):
+            files = files.filter(size_bytes__lte=params['max_size'])
+        
+        if params['hidden_only']:
+            files = files.filter(is_hidden=True)
+        
+        if not params['include_directories']:
+            files = files.filter(is_directory=False)
+        
+        paginator = FileSizeCursorPagination()
+        files = FileItemSerializer.sparse_queryset(files, request, keep=[*paginator.ordering, 'file_list'])
+        page = paginator.paginate_queryset(files, request, self)
+        
+        return Response({
+            'scan_id': file_list.scan_id,
+            'total_files': file_list.total_files,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'files': FileItemSerializer(page, many=True, context={'request': request}).data
+        })
     
     @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    @conditional_response(_file_stats_validators)
+    @cached_response(scope='device')
     def file_stats(self, request, pk=None):
         """
         Statistiques détaillées des fichiers pour un appareil (dernier scan)
@@ -565,33 +993,14 @@ class DeviceViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_404_NOT_FOUND)
         else:
             # Dernier scan complété
-            file_list = device.file_lists.filter(status='completed').first()
+            file_list = device.latest_completed_scan
             if not file_list:
                 return Response({
                     'error': 'Aucun scan disponible pour cet appareil'
                 }, status=status.HTTP_404_NOT_FOUND)
         
-        # Stats par type
-        type_stats = file_list.files.values('file_type').annotate(
-            count=Count('id'),
-            total_size=Sum('size_bytes')
-        ).order_by('file_type')
-        
-        # Top 20 plus gros fichiers
-        largest_files = file_list.files.order_by('-size_bytes')[:20].values(
-            'id', 'name', 'path', 'size_bytes', 'file_type', 'extension'
-        )
-        
-        # Stats par extension
-        extension_stats = file_list.files.values('extension').annotate(
-            count=Count('id')
-        ).order_by('-count')[:30]
-        
-        # Stats par dossier (premier niveau)
-        folder_stats = file_list.files.values('parent_path').annotate(
-            count=Count('id'),
-            total_size=Sum('size_bytes')
-        ).order_by('-total_size')[:20]
+        # Statistiques pré-calculées à l'upload (recalculées si absentes ou périmées)
+        stats = FileScanStats.for_file_list(file_list)
         
         return Response({
             'device_id': device.id,
@@ -611,11 +1020,11 @@ class DeviceViewSet(viewsets.ModelViewSet):
                     'file_type': item['file_type'],
                     'count': item['count'],
                     'total_size_bytes': item['total_size'],
-                    'total_size_mb': round(item['total_size'] / (1024 * 1024), 2) if item['total_size'] else 0,
-                    'total_size_gb': round(item['total_size'] / (1024 ** 3), 2) if item['total_size'] else 0,
+                    'total_size_mb': round(item['total_size'] / (1024 * 1024), 2),
+                    'total_size_gb': round(item['total_size'] / (1024 ** 3), 2),
                     'percentage': round(item['count'] / file_list.total_files * 100, 2) if file_list.total_files else 0
                 }
-                for item in type_stats
+                for item in stats.type_histogram
             ],
             'largest_files': [
                 {
@@ -623,25 +1032,320 @@ class DeviceViewSet(viewsets.ModelViewSet):
                     'size_mb': round(file['size_bytes'] / (1024 * 1024), 2),
                     'size_gb': round(file['size_bytes'] / (1024 ** 3), 2)
                 }
-                for file in largest_files
+                for file in stats.largest_files
             ],
-            'top_extensions': [
+            'top_extensions': stats.extension_histogram,
+            'top_folders': [
                 {
-                    'extension': item['extension'] or 'sans extension',
-                    'count': item['count']
+                    'path': item['path'],
+                    'count': item['count'],
+                    'total_size_mb': round(item['total_size'] / (1024 * 1024), 2)
                 }
-                for item in extension_stats if item['extension']
+                for item in stats.folder_histogram
             ],
-            'top_folders': [
+            'hidden_files_count': stats.hidden_files_count,
+            'directories_count': stats.directories_count,
+        })
+    
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def directory_tree(self, request, pk=None):
+        """
+        Tailles récursives des sous-dossiers d'un chemin (du plus lourd au plus léger)
+        GET /api/devices/{id}/directory_tree/?path=/storage/emulated/0&scan_id=XXX
+        """
+        device = self.get_object()
+        serializer = DirectoryTreeSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        if params.get('scan_id'):
+            file_list = device.file_lists.filter(scan_id=params['scan_id']).first()
+        else:
+            file_list = device.latest_completed_scan
+        
+        if not file_list:
+            return Response({
+                'error': 'Scan non trouvé'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # Scans antérieurs à l'arbre : construction à la première consultation
+        if not file_list.directories.exists():
+            DirectorySize.build_for_file_list(file_list)
+        
+        path = DirectorySize.normalize(params['path'])
+        directory = file_list.directories.filter(path=path).first()
+        if not directory:
+            return Response({
+                'error': 'Dossier non trouvé dans ce scan'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        children = file_list.directories.filter(parent=path).order_by('-total_size')[:params['limit']]
+        
+        def size_share(size):
+            return round(size / directory.total_size * 100, 2) if directory.total_size else 0
+        
+        data = {
+            'scan_id': file_list.scan_id,
+            'path': directory.path,
+            'parent': directory.parent or None,
+            'files_count': directory.files_count,
+            'total_size_bytes': directory.total_size,
+            'total_size_mb': round(directory.total_size / (1024 * 1024), 2),
+            'direct_files_count': directory.direct_files_count,
+            'direct_size_bytes': directory.direct_size,
+            'children': [
                 {
-                    'path': item['parent_path'] or '/',
-                    'count': item['count'],
-                    'total_size_mb': round(item['total_size'] / (1024 * 1024), 2) if item['total_size'] else 0
+                    'path': child.path,
+                    'name': child.name,
+                    'files_count': child.files_count,
+                    'total_size_bytes': child.total_size,
+                    'total_size_mb': round(child.total_size / (1024 * 1024), 2),
+                    'percentage': size_share(child.total_size),
                 }
-                for item in folder_stats if item['parent_path']
+                for child in children
+            ],
+        }
+        
+        if params['include_files']:
+            parent_paths = [path, path.rstrip('/') + '/']
+            files = file_list.files.filter(
+                parent_path__in=parent_paths, is_directory=False
+            ).order_by('-size_bytes').values('id', 'name', 'path', 'size_bytes', 'file_type')[:params['limit']]
+            data['files'] = [
+                {**file, 'percentage': size_share(file['size_bytes'])}
+                for file in files
+            ]
+        
+        return Response(data)
+    
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def scan_diff(self, request, pk=None):
+        """
+        Changements entre deux scans de l'appareil (ajouts, suppressions, modifications, déplacements)
+        GET /api/devices/{id}/scan_diff/?from=SCAN_A&to=SCAN_B&output=json|ndjson
+        
+        Par défaut : `to` = dernier scan complété, `from` = scan complété précédent.
+        """
+        device = self.get_object()
+        serializer = ScanDiffSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        completed_scans = device.file_lists.filter(status='completed')
+        
+        if request.query_params.get('to'):
+            to_scan = device.file_lists.filter(scan_id=request.query_params['to']).first()
+        else:
+            to_scan = device.latest_completed_scan
+        
+        if request.query_params.get('from'):
+            from_scan = device.file_lists.filter(scan_id=request.query_params['from']).first()
+        elif to_scan:
+            from_scan = completed_scans.filter(created_at__lt=to_scan.created_at).order_by('-created_at').first()
+        else:
+            from_scan = None
+        
+        if not from_scan or not to_scan:
+            return Response({
+                'error': 'Deux scans de cet appareil sont nécessaires (from / to)'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        diff = ScanDiff(iter_scan_rows(from_scan), iter_scan_rows(to_scan))
+        header = {
+            'device_id': device.id,
+            'from': {'scan_id': from_scan.scan_id, 'date': from_scan.scan_completed_at},
+            'to': {'scan_id': to_scan.scan_id, 'date': to_scan.scan_completed_at},
+        }
+        
+        if params['output'] == 'ndjson':
+            # Un changement par ligne, puis une ligne finale de résumé
+            def lines():
+                encoder = json_encoder()
+                yield encoder.encode(header) + '\n'
+                for change in diff:
+                    yield encoder.encode(change) + '\n'
+                yield encoder.encode({'summary': diff.summary}) + '\n'
+            
+            response = StreamingHttpResponse(iter_bytes(lines()), content_type=CONTENT_TYPES['ndjson'])
+            response['Content-Disposition'] = f'attachment; filename="diff_{from_scan.scan_id}_{to_scan.scan_id}.ndjson"'
+            return response
+        
+        changes = []
+        for change in diff:
+            if len(changes) < params['limit']:
+                changes.append(change)
+        
+        summary = diff.summary
+        total_changes = summary['added'] + summary['removed'] + summary['modified'] + summary['moved']
+        return Response({
+            **header,
+            'summary': summary,
+            'changes': changes,
+            'truncated': total_changes > len(changes),
+            'stream_url': replace_query_param(request.build_absolute_uri(), 'output', 'ndjson'),
+        })
+    
+    @staticmethod
+    def _filter_duplicate_match(groups, match):
+        if match == 'confirmed':
+            return groups.exclude(match='size')
+        if match != 'all':
+            return groups.filter(match=match)
+        return groups
+    
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def duplicates(self, request, pk=None):
+        """
+        Groupes de doublons d'un scan, du plus coûteux au moins coûteux
+        GET /api/devices/{id}/duplicates/?scan_id=XXX&match=all|confirmed|md5|sha1|size
+        """
+        device = self.get_object()
+        serializer = DuplicatesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        if params.get('scan_id'):
+            file_list = device.file_lists.filter(scan_id=params['scan_id']).first()
+        else:
+            file_list = device.latest_completed_scan
+        
+        if not file_list:
+            return Response({
+                'error': 'Scan non trouvé'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        groups = self._filter_duplicate_match(file_list.duplicate_groups.all(), params['match'])
+        by_match = {
+            item['match']: {
+                'match': item['match'],
+                'groups': item['groups'],
+                'copies': item['total_copies'],
+                'reclaimable_bytes': item['total_bytes'],
+            }
+            for item in groups.values('match').annotate(
+                groups=Count('id'),
+                total_copies=Sum('copies'),
+                total_bytes=Sum('reclaimable_bytes'),
+            ).order_by('match')
+        }
+        confirmed_bytes = sum(item['reclaimable_bytes'] for match, item in by_match.items() if match != 'size')
+        candidate_bytes = by_match.get('size', {}).get('reclaimable_bytes', 0)
+        
+        return Response({
+            'device_id': device.id,
+            'scan_id': file_list.scan_id,
+            'summary': {
+                'groups': sum(item['groups'] for item in by_match.values()),
+                'reclaimable_bytes': confirmed_bytes,
+                'reclaimable_mb': round(confirmed_bytes / (1024 * 1024), 2),
+                'candidate_reclaimable_bytes': candidate_bytes,
+                'by_match': list(by_match.values()),
+            },
+            'groups': DuplicateGroupSerializer(
+                groups.order_by('-reclaimable_bytes')[:params['limit']], many=True
+            ).data,
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def duplicates_report(self, request):
+        """
+        Appareils classés par espace récupérable (dernier scan complété de chacun)
+        GET /api/devices/duplicates_report/?match=all|confirmed&limit=100
+        
+        Lit les groupes pré-calculés à l'upload : un GROUP BY par appareil,
+        sans relire les fichiers.
+        """
+        serializer = DuplicatesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        groups = self._filter_duplicate_match(DuplicateGroup.latest_scans(), params['match'])
+        ranking = groups.values(
+            'file_list__device', 'file_list__device__android_id',
+            'file_list__device__manufacturer', 'file_list__device__model', 'file_list__scan_id'
+        ).annotate(
+            groups=Count('id'),
+            total_bytes=Sum('reclaimable_bytes'),
+            confirmed_bytes=Sum('reclaimable_bytes', filter=~Q(match='size')),
+        ).order_by('-total_bytes', 'file_list__device')[:params['limit']]
+        
+        totals = groups.aggregate(
+            devices=Count('file_list', distinct=True),
+            groups=Count('id'),
+            total_bytes=Sum('reclaimable_bytes'),
+        )
+        
+        return Response({
+            'match': params['match'],
+            'devices_with_duplicates': totals['devices'],
+            'groups': totals['groups'],
+            'reclaimable_bytes': totals['total_bytes'] or 0,
+            'reclaimable_gb': round((totals['total_bytes'] or 0) / (1024 ** 3), 2),
+            'devices': [
+                {
+                    'device_id': row['file_list__device'],
+                    'android_id': row['file_list__device__android_id'],
+                    'manufacturer': row['file_list__device__manufacturer'],
+                    'model': row['file_list__device__model'],
+                    'scan_id': row['file_list__scan_id'],
+                    'groups': row['groups'],
+                    'reclaimable_bytes': row['total_bytes'],
+                    'reclaimable_mb': round(row['total_bytes'] / (1024 * 1024), 2),
+                    'confirmed_bytes': row['confirmed_bytes'] or 0,
+                    'candidate_bytes': row['total_bytes'] - (row['confirmed_bytes'] or 0),
+                }
+                for row in ranking
+            ],
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def fleet_duplicates(self, request):
+        """
+        Contenus en double (même empreinte) sur plusieurs appareils
+        GET /api/devices/fleet_duplicates/?hash=md5|sha1&min_devices=2&limit=100
+        
+        Agrège les groupes pré-calculés à l'upload (DuplicateGroup) des
+        derniers scans : un contenu figure ici s'il est en double sur au moins
+        `min_devices` appareils, avec l'espace récupérable cumulé sur la
+        flotte. La table des fichiers n'est pas relue.
+        """
+        serializer = DuplicatesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        groups = DuplicateGroup.latest_scans().filter(match=params['hash'])
+        rows = list(groups.values('content_key').annotate(
+            devices=Count('file_list', distinct=True),
+            total_copies=Sum('copies'),
+            copy_size=Max('size_bytes'),
+            reclaimable=Sum('reclaimable_bytes'),
+        ).filter(devices__gte=params['min_devices']).order_by('-reclaimable', 'content_key')[:params['limit']])
+        
+        # Un nom d'exemple par contenu : chemins échantillonnés des groupes de la page
+        names = {}
+        for content_key, paths in groups.filter(
+            content_key__in=[row['content_key'] for row in rows]
+        ).values_list('content_key', 'paths'):
+            if paths and content_key not in names:
+                names[content_key] = min(paths).rsplit('/', 1)[-1]
+        
+        return Response({
+            'hash': params['hash'],
+            'min_devices': params['min_devices'],
+            'results': [
+                {
+                    'content_key': row['content_key'],
+                    'name': names.get(row['content_key'], ''),
+                    'size_bytes': row['copy_size'],
+                    'devices': row['devices'],
+                    'copies': row['total_copies'],
+                    'total_size_bytes': row['copy_size'] * row['total_copies'],
+                    'total_size_mb': round(row['copy_size'] * row['total_copies'] / (1024 * 1024), 2),
+                    'reclaimable_bytes': row['reclaimable'],
+                    'reclaimable_mb': round(row['reclaimable'] / (1024 * 1024), 2),
+                }
+                for row in rows
             ],
-            'hidden_files_count': file_list.files.filter(is_hidden=True).count(),
-            'directories_count': file_list.files.filter(is_directory=True).count(),
         })
     
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
@@ -661,17 +1365,41 @@ class DeviceViewSet(viewsets.ModelViewSet):
         extension = params.get('extension')
         device_id = params.get('device_id')
         hidden_only = params.get('hidden_only', False)
-        limit = params.get('limit', 100)
         
-        # Commencer par les scans les plus récents uniquement
-        latest_scans = FileList.objects.filter(status='completed').order_by('-created_at')
+        # État courant de chaque appareil : son dernier scan complété
+        current_scans = Device.objects.filter(latest_completed_scan__isnull=False)
         
         if device_id:
-            latest_scans = latest_scans.filter(device_id=device_id)
-        
-        latest_scans_ids = [scan.id for scan in latest_scans[:50]]  # 50 scans récents
+            current_scans = current_scans.filter(pk=device_id)
+        
+        latest_scans_ids = current_scans.values('latest_completed_scan')
+        
+        paginator = FileSizeCursorPagination()
+        
+        # Sous-chaîne sans index en base (SQLite) sur un seul appareil : index
+        # trigramme en mémoire de son scan. Sur toute la flotte, un index par
+        # appareil dépasserait le cache LRU : recherche en base
+        if device_id and len(query) >= NGRAM_SIZE and not use_database_index():
+            def fetch(position, reverse, limit):
+                file_ids = search_file_ids(
+                    FileList.objects.filter(pk__in=latest_scans_ids), query, limit,
+                    position=position,
+                    reverse=reverse,
+                    file_type=file_type if file_type != 'all' else None,
+                    extension=extension,
+                    min_size=min_size,
+                    max_size=max_size,
+                    hidden_only=hidden_only,
+                )
+                files = FileItem.objects.filter(id__in=file_ids).select_related('file_list__device')
+                return sorted(files, key=lambda f: (f.size_bytes, f.id), reverse=not reverse)
+            
+            files = paginator.paginate_fetch(fetch, request, FileItem)
+            return self._search_files_response(query, params, files, paginator)
         
         # Construire la requête
+        # (PostgreSQL : les index GIN pg_trgm servent le LIKE '%x%' ;
+        #  requêtes de moins de 3 caractères : simple icontains)
         files = FileItem.objects.filter(file_list_id__in=latest_scans_ids)
         
         if query:
@@ -698,9 +1426,15 @@ class DeviceViewSet(viewsets.ModelViewSet):
         # Exclure les dossiers par défaut
         files = files.filter(is_directory=False)
         
-        # Limiter et optimiser
-        files = files.select_related('file_list__device').order_by('-size_bytes')[:limit]
+        # Page keyset sur (-size_bytes, -id)
+        files = paginator.paginate_queryset(files.select_related('file_list__device'), request, self)
         
+        return self._search_files_response(query, params, files, paginator)
+    
+    def _search_files_response(self, query, params, files, paginator):
+        """
+        Sérialise les résultats de search_files
+        """
         results = []
         for file in files:
             results.append({
@@ -735,11 +1469,91 @@ class DeviceViewSet(viewsets.ModelViewSet):
             'query': query,
             'filters': params,
             'total_results': len(results),
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
             'results': results
         })
     
     # ===== 5. ACTIONS ADMIN CLASSIQUES (GESTION DES APPAREILS) =====
     
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def trends(self, request):
+        """
+        Séries journalières d'une métrique, par valeur de dimension
+        GET /api/devices/trends/?metric=devices_seen&dimension=manufacturer&days=90&top=10
+        
+        Lit uniquement DailyRollup (une requête indexée sur metric, dimension, date).
+        Les jours sans agrégat calculé valent null.
+        """
+        serializer = TrendsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        metric, dimension = params['metric'], params['dimension']
+        
+        end = timezone.localdate()
+        start = end - timedelta(days=params['days'] - 1)
+        dates = [start + timedelta(days=offset) for offset in range(params['days'])]
+        positions = {day: index for index, day in enumerate(dates)}
+        
+        rows = DailyRollup.objects.filter(
+            metric=metric, dimension__in=['all', dimension], date__gte=start, date__lte=end
+        ).values_list('dimension', 'date', 'value', 'count', 'size')
+        
+        computed = set()
+        series = {}
+        for row_dimension, day, value, count, size in rows:
+            if row_dimension == 'all':
+                computed.add(day)
+            if row_dimension != dimension:
+                continue
+            points = series.setdefault(value, [[0] * len(dates), [0] * len(dates)])
+            points[0][positions[day]] = count
+            points[1][positions[day]] = size
+        
+        ranked = sorted(series.items(), key=lambda item: (-sum(item[1][0]), item[0]))
+        top, rest = ranked[:params['top']], ranked[params['top']:]
+        
+        def present(values):
+            return [value if day in computed else None for day, value in zip(dates, values)]
+        
+        def serie(value, counts, sizes):
+            data = {'value': value, 'total': sum(counts), 'counts': present(counts)}
+            if metric == 'files_scanned':
+                data['sizes'] = present(sizes)
+            return data
+        
+        response = {
+            'metric': metric,
+            'dimension': dimension,
+            'start': start,
+            'end': end,
+            'dates': dates,
+            'series': [serie(value, counts, sizes) for value, (counts, sizes) in top],
+        }
+        if rest:
+            response['others'] = serie(
+                None,
+                [sum(values) for values in zip(*(counts for _, (counts, _) in rest))],
+                [sum(values) for values in zip(*(sizes for _, (_, sizes) in rest))],
+            )
+        return Response(response)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def rollup(self, request):
+        """
+        Calcul à la demande des agrégats journaliers (même traitement que rollup_daily)
+        POST /api/devices/rollup/ {"date": "2026-01-31", "backfill": 0}
+        """
+        serializer = RollupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        day = serializer.validated_data.get('date') or timezone.localdate()
+        
+        days = [day - timedelta(days=offset) for offset in range(serializer.validated_data['backfill'], -1, -1)]
+        return Response({
+            'status': 'ok',
+            'rows': {str(current): DailyRollup.build_for_day(current) for current in days},
+        })
+    
     @action(detail=False, methods=['get'])
     def active(self, request):
         """
@@ -747,83 +1561,108 @@ class DeviceViewSet(viewsets.ModelViewSet):
         GET /api/devices/active/
         """
         active_devices = Device.objects.filter(is_active=True)
-        serializer = DeviceListSerializer(active_devices, many=True)
+        page = self.paginate_queryset(DeviceListSerializer.sparse_queryset(
+            active_devices, request, keep=DeviceCursorPagination.ordering
+        ))
+        serializer = DeviceListSerializer(page, many=True, context={'request': request})
         return Response({
             'count': active_devices.count(),
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
             'devices': serializer.data
         })
     
     @action(detail=False, methods=['get'])
+    @cached_response(scope='fleet')
     def stats(self, request):
         """
         Statistiques générales incluant les fichiers
         GET /api/devices/stats/
+        
+        Lecture des compteurs de flotte (FleetCounter) : quatre requêtes
+        indexées quelle que soit la taille des tables.
         """
-        # Stats de base
-        total = Device.objects.count()
-        active = Device.objects.filter(is_active=True).count()
-        inactive = total - active
+        today = timezone.localdate()
+        week_days = [(today - timedelta(days=offset)).isoformat() for offset in range(7)]
+        
+        counters = {
+            (scope, key): (count, size)
+            for scope, key, count, size in FleetCounter.objects.filter(
+                Q(scope__in=['devices', 'scans', 'files', 'file_type']) |
+                Q(scope='seen_day', key__in=week_days)
+            ).values_list('scope', 'key', 'count', 'size')
+        }
         
-        # Stats des fichiers
-        total_scans = FileList.objects.count()
-        completed_scans = FileList.objects.filter(status='completed').count()
+        def count(scope, key):
+            return counters.get((scope, key), (0, 0))[0]
         
-        total_files_stored = FileItem.objects.filter(is_directory=False).count()
-        total_size_stored = FileItem.objects.filter(is_directory=False).aggregate(
-            total=Sum('size_bytes')
-        )['total'] or 0
+        total = count('devices', 'total')
+        active = count('devices', 'active')
+        total_files_stored, total_size_stored = counters.get(('files', 'total'), (0, 0))
         
         # Stats par type de fichier
-        files_by_type = FileItem.objects.filter(is_directory=False).values('file_type').annotate(
-            count=Count('id'),
-            total_size=Sum('size_bytes')
-        ).order_by('-count')
+        files_by_type = sorted(
+            (
+                (key, type_count, size)
+                for (scope, key), (type_count, size) in counters.items()
+                if scope == 'file_type' and type_count > 0
+            ),
+            key=lambda item: (-item[1], item[0])
+        )
         
         # Top fabricants
-        top_manufacturers = Device.objects.values('manufacturer')\
-            .exclude(manufacturer='')\
-            .annotate(count=Count('manufacturer'))\
-            .order_by('-count')[:5]
+        top_manufacturers = FleetCounter.objects.filter(
+            scope='manufacturer', count__gt=0
+        ).order_by('-count', 'key')[:5].values_list('key', 'count')
         
         # Appareils avec le plus de fichiers
-        top_devices_files = Device.objects.annotate(
-            file_count=Count('file_lists__files', filter=Q(file_lists__files__is_directory=False))
-        ).order_by('-file_count')[:5]
+        top_files = list(FleetCounter.objects.filter(
+            scope='device_files', count__gt=0
+        ).order_by('-count', 'key')[:5].values_list('key', 'count'))
+        devices = Device.objects.only('manufacturer', 'model', 'android_id').in_bulk(
+            [int(key) for key, _ in top_files]
+        )
         
         return Response({
             'devices': {
                 'total': total,
                 'active': active,
-                'inactive': inactive,
-                'seen_today': Device.objects.filter(last_seen__date=timezone.now().date()).count(),
-                'seen_week': Device.objects.filter(last_seen__gte=timezone.now() - timedelta(days=7)).count(),
-                'rooted': Device.objects.filter(is_rooted_score__gt=0.5).count(),
-                'emulators': Device.objects.filter(is_emulator=True).count(),
+                'inactive': total - active,
+                'seen_today': count('seen_day', today.isoformat()),
+                'seen_week': sum(count('seen_day', day) for day in week_days),
+                'rooted': count('devices', 'rooted'),
+                'emulators': count('devices', 'emulators'),
             },
             'files': {
-                'total_scans': total_scans,
-                'completed_scans': completed_scans,
+                'total_scans': count('scans', 'total'),
+                'completed_scans': count('scans', 'completed'),
                 'total_files': total_files_stored,
                 'total_size_bytes': total_size_stored,
                 'total_size_gb': round(total_size_stored / (1024 ** 3), 2),
                 'files_by_type': [
                     {
-                        'type': item['file_type'],
-                        'count': item['count'],
-                        'size_gb': round(item['total_size'] / (1024 ** 3), 2) if item['total_size'] else 0
+                        'type': file_type,
+                        'count': type_count,
+                        'size_gb': round(size / (1024 ** 3), 2) if size else 0
                     }
-                    for item in files_by_type
+                    for file_type, type_count, size in files_by_type
                 ],
             },
-            'top_manufacturers': list(top_manufacturers),
+            'top_manufacturers': [
+                {'manufacturer': manufacturer, 'count': manufacturer_count}
+                for manufacturer, manufacturer_count in top_manufacturers
+            ],
             'top_devices_by_files': [
                 {
                     'id': d.id,
                     'name': f"{d.manufacturer} {d.model}",
                     'android_id': d.android_id[:10] + '...',
-                    'file_count': d.file_count
+                    'file_count': file_count
                 }
-                for d in top_devices_files
+                for d, file_count in (
+                    (devices.get(int(key)), file_count) for key, file_count in top_files
+                )
+                if d is not None
             ],
             'timestamp': timezone.now()
         })
@@ -854,6 +1693,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
         })
     
     @action(detail=True, methods=['get'])
+    @cached_response(scope='device')
     def info_complete(self, request, pk=None):
         """Récupère toutes les informations d'un appareil"""
         device = self.get_object()
@@ -871,6 +1711,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
         return Response(data)
     
     @action(detail=False, methods=['get'])
+    @cached_response(scope='fleet')
     def search(self, request):
         """Recherche avancée d'appareils"""
         query = request.query_params.get('q', '')
@@ -885,9 +1726,13 @@ class DeviceViewSet(viewsets.ModelViewSet):
             Q(manufacturer__icontains=query) |
             Q(brand__icontains=query) |
             Q(device_code__icontains=query)
-        )[:20]
+        ).select_related('latest_completed_scan')
+        if (DeviceWithFilesSerializer.wants_field(request, 'scans_count')
+                or DeviceWithFilesSerializer.wants_field(request, 'total_files_scanned')):
+            devices = Device.with_scan_totals(devices)
+        devices = DeviceWithFilesSerializer.sparse_queryset(devices, request)[:20]
         
-        serializer = DeviceWithFilesSerializer(devices, many=True)
+        serializer = DeviceWithFilesSerializer(devices, many=True, context={'request': request})
         return Response({
             'query': query,
             'count': devices.count(),
@@ -895,6 +1740,74 @@ class DeviceViewSet(viewsets.ModelViewSet):
         })
 
 
+# ===== EXPORTS EN FLUX =====
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_devices_csv(request):
+    """
+    Export de tous les appareils en CSV ou NDJSON (flux)
+    GET /api/export/devices/?output=csv|ndjson&gzip=true&is_active=true
+    """
+    serializer = ExportSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    
+    devices = Device.objects.order_by('id')
+    
+    if params.get('device_id'):
+        devices = devices.filter(pk=params['device_id'])
+    
+    if params.get('android_id'):
+        devices = devices.filter(android_id=params['android_id'])
+    
+    if params['is_active'] is not None:
+        devices = devices.filter(is_active=params['is_active'])
+    
+    return streaming_export_response(
+        devices, DEVICE_EXPORT_FIELDS, 'devices',
+        export_format=params['output'], compress=params['gzip']
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_files_csv(request):
+    """
+    Export des fichiers en CSV ou NDJSON (flux)
+    GET /api/export/files/?output=csv|ndjson&gzip=true&device_id=X&scan_id=Y&file_type=image
+    
+    Sans scan_id ni all_scans : dernier scan complété de chaque appareil.
+    """
+    serializer = ExportSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    
+    scans = FileList.objects.all()
+    
+    if params.get('device_id'):
+        scans = scans.filter(device_id=params['device_id'])
+    
+    if params.get('android_id'):
+        scans = scans.filter(device__android_id=params['android_id'])
+    
+    if params.get('scan_id'):
+        scans = scans.filter(scan_id=params['scan_id'])
+    elif not params['all_scans']:
+        scans = scans.filter(pk__in=Device.objects.values('latest_completed_scan'))
+    
+    # Ordre de la clé primaire : pas de tri, lecture le long de l'index
+    files = FileItem.objects.filter(file_list__in=scans).order_by('id')
+    
+    if params['file_type'] != 'all':
+        files = files.filter(file_type=params['file_type'])
+    
+    return streaming_export_response(
+        files, FILE_EXPORT_FIELDS, 'files',
+        export_format=params['output'], compress=params['gzip']
+    )
+
+
 # Vue pour la racine de l'API
 class APIRootView(generics.GenericAPIView):
     """
@@ -912,22 +1825,41 @@ class APIRootView(generics.GenericAPIView):
                 'register': 'POST /api/devices/register/ - Enregistrer un appareil',
                 'heartbeat': 'POST /api/devices/heartbeat/ - Mettre à jour l\'état',
                 'upload_file_list': 'POST /api/devices/upload_file_list/ - Upload liste fichiers',
+                'fetch_commands': 'POST /api/devices/fetch_commands/ - Récupérer les commandes en attente',
+                'command_ack': 'POST /api/devices/command_ack/ - Accuser réception / résultat d\'une commande',
             },
             
             'server_to_device_endpoints': {
                 'send_command': 'POST /api/devices/{id}/send_command/ - Envoyer commande',
                 'request_file_list': 'POST /api/devices/{id}/request_file_list/ - Demander fichiers',
                 'pending_commands': 'GET /api/devices/{id}/pending_commands/ - Commandes en attente',
+                'fan_out': 'POST /api/devices/fan_out/ - Diffuser une commande à une flotte filtrée',
+                'fan_out_status': 'GET /api/devices/fan_out_status/?fanout_id=XXX - Progression diffusion',
+                'command_metrics': 'GET /api/devices/command_metrics/ - Latences des commandes',
+                'cache_metrics': 'GET /api/devices/cache_metrics/ - Succès / échecs du cache des réponses',
                 'regenerate_key': 'POST /api/devices/{id}/regenerate_server_key/ - Régénérer clé',
             },
             
             'file_management_endpoints': {
                 'file_scans': 'GET /api/devices/{id}/file_scans/ - Liste des scans',
                 'file_scan_detail': 'GET /api/devices/{id}/file_scan_detail/?scan_id=XXX - Détail scan',
+                'file_scan_items': 'GET /api/devices/{id}/file_scan_items/?scan_id=XXX - Fichiers du scan (paginés)',
                 'file_stats': 'GET /api/devices/{id}/file_stats/ - Statistiques fichiers',
+                'directory_tree': 'GET /api/devices/{id}/directory_tree/?path=/storage/emulated/0 - Taille des dossiers',
+                'scan_diff': 'GET /api/devices/{id}/scan_diff/?from=XXX&to=YYY - Changements entre deux scans',
+                'duplicates': 'GET /api/devices/{id}/duplicates/?match=all|confirmed|md5|sha1|size - Doublons du scan',
+                'duplicates_report': 'GET /api/devices/duplicates_report/ - Appareils classés par espace récupérable',
+                'fleet_duplicates': 'GET /api/devices/fleet_duplicates/?hash=md5&min_devices=2 - Fichiers communs à plusieurs appareils',
+                'trends': 'GET /api/devices/trends/?metric=devices_seen&dimension=manufacturer&days=90 - Tendances journalières',
+                'rollup': 'POST /api/devices/rollup/ - Recalculer les agrégats journaliers',
                 'search_files': 'GET /api/devices/search_files/?q=xxx - Recherche globale',
             },
             
+            'export_endpoints': {
+                'export_devices': 'GET /api/export/devices/?output=csv|ndjson&gzip=true - Export appareils',
+                'export_files': 'GET /api/export/files/?output=csv|ndjson&gzip=true&scan_id=XXX - Export fichiers',
+            },
+            
             'admin_endpoints': {
                 'list': 'GET /api/devices/',
                 'active': 'GET /api/devices/active/',
@@ -940,6 +1872,8 @@ class APIRootView(generics.GenericAPIView):
                 'activate': 'POST /api/devices/{id}/activate/',
             },
             
+            'sparse_fieldsets': '?fields=a,b ou ?omit=c sur la liste / le détail des appareils, active, search, file_scans, file_scan_detail et file_scan_items',
+            
             'security_model': {
                 'device_to_server': 'Public - Aucune authentification requise',
                 'server_to_device': 'Authentification via server_key',
@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.compression.CompressionMiddleware',  # gzip selon Accept-Encoding
     'whitenoise.middleware.WhiteNoiseMiddleware',  # ← AJOUTÉ: pour les fichiers statiques en prod
     'corsheaders.middleware.CorsMiddleware',  # ← AJOUTÉ: à mettre en haut
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -166,6 +167,20 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Exports de scans depuis l'admin : au-delà de ce nombre de fichiers,
+# l'export part en tâche de fond (ExportJob) au lieu d'un téléchargement direct
+ADMIN_EXPORT_SYNC_MAX_FILES = 200000
+ADMIN_EXPORT_COMPRESS = True
+
+# Cache versionné des lectures admin (voir api/cache.py)
+# Sans CACHES, Django utilise locmem (un cache par processus) : en production,
+# configurer un backend partagé (Redis, Memcached, base de données...)
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
+# Compression gzip des réponses de l'API (voir api/compression.py)
+COMPRESSION_MIN_SIZE = 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -200,13 +215,24 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'api.fastjson.FastJSONRenderer',  # orjson, repli sur JSONRenderer
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'api.fastjson.FastJSONParser',  # orjson, repli sur JSONParser
     ],
 }
 
+# Limitation de débit des endpoints publics (GCRA, voir api/throttling.py)
+# "N/période" : rafale de N requêtes, puis une toutes les période/N (état partagé par le cache)
+DEVICE_RATE_LIMIT_CACHE = 'default'
+DEVICE_RATE_LIMITS = {
+    'register': {'android_id': '10/hour', 'ip': '120/hour'},
+    'heartbeat': {'android_id': '12/min', 'ip': '1200/min'},
+    'upload_file_list': {'android_id': '20/hour', 'ip': '200/hour'},
+    'fetch_commands': {'android_id': '30/min', 'ip': '1200/min'},
+    'command_ack': {'android_id': '120/min', 'ip': '6000/min'},
+}
+
 # Logging (optionnel mais utile)
 LOGGING = {
     'version': 1,